@@ -9,14 +9,36 @@ import json
 import logging
 import random
 import re
-from datetime import datetime
+import base64
+import functools
+import hashlib
+import threading
+from datetime import datetime, timedelta
 from dotenv import load_dotenv
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, send_file
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
-import google.generativeai as genai
-from sqlalchemy.dialects.sqlite import JSON as SQLITE_JSON
+from sqlalchemy import and_, literal, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import load_only
+from werkzeug.middleware.proxy_fix import ProxyFix
+
+from generation_service import GenerationService
+from image_router import ImageRouter, NoImageProviderError, StubImageProvider
+from image_store import MIMETYPES, ImageStore
+from job_queue import JobFailed, JobQueue, webhook_url_error
+from json_extract import extract_json
+from model_clients import LazyModel, ModelClientPool, StubGenerativeModel, key_fingerprint, keyed_generative_model
+from rate_limit import build_rate_limiter_from_env, retry_after_header
+from singleflight import SingleFlight
+from speculation import BranchSpeculator
+from storage import JSONList, configure_storage, install_sqlite_pragmas
+from story_cache import build_story_cache_from_env, make_cache_key, normalize_inputs
+from story_library import StoryWriter, fts_match_expression, install_story_fts, make_snippet, search_terms
+from story_pool import PLACEHOLDER_HERO, StoryPool
+from story_stream import TitleGemStreamParser, sse_event
+from story_summarizer import RollingSummarizer, clip_sentences
 
 # Load environment variables from .env file
 load_dotenv(override=True)
@@ -27,8 +49,16 @@ load_dotenv(override=True)
 app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "*"}})
 
+# Behind N reverse proxies, take the client address (used for rate limits) from X-Forwarded-For;
+# leave at 0 when clients connect directly, or they could spoof it
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", "0"))
+if TRUSTED_PROXY_HOPS:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXY_HOPS, x_proto=TRUSTED_PROXY_HOPS,
+                            x_host=TRUSTED_PROXY_HOPS)
+
 basedir = os.path.abspath(os.path.dirname(__file__))
-app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{os.path.join(basedir, 'characters.db')}"
+# DATABASE_URL overrides the local file; STORAGE_PROFILE picks pool/pragma tuning
+configure_storage(app, f"sqlite:///{os.path.join(basedir, 'characters.db')}")
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 app.config["JSON_SORT_KEYS"] = False
 
@@ -43,6 +73,16 @@ logger = logging.getLogger("story_engine")
 # ----------------------
 # Database model
 # ----------------------
+CHARACTER_LIST_FIELDS = (
+    "personality_traits", "siblings", "friends", "likes", "dislikes", "fears", "strengths", "goals",
+)
+CHARACTER_FIELDS = (
+    "id", "name", "age", "gender", "role", "magic_type", "challenge",
+    "character_type", "superhero_name", "mission", "hair", "eyes", "outfit",
+    *CHARACTER_LIST_FIELDS,
+    "comfort_item", "created_at",
+)
+
 class Character(db.Model):
     """Stores character information, traits, relationships, and metadata."""
     id = db.Column(db.String(36), primary_key=True)
@@ -63,71 +103,214 @@ class Character(db.Model):
     eyes = db.Column(db.String(50))
     outfit = db.Column(db.String(200))
 
-    # SQLite JSON (persists as TEXT)
-    personality_traits = db.Column(SQLITE_JSON, default=list)
-    siblings = db.Column(SQLITE_JSON, default=list)
-    friends = db.Column(SQLITE_JSON, default=list)
-    likes = db.Column(SQLITE_JSON, default=list)
-    dislikes = db.Column(SQLITE_JSON, default=list)
-    fears = db.Column(SQLITE_JSON, default=list)
-    strengths = db.Column(SQLITE_JSON, default=list)
-    goals = db.Column(SQLITE_JSON, default=list)
+    # JSON lists (TEXT on SQLite, JSONB on PostgreSQL)
+    personality_traits = db.Column(JSONList, default=list)
+    siblings = db.Column(JSONList, default=list)
+    friends = db.Column(JSONList, default=list)
+    likes = db.Column(JSONList, default=list)
+    dislikes = db.Column(JSONList, default=list)
+    fears = db.Column(JSONList, default=list)
+    strengths = db.Column(JSONList, default=list)
+    goals = db.Column(JSONList, default=list)
 
     comfort_item = db.Column(db.String(200))
     created_at = db.Column(db.DateTime, default=datetime.now, index=True)
 
-    def to_dict(self):
-        return {
+    # GIN indexes for containment lookups (likes @> '["dragons"]'); PostgreSQL only
+    __table_args__ = tuple(
+        db.Index(f"ix_character_{column}_gin", column, postgresql_using="gin").ddl_if(dialect="postgresql")
+        for column in ("personality_traits", "likes", "fears")
+    )
+
+    def to_dict(self, fields=None):
+        """Serialize the character; ``fields`` limits output to those keys."""
+        data = {}
+        for name in fields or CHARACTER_FIELDS:
+            value = getattr(self, name)
+            if name in CHARACTER_LIST_FIELDS:
+                value = value or []
+            elif name == "created_at":
+                value = value.isoformat() if value else None
+            data[name] = value
+        return data
+
+class InteractiveSession(db.Model):
+    """Server-side state of one choose-your-own-adventure story."""
+    id = db.Column(db.String(36), primary_key=True)
+    character = db.Column(db.Text, nullable=False)
+    theme = db.Column(db.String(100))
+    companion = db.Column(db.String(100))
+    friends = db.Column(JSONList, default=list)
+    therapeutic_prompt = db.Column(db.Text)
+    choices_made = db.Column(db.Integer, default=0, nullable=False)
+    is_complete = db.Column(db.Boolean, default=False, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.now)
+    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now, index=True)
+
+class InteractiveSegment(db.Model):
+    """One generated segment of an interactive session and the option picked after it."""
+    id = db.Column(db.Integer, primary_key=True)
+    session_id = db.Column(db.String(36), db.ForeignKey("interactive_session.id", ondelete="CASCADE"), nullable=False)
+    position = db.Column(db.Integer, nullable=False)
+    text = db.Column(db.Text, nullable=False)
+    choices = db.Column(db.JSON)
+    chosen_id = db.Column(db.String(50))
+    chosen_text = db.Column(db.Text)
+
+    __table_args__ = (db.UniqueConstraint("session_id", "position"),)
+
+class StorySummary(db.Model):
+    """Rolling summary of a series (key "series:...") or session ("session:...") through chapter/segment ``through``."""
+    id = db.Column(db.Integer, primary_key=True)
+    key = db.Column(db.String(80), nullable=False)
+    through = db.Column(db.Integer, nullable=False)
+    summary = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.now)
+
+    __table_args__ = (db.UniqueConstraint("key", "through"),)
+
+class CharacterAvatar(db.Model):
+    """Last generated avatar of a character, valid while its appearance fingerprint matches."""
+    character_id = db.Column(db.String(36), db.ForeignKey("character.id", ondelete="CASCADE"), primary_key=True)
+    fingerprint = db.Column(db.String(64), nullable=False)
+    style = db.Column(db.String(200))
+    result = db.Column(db.JSON, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.now)
+
+class Story(db.Model):
+    """A generated story, saved in the background for the library and search."""
+    id = db.Column(db.Integer, primary_key=True)
+    character_id = db.Column(db.String(36), db.ForeignKey("character.id", ondelete="SET NULL"), index=True)
+    character_name = db.Column(db.String(100))
+    theme = db.Column(db.String(100))
+    source = db.Column(db.String(50), nullable=False)  # route that generated it
+    title = db.Column(db.String(300))
+    story_text = db.Column(db.Text, nullable=False)
+    wisdom_gem = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.now, index=True)
+
+    def to_dict(self, full: bool = True):
+        data = {
             "id": self.id,
-            "name": self.name,
-            "age": self.age,
-            "gender": self.gender,
-            "role": self.role,
-            "magic_type": self.magic_type,
-            "challenge": self.challenge,
-            "character_type": self.character_type,
-            "superhero_name": self.superhero_name,
-            "mission": self.mission,
-            "hair": self.hair,
-            "eyes": self.eyes,
-            "outfit": self.outfit,
-            "personality_traits": self.personality_traits or [],
-            "siblings": self.siblings or [],
-            "friends": self.friends or [],
-            "likes": self.likes or [],
-            "dislikes": self.dislikes or [],
-            "fears": self.fears or [],
-            "strengths": self.strengths or [],
-            "goals": self.goals or [],
-            "comfort_item": self.comfort_item,
+            "character_id": self.character_id,
+            "character_name": self.character_name,
+            "theme": self.theme,
+            "source": self.source,
+            "title": self.title,
+            "wisdom_gem": self.wisdom_gem,
             "created_at": self.created_at.isoformat() if self.created_at else None,
         }
-
-with app.app_context():
-    db.create_all()
+        if full:
+            data["story_text"] = self.story_text
+        else:
+            # Only the head can end up in the excerpt, so don't sentence-split the whole story
+            data["excerpt"] = clip_sentences(self.story_text[: STORY_EXCERPT_CHARS * 2], STORY_EXCERPT_CHARS)
+        return data
+
+STORY_EXCERPT_CHARS = 240
+STORY_SEARCH_CANDIDATES = int(os.getenv("STORY_SEARCH_CANDIDATES", "1000"))
+
+class PooledStory(db.Model):
+    """A pre-generated story for the placeholder hero, waiting to be drawn by a generic request."""
+    id = db.Column(db.Integer, primary_key=True)
+    theme = db.Column(db.String(100), nullable=False)
+    companion = db.Column(db.String(100), nullable=False, default="")  # "" = no companion
+    title = db.Column(db.String(300))
+    story_text = db.Column(db.Text, nullable=False)
+    wisdom_gem = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.now)
+
+    __table_args__ = (db.Index("ix_pooled_story_key", "theme", "companion", "id"),)
+
+# The fields generate_character_avatar builds its prompt from; anything else never changes the picture
+AVATAR_APPEARANCE_FIELDS = ("name", "age", "gender", "character_style", "hair", "eyes", "role")
+
+def appearance_fingerprint(character_data: dict) -> str:
+    appearance = normalize_inputs({field: character_data.get(field) for field in AVATAR_APPEARANCE_FIELDS})
+    return hashlib.sha256(json.dumps(appearance, sort_keys=True).encode("utf-8")).hexdigest()
+
+def _character_fingerprint(char: Character) -> str:
+    return appearance_fingerprint({field: getattr(char, field, None) for field in AVATAR_APPEARANCE_FIELDS})
+
+# Schema setup runs once per process on first use (init_db), not at import
+story_fts_enabled = False
+_db_ready = False
+_db_lock = threading.Lock()
+
+def init_db():
+    """Install pragmas, create missing tables and the story search index (idempotent)."""
+    global story_fts_enabled, _db_ready
+    if _db_ready:
+        return
+    with _db_lock:
+        if _db_ready:
+            return
+        with app.app_context():
+            install_sqlite_pragmas(db.engine, app.config["STORAGE_PROFILE"])
+            db.create_all()
+            story_fts_enabled = install_story_fts(db.engine)
+        _db_ready = True
+
+@app.before_request
+def _ensure_db():
+    init_db()
 
 # ----------------------
 # Gemini setup
 # ----------------------
 api_key = os.getenv("GEMINI_API_KEY")
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
 
-# --- DEBUG LINES START ---
-print(f"API KEY EXISTS: {bool(api_key)}")
-print(f"API KEY LENGTH: {len(api_key) if api_key else 0}")
-print(f"MODEL: {os.getenv('GEMINI_MODEL', 'gemini-1.5-flash')}")
-# --- DEBUG LINES END ---
-
-if not api_key:
+if not api_key and GEMINI_MODEL != "stub":
     logger.warning("GEMINI_API_KEY not set. Generation endpoints will use fallbacks.")
+logger.debug("Gemini model %s, API key %s", GEMINI_MODEL, "set" if api_key else "missing")
+
+# The client (and the Gemini SDK import behind it) is built on the first model call.
+# GEMINI_MODEL=stub serves canned replies locally (load tests, offline development).
+if GEMINI_MODEL == "stub":
+    model = StubGenerativeModel(
+        latency_seconds=float(os.getenv("STUB_MODEL_LATENCY_SECONDS", "0.5")),
+        failure_rate=float(os.getenv("STUB_MODEL_FAILURE_RATE", "0")),
+    )
 else:
-    genai.configure(api_key=api_key)
-
-GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
-try:
-    model = genai.GenerativeModel(GEMINI_MODEL) if api_key else None
-except Exception as e:
-    logger.exception("Failed to initialize Gemini model: %s", e)
-    model = None
+    model = LazyModel(functools.partial(keyed_generative_model, GEMINI_MODEL, api_key)) if api_key else None
+
+# "schema": Gemini returns JSON matching a response schema, so prompts carry no format boilerplate;
+# "prompt": spell the JSON format out in the prompt (models without JSON mode)
+GEMINI_OUTPUT_MODE = os.getenv("GEMINI_OUTPUT_MODE", "schema").lower()
+
+def _json_output(schema: dict) -> dict:
+    """generate_content kwargs requesting model-native JSON for ``schema`` (none in prompt mode)."""
+    if GEMINI_OUTPUT_MODE != "schema":
+        return {}
+    return {"generation_config": {"response_mime_type": "application/json", "response_schema": schema}}
+
+# All model calls go through one event loop with a bounded number in flight. Views block a
+# request thread per call, so the defaults follow the thread count: one slot per request thread
+# plus as many again for background calls (speculation, summaries, the story pool)
+WEB_THREADS = int(os.getenv("WEB_THREADS", "8"))
+GENERATION_MAX_CONCURRENCY = int(os.getenv("GENERATION_MAX_CONCURRENCY", str(WEB_THREADS * 2)))
+generation_service = GenerationService(
+    max_concurrency=GENERATION_MAX_CONCURRENCY,
+    max_queue_depth=int(os.getenv("GENERATION_MAX_QUEUE", str(GENERATION_MAX_CONCURRENCY * 4))),
+    timeout=float(os.getenv("GENERATION_TIMEOUT_SECONDS", "60")),
+)
+
+# Warm clients for user-supplied API keys (never reconfigures the global key)
+user_model_pool = ModelClientPool(
+    GEMINI_MODEL,
+    max_clients=int(os.getenv("USER_MODEL_POOL_SIZE", "32")),
+    idle_ttl_seconds=int(os.getenv("USER_MODEL_IDLE_SECONDS", "900")),
+)
+
+# Opt-in ("speculate": true) background generation of every offered interactive branch.
+# Off by default under multi-worker gunicorn (see gunicorn.conf.py): branches are per process
+branch_speculator = BranchSpeculator(
+    generation_service,
+    max_in_flight=int(os.getenv("SPECULATION_MAX_IN_FLIGHT", "16")),
+    session_budget=int(os.getenv("SPECULATION_SESSION_BUDGET", "9")),
+    ttl_seconds=float(os.getenv("SPECULATION_TTL_SECONDS", "600")),
+)
 
 # ----------------------
 # Story components
@@ -146,14 +329,15 @@ class StoryStructures:
     ]
 
     @classmethod
-    def get_random_structure(cls, theme: str | None = None):
+    def get_random_structure(cls, theme: str | None = None, rng: random.Random | None = None):
+        rng = rng or random
         if theme:
             t = theme.lower()
             if "friend" in t:
-                return next((s for s in cls.ADVENTURE_TEMPLATES if s["name"] == "The Friendship"), random.choice(cls.ADVENTURE_TEMPLATES))
+                return next((s for s in cls.ADVENTURE_TEMPLATES if s["name"] == "The Friendship"), rng.choice(cls.ADVENTURE_TEMPLATES))
             if any(x in t for x in ["discover", "mystery", "secret"]):
-                return next((s for s in cls.ADVENTURE_TEMPLATES if s["name"] == "The Discovery"), random.choice(cls.ADVENTURE_TEMPLATES))
-        return random.choice(cls.ADVENTURE_TEMPLATES)
+                return next((s for s in cls.ADVENTURE_TEMPLATES if s["name"] == "The Discovery"), rng.choice(cls.ADVENTURE_TEMPLATES))
+        return rng.choice(cls.ADVENTURE_TEMPLATES)
 
 class CompanionDynamics:
     COMPANION_ROLES = {
@@ -175,8 +359,8 @@ class WisdomGems:
         "Magic": ["Real magic comes from believing in yourself"],
     }
     @classmethod
-    def get_wisdom(cls, theme: str | None):
-        return random.choice(cls.THEME_WISDOM.get(theme, cls.THEME_WISDOM["Adventure"]))
+    def get_wisdom(cls, theme: str | None, rng: random.Random | None = None):
+        return (rng or random).choice(cls.THEME_WISDOM.get(theme, cls.THEME_WISDOM["Adventure"]))
 
 class AdvancedStoryEngine:
     def __init__(self):
@@ -184,11 +368,14 @@ class AdvancedStoryEngine:
         self.companion_dynamics = CompanionDynamics()
         self.wisdom_gems = WisdomGems()
 
-    def generate_enhanced_prompt(self, character: str, theme: str, companion: str | None, therapeutic_prompt: str = ""):
-        story_structure = self.story_structures.get_random_structure(theme)
+    def generate_enhanced_prompt(self, character: str, theme: str, companion: str | None, therapeutic_prompt: str = "",
+                                 rng: random.Random | None = None):
+        """Build the story prompt. Pass a seeded ``rng`` to make the random choices reproducible."""
+        rng = rng or random
+        story_structure = self.story_structures.get_random_structure(theme, rng)
         companion_info = self.companion_dynamics.get_companion_info(companion)
-        plot_twist = random.choice(self.story_structures.PLOT_TWISTS)
-        wisdom = self.wisdom_gems.get_wisdom(theme)
+        plot_twist = rng.choice(self.story_structures.PLOT_TWISTS)
+        wisdom = self.wisdom_gems.get_wisdom(theme, rng)
         parts = [
             "You are a master storyteller creating an enchanting tale for children.",
             "\nSTORY DETAILS:",
@@ -229,16 +416,394 @@ class AdvancedStoryEngine:
 
 story_engine = AdvancedStoryEngine()
 
+STORY_THEMES = ("Adventure", "Friendship", "Magic", "Dragons", "Castles", "Unicorns", "Space", "Ocean")
+
+# ----------------------
+# Response cache
+# ----------------------
+story_cache = build_story_cache_from_env(basedir)
+
+# Identical requests that arrive while one is still generating share its model call
+single_flight = SingleFlight()
+
+# ----------------------
+# Admission control
+# ----------------------
+# Token buckets per client address (or per user API key); None when RATE_LIMIT_BACKEND=off
+rate_limiter = build_rate_limiter_from_env(basedir)
+
+# Shed load with a fast 429 once generation requests hold this many of the process' request
+# threads (a blocked view holds one for the whole model call); two are left for polls and reads
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", str(max(1, WEB_THREADS - 2))))
+# ... or once this many model calls are already waiting for a slot
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", str(generation_service.max_queue_depth // 2)))
+
+admission_stats = {"saturated": 0, "in_flight": 0, "peak_in_flight": 0}
+_admission_lock = threading.Lock()
+
+def _json_body() -> dict:
+    """The request's JSON object; {} when the body is missing, malformed or not an object."""
+    payload = request.get_json(silent=True)
+    return payload if isinstance(payload, dict) else {}
+
+def _too_many_requests(message: str, retry_after: float):
+    header = retry_after_header(retry_after)
+    return jsonify({"error": message, "retry_after": int(header)}), 429, {"Retry-After": header}
+
+def _admission_acquire() -> float | None:
+    """
+    Take an in-flight slot and return None, or return the seconds until a request thread or
+    queue slot should free up. Check and increment share one lock, so the limit is never overshot.
+    """
+    metrics = generation_service.metrics()
+    avg_latency = (metrics["avg_latency_ms"] / 1000) or 1.0
+    with _admission_lock:
+        if metrics["queue_depth"] >= ADMISSION_MAX_QUEUE:
+            retry_after = metrics["queue_depth"] / max(generation_service.max_concurrency, 1) * avg_latency
+        elif admission_stats["in_flight"] >= ADMISSION_MAX_IN_FLIGHT:
+            retry_after = avg_latency
+        else:
+            admission_stats["in_flight"] += 1
+            admission_stats["peak_in_flight"] = max(admission_stats["peak_in_flight"], admission_stats["in_flight"])
+            return None
+        admission_stats["saturated"] += 1
+    return retry_after
+
+def _admission_release():
+    with _admission_lock:
+        admission_stats["in_flight"] -= 1
+
+def admission(bucket: str, user_keys: bool = False):
+    """
+    Reject a generation request with 429 + Retry-After when its client is over quota or the server is saturated.
+
+    Only routes that really run on the caller's ``user_api_key`` (``user_keys=True``) charge its
+    bucket; elsewhere the key spends nothing of the caller's, so a random one must not buy a fresh quota.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapped(*args, **kwargs):
+            retry_after = _admission_acquire()
+            if retry_after is not None:
+                return _too_many_requests("Story engine is busy, please try again shortly", retry_after)
+            try:
+                if rate_limiter:
+                    user_api_key = _json_body().get("user_api_key") if user_keys else None
+                    if user_api_key:
+                        identity = "key:" + key_fingerprint(str(user_api_key))
+                    else:
+                        identity = "client:" + (request.remote_addr or "unknown")
+                    allowed, retry_after = rate_limiter.acquire(bucket, identity, user_key=bool(user_api_key))
+                    if not allowed:
+                        _admission_release()
+                        return _too_many_requests("Too many requests, please slow down", retry_after)
+                response = app.make_response(view(*args, **kwargs))
+            except BaseException:
+                _admission_release()
+                raise
+            # Released when the server closes the response, so a streamed story holds its slot to the end
+            response.call_on_close(_admission_release)
+            return response
+        return wrapped
+    return decorator
+
+# ----------------------
+# Rolling summaries
+# ----------------------
+# Verbatim tail of the previous chapter that accompanies the series summary
+PREVIOUS_CHAPTER_TAIL_CHARS = 600
+
+def _summary_generate(prompt: str) -> str:
+    if model is None:
+        raise RuntimeError("Model unavailable")
+    return getattr(generation_service.generate(model, prompt), "text", "")
+
+story_summarizer = RollingSummarizer(
+    generate=_summary_generate if os.getenv("STORY_SUMMARY_MODE", "model").lower() == "model" else None,
+    max_chars=int(os.getenv("STORY_SUMMARY_MAX_CHARS", "1200")),
+)
+
+def _load_summary(key: str, through: int) -> str | None:
+    row = StorySummary.query.filter_by(key=key, through=through).first()
+    return row.summary if row else None
+
+def _put_summary(key: str, through: int, summary: str):
+    """Insert or replace the summary for (key, through); caller commits."""
+    row = StorySummary.query.filter_by(key=key, through=through).first()
+    if row:
+        row.summary = summary
+    else:
+        db.session.add(StorySummary(key=key, through=through, summary=summary))
+
+def _series_summary_key(payload: dict, series_title: str) -> str | None:
+    """
+    Key of the stored summary for this series: the client's series_id, else its saved character
+    plus the series title. None when neither is sent: a hero's name and a title are not unique
+    across families, so a summary keyed by them could leak one child's story into another's prompt.
+    """
+    if payload.get("series_id"):
+        return "series:" + make_cache_key("series", {"series_id": str(payload["series_id"])})
+    if payload.get("character_id"):
+        return "series:" + make_cache_key(
+            "series", {"character_id": str(payload["character_id"]), "series_title": series_title}
+        )
+    return None
+
+def _fold_series_summary(key: str, chapter: int, earlier: str, chapter_text: str):
+    """Background task: summary through ``chapter`` = earlier summary + this chapter."""
+    summary = story_summarizer.fold(earlier, chapter_text, f"Chapter {chapter}")
+    with app.app_context():
+        try:
+            _put_summary(key, chapter, summary)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.warning("Could not store series summary: %s", e)
+
+# ----------------------
+# Story library
+# ----------------------
+def _write_stories(batch: list):
+    """Insert a batch of stories in one transaction (runs on the story writer thread)."""
+    with app.app_context():
+        # Unknown character IDs are kept as NULL rather than failing the whole batch on the foreign key
+        ids = {story["character_id"] for story in batch if story.get("character_id")}
+        known = {char_id for (char_id,) in db.session.query(Character.id).filter(Character.id.in_(ids))} if ids else set()
+        db.session.add_all(
+            Story(**{**story, "character_id": story.get("character_id") if story.get("character_id") in known else None})
+            for story in batch
+        )
+        db.session.commit()
+
+story_writer = StoryWriter(_write_stories)
+
+def _save_story(source: str, payload: dict, character_name, result: dict):
+    """Queue a freshly generated story for the library; never delays the response."""
+    story_writer.submit({
+        "source": source,
+        "character_id": payload.get("character_id"),
+        "character_name": str(character_name)[:100] if character_name else None,
+        "theme": payload.get("theme"),
+        "title": result.get("title"),
+        "story_text": result["story_text"],
+        "wisdom_gem": result.get("wisdom_gem"),
+    })
+
+# ----------------------
+# Story pool
+# ----------------------
+# Generic /generate-story requests (a pooled theme/companion, no therapeutic prompt, server key)
+# are answered from stories pre-generated while the model is idle
+STORY_POOL_FIELDS = {"character", "theme", "companion", "seed"}
+
+def _poolable(payload: dict) -> bool:
+    """
+    True when a request asks for nothing a pooled story wasn't written for.
+
+    Pooled stories only know the theme and companion, so anything else that is set
+    (an age, a therapeutic prompt, a user key, ...) means the story is generated fresh.
+    """
+    return all(field in STORY_POOL_FIELDS or value in (None, "") for field, value in payload.items())
+
+STORY_POOL_SIZE = int(os.getenv("STORY_POOL_SIZE", "2"))  # per theme/companion; 0 disables
+STORY_POOL_COMPANIONS = [
+    None if name.strip().lower() == "none" else name.strip()
+    for name in os.getenv("STORY_POOL_COMPANIONS", "none").split(",")
+    if name.strip()
+]
+
+def _pool_generate(theme: str, companion: str | None) -> dict | None:
+    if model is None:
+        return None
+    prompt = story_engine.generate_enhanced_prompt(PLACEHOLDER_HERO, theme, companion) + (
+        f"\n- Refer to {PLACEHOLDER_HERO} by name or as \"they\", never \"he\" or \"she\"."
+    )
+    try:
+        raw_text = getattr(generation_service.generate(model, prompt), "text", "")
+    except Exception as e:
+        logger.warning("Story pool generation failed: %s", e)
+        return None
+    if not raw_text:
+        return None
+    title, wisdom_gem, story_text = _safe_extract_title_and_gem(raw_text, theme)
+    return {"title": title, "story_text": story_text, "wisdom_gem": wisdom_gem}
+
+class _PooledStoryStore:
+    """StoryPool storage in the app database, so every worker draws from one pool."""
+
+    def count(self) -> dict:
+        with app.app_context():
+            rows = db.session.query(PooledStory.theme, PooledStory.companion, db.func.count()).group_by(
+                PooledStory.theme, PooledStory.companion).all()
+        return {(theme, companion or None): n for theme, companion, n in rows}
+
+    def add(self, key, story: dict):
+        theme, companion = key
+        with app.app_context():
+            db.session.add(PooledStory(theme=theme, companion=companion or "", **story))
+            db.session.commit()
+
+    def take(self, key) -> dict | None:
+        theme, companion = key
+        with app.app_context():
+            for _ in range(3):
+                row = PooledStory.query.filter_by(theme=theme, companion=companion or "").order_by(PooledStory.id).first()
+                if row is None:
+                    return None
+                story = {"title": row.title, "story_text": row.story_text, "wisdom_gem": row.wisdom_gem}
+                # Only the worker whose DELETE removes the row gets it
+                taken = PooledStory.query.filter_by(id=row.id).delete()
+                db.session.commit()
+                if taken:
+                    return story
+        return None
+
+def _generation_idle() -> bool:
+    metrics = generation_service.metrics()
+    return metrics["in_flight"] == 0 and metrics["queue_depth"] == 0
+
+story_pool = StoryPool(
+    [(theme, companion) for theme in STORY_THEMES for companion in STORY_POOL_COMPANIONS],
+    target=STORY_POOL_SIZE,
+    generate=_pool_generate,
+    store=_PooledStoryStore(),
+    is_idle=_generation_idle,
+    low_water=int(os.getenv("STORY_POOL_LOW_WATER", "1")),
+    interval_seconds=float(os.getenv("STORY_POOL_INTERVAL_SECONDS", "5")),
+)
+
+# ----------------------
+# Image artifacts
+# ----------------------
+image_store = ImageStore(os.getenv("IMAGE_STORE_DIR", os.path.join(basedir, "image_store")))
+
+# ----------------------
+# Image jobs
+# ----------------------
+# Image calls take tens of seconds, so they run on the job queue's workers instead of in the request
+JOB_MAX_WAIT_SECONDS = float(os.getenv("JOB_MAX_WAIT_SECONDS", "30"))
+MAX_IMAGES_PER_JOB = 4
+
+def _gemini_image_provider():
+    from gemini_image_generator import GeminiImageGenerator  # pulls in PIL; only on first image job
+    return GeminiImageGenerator(image_store=image_store)
+
+def _openrouter_image_provider():
+    from openrouter_image_generator import OpenRouterImageGenerator
+    return OpenRouterImageGenerator()
+
+IMAGE_PROVIDER_FACTORIES = {
+    "gemini": _gemini_image_provider,
+    "openrouter": _openrouter_image_provider,
+    "stub": lambda: StubImageProvider(
+        latency_seconds=float(os.getenv("IMAGE_STUB_LATENCY_SECONDS", "0")),
+        failure_rate=float(os.getenv("IMAGE_STUB_FAILURE_RATE", "0")),
+    ),
+}
+
+# Comma-separated preference order; the router re-ranks by measured latency and fails over
+IMAGE_PROVIDERS = [
+    name.strip().lower()
+    for name in os.getenv("IMAGE_PROVIDERS", "gemini,openrouter" if os.getenv("OPENROUTER_API_KEY") else "gemini").split(",")
+    if name.strip().lower() in IMAGE_PROVIDER_FACTORIES
+]
+
+image_router = ImageRouter(
+    {name: IMAGE_PROVIDER_FACTORIES[name] for name in IMAGE_PROVIDERS},
+    image_store=image_store,
+    max_error_rate=float(os.getenv("IMAGE_PROVIDER_MAX_ERROR_RATE", "0.5")),
+    cooldown_seconds=float(os.getenv("IMAGE_PROVIDER_COOLDOWN_SECONDS", "60")),
+)
+
+def _route_images(operation: str, *args, **kwargs) -> dict:
+    try:
+        images = image_router.generate(operation, *args, **kwargs)
+    except NoImageProviderError as e:
+        raise JobFailed(str(e))  # no provider can be built; retrying won't change that
+    return {"provider": images[0]["provider"], "images": images}
+
+def _num_images(payload: dict) -> int:
+    return max(1, min(int(payload.get("num_images", 1)), MAX_IMAGES_PER_JOB))
+
+def _illustration_job(payload: dict) -> dict:
+    kwargs = {"style": payload["style"]} if payload.get("style") else {}
+    return _route_images(
+        "generate_story_illustration", payload["scene_description"], payload.get("character_name", "the hero"),
+        num_images=_num_images(payload), **kwargs,
+    )
+
+def _coloring_page_job(payload: dict) -> dict:
+    return _route_images(
+        "generate_coloring_page", payload["scene_description"], payload.get("character_name", "the hero"),
+        num_images=_num_images(payload),
+    )
+
+def _avatar_job(payload: dict) -> dict:
+    character_id = payload.get("character_id")
+    if character_id:
+        return _saved_character_avatar(character_id, payload)
+    return _generate_avatar(payload["character"], payload)
+
+def _generate_avatar(character_data: dict, payload: dict) -> dict:
+    kwargs = {"style": payload["style"]} if payload.get("style") else {}
+    return _route_images("generate_character_avatar", character_data, num_images=_num_images(payload), **kwargs)
+
+def _saved_character_avatar(character_id: str, payload: dict) -> dict:
+    """Reuse the character's stored avatar while its appearance is unchanged; otherwise generate and store one."""
+    num_images = _num_images(payload)
+    style = payload.get("style") or None
+    with app.app_context():
+        char = db.session.get(Character, character_id)
+        if not char:
+            raise JobFailed("Character not found")
+        fingerprint = _character_fingerprint(char)
+        saved = db.session.get(CharacterAvatar, character_id)
+        if saved and saved.fingerprint == fingerprint and saved.style == style and len(saved.result["images"]) >= num_images:
+            avatar_stats["hits"] += 1
+            return {**saved.result, "images": saved.result["images"][:num_images], "cached": True}
+        character_data = char.to_dict()
+        db.session.rollback()  # don't hold a transaction open during the image call
+
+    avatar_stats["misses"] += 1
+    result = _generate_avatar(character_data, payload)
+    with app.app_context():
+        # Skip the write if the character changed or was deleted while generating
+        char = db.session.get(Character, character_id)
+        if char and _character_fingerprint(char) == fingerprint:
+            db.session.merge(CharacterAvatar(character_id=character_id, fingerprint=fingerprint, style=style, result=result))
+            db.session.commit()
+    return result
+
+avatar_stats = {"hits": 0, "misses": 0}
+
+# kind -> (handler, payload fields of which at least one is required, provider operation)
+IMAGE_JOB_KINDS = {
+    "illustration": (_illustration_job, ("scene_description",), "generate_story_illustration"),
+    "coloring_page": (_coloring_page_job, ("scene_description",), "generate_coloring_page"),
+    "avatar": (_avatar_job, ("character_id", "character"), "generate_character_avatar"),
+}
+
+job_queue = JobQueue(
+    os.getenv("JOB_QUEUE_PATH", os.path.join(basedir, "jobs.db")),
+    {kind: handler for kind, (handler, *_) in IMAGE_JOB_KINDS.items()},
+    workers=int(os.getenv("JOB_WORKERS", "2")),
+    max_attempts=int(os.getenv("JOB_MAX_ATTEMPTS", "3")),
+    retention_hours=float(os.getenv("JOB_RETENTION_HOURS", "72")),
+    # Comma-separated; when empty, webhooks may go to any host that resolves to public addresses only
+    webhook_hosts=[host.strip() for host in os.getenv("WEBHOOK_ALLOWED_HOSTS", "").split(",") if host.strip()],
+)
+
 # ----------------------
 # Helpers
 # ----------------------
 _TITLE_RE = re.compile(r"\[TITLE:\s*(.*?)\s*\]", re.DOTALL)
 _GEM_RE = re.compile(r"\[WISDOM GEM:\s*(.*?)\s*\]", re.DOTALL)
+DEFAULT_STORY_TITLE = "A Brave Little Adventure"
 
 def _safe_extract_title_and_gem(text: str, theme: str):
     title_match = _TITLE_RE.search(text or "")
     gem_match = _GEM_RE.search(text or "")
-    title = title_match.group(1).strip() if title_match and title_match.group(1).strip() else "A Brave Little Adventure"
+    title = title_match.group(1).strip() if title_match and title_match.group(1).strip() else DEFAULT_STORY_TITLE
     wisdom_gem = gem_match.group(1).strip() if gem_match and gem_match.group(1).strip() else WisdomGems.get_wisdom(theme)
     story_body = _TITLE_RE.sub("", text or "").strip()
     story_body = _GEM_RE.sub("", story_body).strip()
@@ -263,75 +828,272 @@ def _as_list(v):
         return [part.strip() for part in s.split(",") if part.strip()]
     return [str(v)]
 
+def _fallback_story_text(theme: str) -> str:
+    return (
+        "[TITLE: An Unexpected Adventure]\n"
+        "Once upon a time, a brave hero discovered that the greatest adventures come from "
+        "facing our fears with courage and kindness.\n"
+        f"[WISDOM GEM: {WisdomGems.get_wisdom(theme)}]"
+    )
+
+def _wants_stream() -> bool:
+    return request.args.get("stream", "").lower() in ("1", "true", "yes")
+
+def _sse_response(events):
+    return Response(
+        events,
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+def _story_sse(event: str, value: str) -> str:
+    field = {"title": "title", "chunk": "text", "gem": "wisdom_gem"}[event]
+    return sse_event(event, {field: value})
+
+def _replay_story_events(story: dict, used_user_key: bool):
+    """Send a cached story using the same event sequence as a live stream."""
+    yield _story_sse("title", story["title"])
+    yield _story_sse("chunk", story["story_text"])
+    yield _story_sse("gem", story["wisdom_gem"])
+    yield sse_event("done", {**story, "used_user_key": used_user_key})
+
+def _stream_story_events(prompt: str, payload: dict, user_api_key: str | None, cache_key: str):
+    """
+    Stream a story as SSE: ``title`` as soon as its marker closes, ``chunk`` events
+    for the body, ``gem`` last, then ``done`` with the assembled story.
+    """
+    theme = payload.get("theme", "Adventure")
+    fallback_gem = lambda: WisdomGems.get_wisdom(theme)
+    parser = TitleGemStreamParser(DEFAULT_STORY_TITLE, fallback_gem)
+    generated = False
+    try:
+        story_model = user_model_pool.get(user_api_key) if user_api_key else model
+        if story_model is None:
+            raise RuntimeError("Model unavailable")
+        for text in generation_service.stream(story_model, prompt):
+            for event, value in parser.feed(text):
+                yield _story_sse(event, value)
+        generated = True
+    except Exception as e:
+        logger.warning("Model error while streaming: %s", e)
+        if parser.title is None:
+            # Nothing sent yet, so the fallback story can stand in for the whole response
+            parser = TitleGemStreamParser(DEFAULT_STORY_TITLE, fallback_gem)
+            for event, value in parser.feed(_fallback_story_text(theme)):
+                yield _story_sse(event, value)
+
+    for event, value in parser.finish():
+        yield _story_sse(event, value)
+
+    result = {"title": parser.title, "story_text": parser.story_text, "wisdom_gem": parser.wisdom_gem}
+    if generated and parser.story_text:
+        _save_story("generate-story", payload, payload.get("character"), result)
+        if story_cache:
+            story_cache.set(cache_key, result)
+    yield sse_event("done", {**result, "used_user_key": bool(user_api_key) and generated})
+
+def _payload_companion(payload: dict) -> str | None:
+    """The Flutter client sends "None" (or "") for no companion; treat both as absent."""
+    companion = payload.get("companion")
+    if not companion or str(companion).strip().lower() == "none":
+        return None
+    return companion
+
+def _cache_seed(payload: dict):
+    """Clients may send a ``seed`` to ask for a different story for the same inputs."""
+    seed = payload.get("seed", 0)
+    return seed if isinstance(seed, (int, str)) else str(seed)
+
 # ----------------------
 # API Routes
 # ----------------------
 @app.route("/health", methods=["GET"])
 def health():
-    return {"status": "ok", "model": GEMINI_MODEL, "has_api_key": bool(api_key)}, 200
+    return {
+        "status": "ok",
+        "model": GEMINI_MODEL,
+        "has_api_key": bool(api_key),
+        "storage": {"dialect": db.engine.dialect.name, "profile": app.config["STORAGE_PROFILE"]},
+        "story_cache": story_cache.stats() if story_cache else None,
+        "generation": generation_service.metrics(),
+        "user_model_pool": user_model_pool.stats(),
+        "speculation": branch_speculator.metrics(),
+        "summaries": story_summarizer.stats(),
+        "coalescing": single_flight.stats(),
+        "jobs": job_queue.stats(),
+        "image_providers": image_router.stats(),
+        "avatars": avatar_stats,
+        "story_library": {"full_text_search": story_fts_enabled, **story_writer.stats()},
+        "story_pool": story_pool.stats(),
+        "admission": {
+            "max_in_flight": ADMISSION_MAX_IN_FLIGHT,
+            "max_queue": ADMISSION_MAX_QUEUE,
+            **admission_stats,
+            "rate_limits": rate_limiter.stats() if rate_limiter else None,
+        },
+    }, 200
+
+@app.route("/images/<string:image_id>", methods=["GET"])
+def get_image(image_id: str):
+    """Serve a stored image. Content-addressed, so it can be cached forever; supports Range."""
+    path = image_store.path_for(image_id)
+    if not path:
+        return jsonify({"error": "Image not found"}), 404
+    response = send_file(
+        path,
+        mimetype=MIMETYPES[image_id.rsplit(".", 1)[1]],
+        conditional=True,
+        etag=image_id.split(".", 1)[0],
+        max_age=365 * 24 * 60 * 60,
+    )
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+@app.route("/jobs", methods=["POST"])
+@admission("image")
+def submit_job():
+    """Queue an illustration, coloring_page or avatar job; poll GET /jobs/<id> for the result."""
+    payload = _json_body()
+    kind = payload.get("kind")
+    if kind not in IMAGE_JOB_KINDS:
+        return jsonify({"error": f"kind must be one of: {', '.join(IMAGE_JOB_KINDS)}"}), 400
+    params = payload.get("params") or {}
+    _, required, operation = IMAGE_JOB_KINDS[kind]
+    if not isinstance(params, dict) or not any(params.get(field) for field in required):
+        return jsonify({"error": f"params.{' or params.'.join(required)} is required"}), 400
+    if not image_router.supports(operation):
+        return jsonify({"error": f"No configured image provider can serve {kind} jobs"}), 503
+    if "character" in params and not isinstance(params["character"], dict):
+        return jsonify({"error": "params.character must be an object"}), 400
+    if "num_images" in params and (not isinstance(params["num_images"], int) or isinstance(params["num_images"], bool)):
+        return jsonify({"error": "params.num_images must be an integer"}), 400
+    webhook_url = payload.get("webhook_url")
+    if webhook_url:
+        error = webhook_url_error(webhook_url, job_queue.webhook_hosts)
+        if error:
+            return jsonify({"error": error}), 400
+    try:
+        priority = max(-10, min(int(payload.get("priority", 0)), 10))
+    except (TypeError, ValueError):
+        return jsonify({"error": "priority must be an integer"}), 400
+
+    job = job_queue.submit(kind, params, priority=priority, webhook_url=webhook_url)
+    location = f"/jobs/{job['job_id']}"
+    return jsonify({**job, "status_url": location}), 202, {"Location": location}
+
+@app.route("/jobs/<string:job_id>", methods=["GET"])
+def get_job(job_id: str):
+    """Job status and result; ?wait=N long-polls up to N seconds for it to finish."""
+    try:
+        wait = max(0.0, min(float(request.args.get("wait", 0)), JOB_MAX_WAIT_SECONDS))
+    except ValueError:
+        return jsonify({"error": "wait must be a number of seconds"}), 400
+    job_queue.start()  # pick up jobs queued before a restart
+    job = job_queue.wait(job_id, wait) if wait else job_queue.get(job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job), 200
 
 @app.route("/get-story-themes", methods=["GET"])
 def get_story_themes():
-    return jsonify(["Adventure", "Friendship", "Magic", "Dragons", "Castles", "Unicorns", "Space", "Ocean"]), 200
+    return jsonify(list(STORY_THEMES)), 200
 
 @app.route("/generate-story", methods=["POST"])
+@admission("text", user_keys=True)
 def generate_story_endpoint():
-    payload = request.get_json(silent=True) or {}
+    payload = _json_body()
     character = payload.get("character", "a brave adventurer")
     theme = payload.get("theme", "Adventure")
-    companion = payload.get("companion")
+    companion = _payload_companion(payload)
     therapeutic_prompt = payload.get("therapeutic_prompt", "")
     user_api_key = payload.get("user_api_key")  # Optional user-provided API key
     character_age = payload.get("character_age", 7)  # For age-appropriate content
 
-    prompt = story_engine.generate_enhanced_prompt(character, theme, companion, therapeutic_prompt)
+    # Same inputs + seed -> same cache key -> same prompt choices, so a cached story is a faithful answer
+    cache_key = make_cache_key(
+        "generate-story",
+        {
+            "character": character,
+            "theme": theme,
+            "companion": companion,
+            "therapeutic_prompt": therapeutic_prompt,
+            "character_age": character_age,
+        },
+        _cache_seed(payload),
+    )
+    stream = _wants_stream()
+    if story_cache:
+        cached = story_cache.get(cache_key)
+        if cached:
+            # A cache hit makes no model call, so no key (the user's or ours) was spent
+            if stream:
+                return _sse_response(_replay_story_events(cached, False))
+            return jsonify({**cached, "used_user_key": False}), 200
+
+    if theme in STORY_THEMES and _poolable(payload):
+        pooled = story_pool.draw(theme, companion, str(character))
+        if pooled:
+            _save_story("generate-story", payload, character, pooled)
+            if story_cache:
+                story_cache.set(cache_key, pooled)
+            if stream:
+                return _sse_response(_replay_story_events(pooled, False))
+            return jsonify({**pooled, "used_user_key": False}), 200
+
+    prompt = story_engine.generate_enhanced_prompt(
+        character, theme, companion, therapeutic_prompt, rng=random.Random(cache_key)
+    )
+
+    if stream:
+        # ?stream=1: server-sent events, title first, so readers see text within the first chunk
+        return _sse_response(_stream_story_events(prompt, payload, user_api_key, cache_key))
 
     # Decide which model to use
-    using_user_key = False
-    try:
+    def call_model():
         if user_api_key:
             # User provided their own API key - use it for unlimited generation
-            genai.configure(api_key=user_api_key)
-            user_model = genai.GenerativeModel(GEMINI_MODEL)
-            response = user_model.generate_content(prompt)
-            using_user_key = True
-        else:
-            # Use server's API key (free tier)
-            if model is None:
-                raise RuntimeError("Model unavailable")
-            response = model.generate_content(prompt)
-            using_user_key = False
+            user_model = user_model_pool.get(user_api_key)
+            return generation_service.generate(user_model, prompt), True
+        # Use server's API key (free tier)
+        if model is None:
+            raise RuntimeError("Model unavailable")
+        return generation_service.generate(model, prompt), False
+
+    using_user_key = False
+    generated = False
+    shared = False  # result of an identical in-flight request, which saves it itself
+    try:
+        # Same inputs and same key -> one model call, however many copies are in flight
+        flight_key = ("generate-story", cache_key, key_fingerprint(user_api_key) if user_api_key else "")
+        (response, using_user_key), shared = single_flight.do(flight_key, call_model)
 
         raw_text = getattr(response, "text", "")
         if not raw_text:
             raise ValueError("Empty model response")
+        generated = True
 
     except Exception as e:
-        print(f"!!! API ERROR: {type(e).__name__}: {str(e)}")
+        logger.error("API error: %s: %s", type(e).__name__, e)
         logger.warning("Model error, using fallback: %s", e)
-        raw_text = (
-            "[TITLE: An Unexpected Adventure]\n"
-            "Once upon a time, a brave hero discovered that the greatest adventures come from "
-            "facing our fears with courage and kindness.\n"
-            f"[WISDOM GEM: {WisdomGems.get_wisdom(theme)}]"
-        )
-    finally:
-        # Reset to server API key after user's request
-        if user_api_key and api_key:
-            genai.configure(api_key=api_key)
+        raw_text = _fallback_story_text(theme)
 
     title, wisdom_gem, story_text = _safe_extract_title_and_gem(raw_text, theme)
+    result = {"title": title, "story_text": story_text, "wisdom_gem": wisdom_gem}
+    if generated and not shared:
+        _save_story("generate-story", payload, character, result)
+    if story_cache and generated:
+        story_cache.set(cache_key, result)
     return jsonify({
-        "title": title,
-        "story_text": story_text,
-        "wisdom_gem": wisdom_gem,
+        **result,
         "used_user_key": using_user_key  # Let client know which mode was used
     }), 200
 
 @app.route("/continue-story", methods=["POST"])
+@admission("text", user_keys=True)
 def continue_story_endpoint():
     """Generate a continuation of a previous story"""
-    payload = request.get_json(silent=True) or {}
+    payload = _json_body()
 
     # Required fields
     character = payload.get("character", "a brave adventurer")
@@ -342,11 +1104,46 @@ def continue_story_endpoint():
     series_title = payload.get("series_title", "")
 
     # Optional fields
-    companion = payload.get("companion")
+    companion = _payload_companion(payload)
     therapeutic_prompt = payload.get("therapeutic_prompt", "")
     user_api_key = payload.get("user_api_key")
     character_age = payload.get("character_age", 7)
 
+    cache_key = make_cache_key(
+        "continue-story",
+        {
+            "character": character,
+            "theme": theme,
+            "previous_story": previous_story,
+            "previous_title": previous_title,
+            "chapter_number": chapter_number,
+            "series_title": series_title,
+            "companion": companion,
+            "therapeutic_prompt": therapeutic_prompt,
+            "character_age": character_age,
+        },
+        _cache_seed(payload),
+    )
+    if story_cache:
+        cached = story_cache.get(cache_key)
+        if cached:
+            return jsonify({**cached, "used_user_key": False}), 200  # served without a model call
+
+    # Rolling series summary through the previous chapter; constant size however long the series gets
+    try:
+        chapter = int(chapter_number)
+    except (TypeError, ValueError):
+        chapter = 2
+    summary_key = _series_summary_key(payload, series_title)
+    earlier = _load_summary(summary_key, chapter - 1) if summary_key else None
+    if earlier is None:
+        # Previous chapter wasn't written here (or its fold is still running): fold the text we were sent
+        earlier = story_summarizer.fold_extractive(
+            (_load_summary(summary_key, chapter - 2) if summary_key else None) or "",
+            previous_story, f"Chapter {chapter - 1}",
+        )
+    previous_ending = clip_sentences(previous_story, PREVIOUS_CHAPTER_TAIL_CHARS, from_end=True)
+
     # Build continuation prompt
     continuation_prompt = f"""You are an expert children's story writer creating Chapter {chapter_number} of a story series.
 
@@ -357,8 +1154,11 @@ Main Character: {character}
 Theme: {theme}
 {f"Companion: {companion}" if companion else ""}
 
-PREVIOUS CHAPTER SUMMARY:
-{previous_story[:1500]}
+STORY SO FAR (summary of earlier chapters):
+{earlier}
+
+HOW THE PREVIOUS CHAPTER ENDED:
+{previous_ending}
 
 TASK:
 Write Chapter {chapter_number} that continues this adventure naturally. The story should:
@@ -382,21 +1182,22 @@ Make this chapter feel like a natural continuation while being exciting on its o
 
     # Generate the story
     using_user_key = False
+    generated = False
     try:
         if user_api_key:
-            genai.configure(api_key=user_api_key)
-            user_model = genai.GenerativeModel(GEMINI_MODEL)
-            response = user_model.generate_content(continuation_prompt)
+            user_model = user_model_pool.get(user_api_key)
+            response = generation_service.generate(user_model, continuation_prompt)
             using_user_key = True
         else:
             if model is None:
                 raise RuntimeError("Model unavailable")
-            response = model.generate_content(continuation_prompt)
+            response = generation_service.generate(model, continuation_prompt)
             using_user_key = False
 
         raw_text = getattr(response, "text", "")
         if not raw_text:
             raise ValueError("Empty model response")
+        generated = True
 
     except Exception as e:
         logger.warning("Model error in continuation, using fallback: %s", e)
@@ -406,9 +1207,6 @@ Make this chapter feel like a natural continuation while being exciting on its o
             f"our hero discovers new surprises and learns even more about courage and friendship.\n"
             f"[WISDOM GEM: {WisdomGems.get_wisdom(theme)}]"
         )
-    finally:
-        if user_api_key and api_key:
-            genai.configure(api_key=api_key)
 
     title, wisdom_gem, story_text = _safe_extract_title_and_gem(raw_text, theme)
 
@@ -416,28 +1214,159 @@ Make this chapter feel like a natural continuation while being exciting on its o
     if f"Chapter {chapter_number}" not in title:
         title = f"{series_title} - Chapter {chapter_number}: {title}"
 
-    return jsonify({
+    result = {
         "title": title,
         "story_text": story_text,
         "wisdom_gem": wisdom_gem,
         "chapter_number": chapter_number,
         "series_title": series_title,
+    }
+    if generated:
+        if summary_key:
+            story_summarizer.submit(_fold_series_summary, summary_key, chapter, earlier, story_text)
+        _save_story("continue-story", payload, character, result)
+    if story_cache and generated:
+        story_cache.set(cache_key, result)
+    return jsonify({
+        **result,
         "used_user_key": using_user_key
     }), 200
 
+# ---- Story library ----
+def _page_args(default_limit: int = 20):
+    limit = max(1, min(int(request.args.get("limit", default_limit)), 100))
+    return limit, request.args.get("character_id")
+
+@app.route("/stories", methods=["GET"])
+def list_stories():
+    """
+    Saved stories, newest first, as {"items": [...], "next_cursor": "..."}.
+
+    Optional ``character_id`` filter; ``limit`` (max 100) and ``cursor`` page by id.
+    Items carry an ``excerpt``; GET /stories/<id> returns the full text.
+    """
+    try:
+        limit, character_id = _page_args()
+        before = int(request.args["cursor"]) if request.args.get("cursor") else None
+    except ValueError:
+        return jsonify({"error": "'limit' and 'cursor' must be integers"}), 400
+
+    query = Story.query
+    if character_id:
+        query = query.filter(Story.character_id == character_id)
+    if before is not None:
+        query = query.filter(Story.id < before)
+    rows = query.order_by(Story.id.desc()).limit(limit + 1).all()
+    page = rows[:limit]
+    return jsonify({
+        "items": [story.to_dict(full=False) for story in page],
+        "next_cursor": str(page[-1].id) if len(rows) > limit else None,
+    }), 200
+
+@app.route("/stories/search", methods=["GET"])
+def search_stories():
+    """
+    Full-text search over title, story text and wisdom gem: ``q`` (all words must
+    match, the last as a prefix), optional ``character_id``, ``limit`` and ``offset``.
+    Best matches first, each with a highlighted ``snippet``.
+    """
+    terms = search_terms(request.args.get("q", ""))
+    if not terms:
+        return jsonify({"error": "'q' is required"}), 400
+    try:
+        limit, character_id = _page_args()
+        offset = max(0, int(request.args.get("offset", 0)))
+    except ValueError:
+        return jsonify({"error": "'limit' and 'offset' must be integers"}), 400
+
+    if story_fts_enabled:
+        # bm25 ranking is computed for every candidate, so only the newest STORY_SEARCH_CANDIDATES
+        # matches are ranked; that keeps a common word from costing a pass over the whole library
+        sql = (
+            "SELECT rowid FROM (SELECT rowid, rank FROM story_fts WHERE story_fts MATCH :match"
+            + (" AND rowid IN (SELECT id FROM story WHERE character_id = :character_id)" if character_id else "")
+            + " ORDER BY rowid DESC LIMIT :candidates) ORDER BY rank LIMIT :limit OFFSET :offset"
+        )
+        ids = db.session.execute(db.text(sql), {
+            "match": fts_match_expression(terms), "character_id": character_id,
+            "candidates": STORY_SEARCH_CANDIDATES, "limit": limit + 1, "offset": offset,
+        }).scalars().all()
+        more = len(ids) > limit
+        by_id = {story.id: story for story in Story.query.filter(Story.id.in_(ids[:limit]))}
+        rows = [by_id[story_id] for story_id in ids[:limit] if story_id in by_id]
+    else:
+        # No FTS5 (e.g. PostgreSQL): every term must appear in one of the fields
+        query = Story.query
+        for term in terms:
+            pattern = f"%{term}%"
+            query = query.filter(or_(Story.title.ilike(pattern), Story.story_text.ilike(pattern), Story.wisdom_gem.ilike(pattern)))
+        if character_id:
+            query = query.filter(Story.character_id == character_id)
+        rows = query.order_by(Story.id.desc()).offset(offset).limit(limit + 1).all()
+        more = len(rows) > limit
+        rows = rows[:limit]
+
+    return jsonify({
+        "items": [{**story.to_dict(full=False), "snippet": make_snippet(story.story_text, terms)} for story in rows],
+        "next_offset": offset + limit if more else None,
+    }), 200
+
+@app.route("/stories/<int:story_id>", methods=["GET"])
+def get_story(story_id: int):
+    story = db.session.get(Story, story_id)
+    if not story:
+        return jsonify({"error": "Story not found"}), 404
+    return jsonify(story.to_dict()), 200
+
 @app.route("/create-character", methods=["POST"])
 def create_character():
-    data = request.get_json(silent=True) or {}
+    data = _json_body()
+    new_character, error = _character_from_payload(data)
+    if error:
+        return jsonify({"error": error}), 400
+    db.session.add(new_character)
+    db.session.commit()
+    return jsonify(new_character.to_dict()), 201
+
+CHARACTER_TEXT_FIELDS = (
+    "name", "gender", "role", "magic_type", "challenge", "character_type",
+    "superhero_name", "mission", "hair", "eyes", "outfit", "comfort_item",
+)
+CHARACTER_LIST_FIELDS = (
+    "traits", "personality_traits", "siblings", "friends",
+    "likes", "dislikes", "fears", "strengths", "goals",
+)
+
+def _character_type_error(data: dict):
+    """Reject wrongly typed character fields before they reach the database. Returns an error message or None."""
+    for field in CHARACTER_TEXT_FIELDS:
+        value = data.get(field)
+        if value is not None and not isinstance(value, str):
+            return f"'{field}' must be a string"
+    for field in CHARACTER_LIST_FIELDS:
+        value = data.get(field)
+        if isinstance(value, list):
+            if any(isinstance(item, (dict, list)) for item in value):
+                return f"'{field}' must be a list of strings"
+        elif value is not None and not isinstance(value, str):
+            return f"'{field}' must be a list of strings"
+    return None
+
+def _character_from_payload(data: dict, char_id: str | None = None):
+    """Validate a create payload. Returns (Character, None) or (None, error message)."""
     missing = [k for k in ("name", "age") if not data.get(k)]
     if missing:
-        return jsonify({"error": f"Missing required field(s): {', '.join(missing)}"}), 400
+        return None, f"Missing required field(s): {', '.join(missing)}"
+    type_error = _character_type_error(data)
+    if type_error:
+        return None, type_error
     try:
         age = int(data.get("age"))
     except (ValueError, TypeError):
-        return jsonify({"error": "'age' must be an integer"}), 400
+        return None, "'age' must be an integer"
 
-    new_character = Character(
-        id=str(uuid.uuid4()),
+    return Character(
+        id=char_id or str(uuid.uuid4()),
         name=str(data.get("name")).strip(),
         age=age,
         gender=data.get("gender"),
@@ -457,10 +1386,7 @@ def create_character():
         strengths=_as_list(data.get("strengths", [])),
         goals=_as_list(data.get("goals", [])),
         comfort_item=data.get("comfort_item"),
-    )
-    db.session.add(new_character)
-    db.session.commit()
-    return jsonify(new_character.to_dict()), 201
+    ), None
 
 # ---- SINGLE update route (PATCH/PUT) ----
 @app.route("/characters/<string:char_id>", methods=["PATCH", "PUT"])
@@ -470,15 +1396,28 @@ def update_character(char_id: str):
     if not char:
         return jsonify({"error": "Character not found"}), 404
 
-    data = request.get_json(silent=True) or {}
+    data = _json_body()
+    error = _apply_character_updates(char, data)
+    if error:
+        return jsonify({"error": error}), 400
 
-    if "name" in data:
-        char.name = (data["name"] or "").strip() or char.name
+    db.session.commit()
+    return jsonify(char.to_dict()), 200
+
+def _apply_character_updates(char: Character, data: dict):
+    """Apply a partial update in place. Returns an error message, or None on success."""
+    type_error = _character_type_error(data)
+    if type_error:
+        return type_error
+    fingerprint = _character_fingerprint(char)
     if "age" in data:
         try:
-            char.age = int(data["age"])
+            age = int(data["age"])
         except (TypeError, ValueError):
-            return jsonify({"error": "'age' must be an integer"}), 400
+            return "'age' must be an integer"
+        char.age = age
+    if "name" in data:
+        char.name = (data["name"] or "").strip() or char.name
     if "gender" in data:
         char.gender = data["gender"]
     if "role" in data:
@@ -517,24 +1456,190 @@ def update_character(char_id: str):
         char.strengths = _as_list(data["strengths"])
     if "goals" in data:
         char.goals = _as_list(data["goals"])
+    if _character_fingerprint(char) != fingerprint:
+        # The saved avatar no longer looks like this character
+        CharacterAvatar.query.filter_by(character_id=char.id).delete()
+    return None
+
+MAX_BULK_OPERATIONS = 500
+
+def _bulk_target_id(op):
+    """The character id a bulk operation refers to, if any."""
+    if not isinstance(op, dict):
+        return None
+    target = op.get("character") if op.get("op") == "upsert" else op
+    if isinstance(target, dict) and target.get("id"):
+        return str(target["id"])
+    return None
+
+@app.route("/characters/bulk", methods=["POST"])
+def bulk_characters():
+    """
+    Apply many character upserts/deletes in ONE transaction (one commit, one fsync).
+
+    Body: {"operations": [{"op": "upsert", "character": {...}}, {"op": "delete", "id": "..."}]}
+    An upsert with an existing ``character.id`` is a partial update; otherwise it creates
+    the character (name and age required). Invalid items are reported and skipped, except
+    wrongly typed fields, which reject the whole batch with a 400 naming the item's index.
+    """
+    data = request.get_json(silent=True)
+    operations = data.get("operations") if isinstance(data, dict) else data
+    if not isinstance(operations, list):
+        return jsonify({"error": "'operations' must be a list"}), 400
+    if len(operations) > MAX_BULK_OPERATIONS:
+        return jsonify({"error": f"At most {MAX_BULK_OPERATIONS} operations per request"}), 400
+    # Checked up front: a bad type would otherwise only surface at commit and fail the batch with a 500
+    for index, op in enumerate(operations):
+        payload = op.get("character") if isinstance(op, dict) and op.get("op") == "upsert" else None
+        error = _character_type_error(payload) if isinstance(payload, dict) else None
+        if error:
+            return jsonify({"error": f"Operation {index}: {error}", "index": index}), 400
+
+    # One query for every row the batch touches
+    ids = {char_id for char_id in map(_bulk_target_id, operations) if char_id}
+    rows = {c.id: c for c in Character.query.filter(Character.id.in_(ids)).all()} if ids else {}
+    deleted = set()
+
+    results = []
+    for index, op in enumerate(operations):
+        if not isinstance(op, dict):
+            results.append({"index": index, "status": "error", "error": "Operation must be an object"})
+            continue
+        kind = op.get("op")
+        char_id = _bulk_target_id(op)
+        if kind == "delete":
+            char = rows.get(char_id)
+            if not char:
+                results.append({"index": index, "op": kind, "id": char_id, "status": "error", "error": "Character not found"})
+                continue
+            if char in db.session.new:
+                db.session.expunge(char)  # created earlier in this batch, never flushed
+            else:
+                db.session.delete(char)
+            del rows[char_id]
+            deleted.add(char_id)
+            results.append({"index": index, "op": kind, "id": char_id, "status": "deleted"})
+        elif kind == "upsert":
+            payload = op.get("character")
+            if not isinstance(payload, dict):
+                results.append({"index": index, "op": kind, "status": "error", "error": "'character' must be an object"})
+                continue
+            if char_id in deleted:
+                results.append({"index": index, "op": kind, "id": char_id, "status": "error", "error": "Character was deleted earlier in this batch"})
+                continue
+            char = rows.get(char_id) if char_id else None
+            if char:
+                error = _apply_character_updates(char, payload)
+                status = "updated"
+            else:
+                char, error = _character_from_payload(payload, char_id)
+                status = "created"
+            if error:
+                results.append({"index": index, "op": kind, "id": char_id, "status": "error", "error": error})
+                continue
+            if status == "created":
+                db.session.add(char)
+                rows[char.id] = char
+            results.append({"index": index, "op": kind, "id": char.id, "status": status, "character": char})
+        else:
+            results.append({"index": index, "op": kind, "status": "error", "error": "'op' must be 'upsert' or 'delete'"})
 
-    db.session.commit()
-    return jsonify(char.to_dict()), 200
+    if deleted:
+        CharacterAvatar.query.filter(CharacterAvatar.character_id.in_(deleted)).delete()
+    try:
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.exception("Bulk character commit failed: %s", e)
+        return jsonify({"error": "Bulk operation failed; no changes were applied"}), 500
+
+    for result in results:
+        if "character" in result:
+            result["character"] = result["character"].to_dict()
+    errors = sum(1 for r in results if r["status"] == "error")
+    return jsonify({"results": results, "applied": len(results) - errors, "errors": errors}), 200
 
 @app.route("/characters/<string:char_id>", methods=["DELETE"])
 def delete_character(char_id: str):
     char = db.session.get(Character, char_id)
     if not char:
         return jsonify({"error": "Character not found"}), 404
+    CharacterAvatar.query.filter_by(character_id=char_id).delete()
     db.session.delete(char)
     db.session.commit()
     return jsonify({"status": "deleted", "id": char_id}), 200
 
+def _encode_cursor(char: Character) -> str:
+    raw = json.dumps([char.created_at.isoformat(), char.id])
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+def _decode_cursor(cursor: str):
+    padded = cursor + "=" * (-len(cursor) % 4)
+    created_at, char_id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    return datetime.fromisoformat(created_at), str(char_id)
+
+def _parse_fields(raw: str | None):
+    """Parse ``fields=name,age`` into a tuple of known columns (``id`` always first)."""
+    if not raw:
+        return None
+    requested = [f.strip() for f in raw.split(",") if f.strip()]
+    unknown = [f for f in requested if f not in CHARACTER_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown field(s): {', '.join(unknown)}")
+    return ("id", *[f for f in dict.fromkeys(requested) if f != "id"])
+
 @app.route("/get-characters", methods=["GET"])
 def get_characters():
-    """Return a simple LIST to match the Flutter code that expects a list."""
-    chars = Character.query.order_by(Character.created_at.desc()).all()
-    return jsonify([c.to_dict() for c in chars]), 200
+    """
+    Return a simple LIST to match the Flutter code that expects a list.
+
+    Optional query parameters:
+    - fields=name,age,...  only load and return these columns
+    - limit=N / cursor=... keyset pagination on (created_at, id); the response
+      becomes {"items": [...], "next_cursor": "..."} when either is given
+    Responses carry an ETag, so unchanged lists answer If-None-Match with 304.
+    """
+    try:
+        fields = _parse_fields(request.args.get("fields"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    query = Character.query
+    if fields:
+        # Keyset columns are needed for cursors even when not requested
+        loaded = dict.fromkeys((*fields, "created_at"))
+        query = query.options(load_only(*[getattr(Character, f) for f in loaded]))
+    query = query.order_by(Character.created_at.desc(), Character.id.desc())
+
+    limit_arg = request.args.get("limit")
+    cursor = request.args.get("cursor")
+    if limit_arg is None and cursor is None:
+        body = [c.to_dict(fields) for c in query.all()]
+    else:
+        try:
+            limit = max(1, min(int(limit_arg or 50), 200))
+        except ValueError:
+            return jsonify({"error": "'limit' must be an integer"}), 400
+        if cursor:
+            try:
+                created_at, char_id = _decode_cursor(cursor)
+            except Exception:
+                return jsonify({"error": "Invalid cursor"}), 400
+            query = query.filter(or_(
+                Character.created_at < created_at,
+                and_(Character.created_at == created_at, Character.id < char_id),
+            ))
+        rows = query.limit(limit + 1).all()
+        page = rows[:limit]
+        body = {
+            "items": [c.to_dict(fields) for c in page],
+            "next_cursor": _encode_cursor(page[-1]) if len(rows) > limit else None,
+        }
+
+    response = jsonify(body)
+    response.headers["Cache-Control"] = "no-cache"
+    response.add_etag()
+    return response.make_conditional(request)
 
 @app.route("/characters/<string:char_id>", methods=["GET"])
 def get_character(char_id: str):
@@ -544,8 +1649,9 @@ def get_character(char_id: str):
     return jsonify(char.to_dict()), 200
 
 @app.route("/generate-multi-character-story", methods=["POST"])
+@admission("text")
 def generate_multi_character_story():
-    data = request.get_json(silent=True) or {}
+    data = _json_body()
     character_ids = data.get("character_ids", [])
     main_character_id = data.get("main_character_id")
     theme = data.get("theme", "Friendship")
@@ -586,8 +1692,11 @@ def generate_multi_character_story():
     try:
         if model is None:
             raise RuntimeError("Model unavailable")
-        response = model.generate_content(prompt)
+        response = generation_service.generate(model, prompt)
         story_text = getattr(response, "text", "")
+        if story_text:
+            _save_story("generate-multi-character-story", {**data, "character_id": main_character_id},
+                        main_char["name"], {"story_text": story_text})
     except Exception as e:
         logger.warning("Multi-character story model error: %s", e)
         story_text = (f"{main_char['name']} and their friends went on a wonderful adventure, "
@@ -595,16 +1704,306 @@ def generate_multi_character_story():
 
     return jsonify({"story": story_text}), 200
 
-@app.route("/generate-interactive-story", methods=["POST"])
-def generate_interactive_story():
-    """Generate the opening segment of an interactive, choice-based story."""
-    payload = request.get_json(silent=True) or {}
-    character = payload.get("character", "a brave adventurer")
-    theme = payload.get("theme", "Adventure")
-    companion = payload.get("companion")
-    friends = payload.get("friends", [])
-    therapeutic_prompt = payload.get("therapeutic_prompt", "")
+# ---- Interactive sessions ----
+# Segments replayed into each continuation prompt; older ones are dropped from the context
+INTERACTIVE_CONTEXT_SEGMENTS = int(os.getenv("INTERACTIVE_CONTEXT_SEGMENTS", "3"))
+INTERACTIVE_SESSION_TTL_HOURS = float(os.getenv("INTERACTIVE_SESSION_TTL_HOURS", "72"))
+INTERACTIVE_CHOICES_BEFORE_ENDING = 3
+
+INTERACTIVE_SEGMENT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "text": {"type": "string"},
+        "choices": {
+            "type": "array",
+            "nullable": True,
+            "items": {
+                "type": "object",
+                "properties": {
+                    "id": {"type": "string"},
+                    "text": {"type": "string"},
+                    "description": {"type": "string"},
+                },
+                "required": ["text"],
+            },
+        },
+        "is_ending": {"type": "boolean"},
+    },
+    "required": ["text"],
+}
+
+def _parse_interactive_segment(raw_text: str) -> dict:
+    """Parse a model reply into {"text", "choices", "is_ending"}; raises ValueError if unusable."""
+    result = extract_json(raw_text, INTERACTIVE_SEGMENT_SCHEMA)
+
+    # Every option needs an ID so a session client can send just the ID back
+    if result.get("choices"):
+        result["choices"] = [
+            {**c, "id": str(c.get("id") or f"choice{i}")} for i, c in enumerate(result["choices"], start=1)
+        ]
+    return result
+
+def _generate_interactive_segment(prompt: str, fallback: dict, log_label: str, response=None) -> dict:
+    """Generate (or use an already speculated ``response``) and parse one segment."""
+    try:
+        if response is None:
+            if model is None:
+                raise RuntimeError("Model unavailable")
+            response = generation_service.generate(model, prompt, **_json_output(INTERACTIVE_SEGMENT_SCHEMA))
+        return _parse_interactive_segment(getattr(response, "text", "").strip())
+    except Exception as e:
+        logger.warning("%s: %s", log_label, e)
+        return fallback
 
+def _continuation_prompt(character, theme, companion, friends, therapeutic_prompt,
+                         story_so_far, choice, choices_made_count, should_end, json_mode=None) -> str:
+    if json_mode is None:
+        json_mode = GEMINI_OUTPUT_MODE == "schema"
+    prompt_parts = [
+        "You are continuing an interactive choose-your-own-adventure story for children.",
+        f"\nCONTEXT:",
+        f"- Character: {character}",
+        f"- Theme: {theme}",
+    ]
+    if companion and companion != "None":
+        prompt_parts.append(f"- Companion: {companion}")
+    if friends:
+        prompt_parts.append(f"- Friends/Siblings in story: {', '.join(friends)}")
+
+    if therapeutic_prompt:
+        prompt_parts.extend([
+            "\nTHERAPEUTIC ELEMENTS TO WEAVE IN:",
+            therapeutic_prompt,
+        ])
+
+    prompt_parts.extend([
+        f"\nSTORY SO FAR:\n{story_so_far}",
+        f"\nLAST CHOICE MADE: {choice}",
+        f"\nCHOICES MADE SO FAR: {choices_made_count}",
+    ])
+
+    if should_end:
+        prompt_parts.extend([
+            "\nTASK: Create the FINAL segment that brings the story to a satisfying conclusion (150-200 words).",
+            "Resolve the adventure positively and show what the character learned.",
+        ])
+        if friends:
+            prompt_parts.append(f"Show how {character} and their friends {', '.join(friends)} worked together and what they learned.")
+
+        if json_mode:
+            prompt_parts.append("Set is_ending to true and choices to null.")
+        else:
+            prompt_parts.extend([
+                "\nFORMAT YOUR RESPONSE EXACTLY AS JSON:",
+                "{",
+                '  "text": "The concluding story text...",',
+                '  "choices": null,',
+                '  "is_ending": true',
+                "}",
+            ])
+    else:
+        prompt_parts.extend([
+            "\nTASK: Continue the story based on their choice (150-200 words) and present new options.",
+        ])
+        if friends:
+            prompt_parts.append(f"Include interactions with {', '.join(friends)} to show friendship and teamwork.")
+
+        if json_mode:
+            prompt_parts.append("Offer 3 short choices (ids choice1-choice3), each with a brief description.")
+        else:
+            prompt_parts.extend([
+                "\nFORMAT YOUR RESPONSE EXACTLY AS JSON:",
+                "{",
+                '  "text": "The continuation text here...",',
+                '  "choices": [',
+                '    {"id": "choice1", "text": "Option 1", "description": "Brief description"},',
+                '    {"id": "choice2", "text": "Option 2", "description": "Brief description"},',
+                '    {"id": "choice3", "text": "Option 3", "description": "Brief description"}',
+                '  ],',
+                '  "is_ending": false',
+                "}",
+            ])
+
+    if not json_mode:
+        prompt_parts.append("\nIMPORTANT: Return ONLY valid JSON. No extra text.")
+    return "\n".join(prompt_parts)
+
+def _continuation_fallback(character, friends, choice, should_end) -> dict:
+    friends_text = f" and {', '.join(friends)}" if friends else ""
+    if should_end:
+        return {
+            "text": f"Thanks to their brave choices, {character}{friends_text} completed the adventure successfully and returned home with wonderful memories and new confidence!",
+            "choices": None,
+            "is_ending": True
+        }
+    return {
+        "text": f"After choosing to {choice.lower()}, {character}{friends_text} discovered something wonderful that brought them closer to solving the mystery.",
+        "choices": [
+            {"id": "choice1", "text": "Continue forward", "description": "Keep going with determination"},
+            {"id": "choice2", "text": "Take a moment to think", "description": "Pause and consider the situation"}
+        ],
+        "is_ending": False
+    }
+
+def _prune_interactive_sessions():
+    """Delete sessions idle for longer than INTERACTIVE_SESSION_TTL_HOURS (indexed range delete)."""
+    cutoff = datetime.now() - timedelta(hours=INTERACTIVE_SESSION_TTL_HOURS)
+    stale = InteractiveSession.query.filter(InteractiveSession.updated_at < cutoff)
+    stale_ids = stale.with_entities(InteractiveSession.id).scalar_subquery()
+    InteractiveSegment.query.filter(InteractiveSegment.session_id.in_(stale_ids)).delete(synchronize_session=False)
+    stale_keys = stale.with_entities(literal("session:") + InteractiveSession.id).scalar_subquery()
+    StorySummary.query.filter(StorySummary.key.in_(stale_keys)).delete(synchronize_session=False)
+    stale.delete(synchronize_session=False)
+
+def _start_interactive_session(character, theme, companion, friends, therapeutic_prompt, segment) -> str | None:
+    """Persist a new session with its opening segment; returns the session ID (None if storage fails)."""
+    try:
+        _prune_interactive_sessions()
+        session = InteractiveSession(
+            id=str(uuid.uuid4()),
+            character=character,
+            theme=theme,
+            companion=companion,
+            friends=_as_list(friends),
+            therapeutic_prompt=therapeutic_prompt,
+        )
+        db.session.add(session)
+        db.session.flush()
+        db.session.add(InteractiveSegment(
+            session_id=session.id, position=0, text=segment["text"], choices=segment.get("choices"),
+        ))
+        db.session.commit()
+        return session.id
+    except Exception as e:
+        db.session.rollback()
+        logger.exception("Could not store interactive session: %s", e)
+        return None
+
+def _segment_with_choice(segment) -> str:
+    return f"{segment.text}\n\n(They chose: {segment.chosen_text})" if segment.chosen_text else segment.text
+
+def _session_story_so_far(session_id: str, segments) -> str:
+    """Rebuild STORY SO FAR: rolling summary of older segments plus the recent ones verbatim (oldest first)."""
+    parts = []
+    if segments and segments[0].position > 0:
+        earlier = _load_summary(f"session:{session_id}", segments[0].position - 1)
+        parts.append(f"(Earlier: {earlier})" if earlier else f"(The story began {segments[0].position} segment(s) earlier.)")
+    for segment in segments:
+        parts.append(segment.text if segment is segments[-1] else _segment_with_choice(segment))
+    return "\n\n".join(parts)
+
+def _fold_session_summary(session_id: str, leaving):
+    """Fold the segment that just left the context window into the session summary (same transaction)."""
+    key = f"session:{session_id}"
+    earlier = _load_summary(key, leaving.position - 1) if leaving.position > 0 else ""
+    _put_summary(key, leaving.position, story_summarizer.fold_extractive(earlier or "", _segment_with_choice(leaving)))
+
+def _bounded_story_so_far(story_so_far: str) -> str:
+    """Legacy clients resend the whole story: keep the recent paragraphs, summarize the rest."""
+    paragraphs = [p for p in (story_so_far or "").split("\n\n") if p.strip()]
+    keep = max(INTERACTIVE_CONTEXT_SEGMENTS, 1)
+    recent = [clip_sentences(p, 1500, from_end=True) for p in paragraphs[-keep:]]
+    if len(paragraphs) <= keep:
+        return "\n\n".join(recent)
+    earlier = story_summarizer.fold_extractive("", " ".join(paragraphs[:-keep]))
+    return "\n\n".join([f"(Earlier: {earlier})", *recent])
+
+def _resolve_choice(choices, choice_id, choice_text) -> tuple[str | None, str | None]:
+    """Match the client's pick against the offered options; returns (id, text)."""
+    for option in choices or []:
+        if choice_id is not None and str(option.get("id")) == str(choice_id):
+            return option["id"], option.get("text", "")
+        if choice_id is None and choice_text and option.get("text") == choice_text:
+            return option["id"], choice_text
+    if choice_id is None and choice_text:
+        return None, choice_text
+    return None, None
+
+def _recent_segments(session_id: str) -> list:
+    """The last INTERACTIVE_CONTEXT_SEGMENTS segments of a session, oldest first."""
+    return (
+        InteractiveSegment.query.filter_by(session_id=session_id)
+        .order_by(InteractiveSegment.position.desc())
+        .limit(max(INTERACTIVE_CONTEXT_SEGMENTS, 1))
+        .all()
+    )[::-1]
+
+def _session_continuation(session, recent, choice: str) -> tuple[str, dict]:
+    """(prompt, fallback) for continuing ``session`` with ``choice``; deterministic for a given state."""
+    friends = session.friends or []
+    choices_made_count = session.choices_made + 1
+    should_end = choices_made_count >= INTERACTIVE_CHOICES_BEFORE_ENDING
+    prompt = _continuation_prompt(
+        session.character, session.theme, session.companion, friends, session.therapeutic_prompt,
+        _session_story_so_far(session.id, recent), choice, choices_made_count, should_end,
+    )
+    return prompt, _continuation_fallback(session.character, friends, choice, should_end)
+
+def _speculate_branches(session_id: str):
+    """Start generating the continuation of every offered choice while the reader decides."""
+    if not branch_speculator.enabled or model is None:
+        return
+    session = db.session.get(InteractiveSession, session_id)
+    if session is None or session.is_complete:
+        return
+    recent = _recent_segments(session_id)
+    last = recent[-1]
+    prompts = {
+        str(option["id"]): _session_continuation(session, recent, option.get("text", ""))[0]
+        for option in last.choices or []
+    }
+    branch_speculator.launch(session_id, last.position, model, prompts, **_json_output(INTERACTIVE_SEGMENT_SCHEMA))
+
+def _continue_interactive_session(session_id: str, payload: dict):
+    session = db.session.get(InteractiveSession, session_id)
+    if session is None:
+        return jsonify({"error": "Interactive session not found"}), 404
+    if session.is_complete:
+        return jsonify({"error": "This story has already ended", "session_id": session.id}), 409
+
+    recent = _recent_segments(session.id)
+    last = recent[-1]
+    chosen_id, choice = _resolve_choice(last.choices, payload.get("choice_id"), payload.get("choice"))
+    if choice is None:
+        return jsonify({"error": "Unknown choice_id for the current segment"}), 400
+
+    prompt, fallback = _session_continuation(session, recent, choice)
+    speculated = branch_speculator.claim(session.id, last.position, chosen_id, prompt)
+    result = _generate_interactive_segment(prompt, fallback, "Story continuation error", response=speculated)
+    if session.choices_made + 1 >= INTERACTIVE_CHOICES_BEFORE_ENDING:
+        # The prompt asked for the ending; a reply that offers more choices must not extend the story
+        result = {**result, "is_ending": True, "choices": None}
+
+    last.chosen_id = chosen_id
+    last.chosen_text = choice
+    session.choices_made += 1
+    session.is_complete = bool(result.get("is_ending"))
+    db.session.add(InteractiveSegment(
+        session_id=session.id, position=last.position + 1, text=result["text"], choices=result.get("choices"),
+    ))
+    if len(recent) >= INTERACTIVE_CONTEXT_SEGMENTS:
+        # recent[0] scrolls out of the window with this segment; deterministic so speculation stays valid
+        _fold_session_summary(session.id, recent[0])
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Another continuation of this segment committed first (double tap, two devices)
+        db.session.rollback()
+        return jsonify({"error": "This segment was already continued; reload the story", "session_id": session_id}), 409
+    except Exception as e:
+        db.session.rollback()
+        logger.exception("Could not store interactive segment: %s", e)
+        return jsonify({"error": "Could not save story progress"}), 500
+
+    if session.is_complete:
+        branch_speculator.forget(session.id)
+    elif payload.get("speculate"):
+        _speculate_branches(session.id)
+    return jsonify({**result, "session_id": session.id}), 200
+
+def _opening_prompt(character, theme, companion, friends, therapeutic_prompt, json_mode=None) -> str:
+    if json_mode is None:
+        json_mode = GEMINI_OUTPUT_MODE == "schema"
     prompt_parts = [
         "You are a master storyteller creating an interactive choose-your-own-adventure story for children.",
         f"\nSTORY DETAILS:",
@@ -631,6 +2030,10 @@ def generate_interactive_story():
     if friends:
         prompt_parts.append(f"IMPORTANT: Include {', '.join(friends)} as friends/siblings who appear in the story and can help with choices.")
 
+    if json_mode:
+        prompt_parts.append("Offer 3 short choices (ids choice1-choice3), each describing what happens if they choose it.")
+        return "\n".join(prompt_parts)
+
     prompt_parts.extend([
         "\nFORMAT YOUR RESPONSE EXACTLY AS JSON:",
         "{",
@@ -644,40 +2047,53 @@ def generate_interactive_story():
         "}",
         "\nIMPORTANT: Return ONLY valid JSON. No extra text before or after."
     ])
-    prompt = "\n".join(prompt_parts)
-
-    try:
-        if model is None:
-            raise RuntimeError("Model unavailable")
-        response = model.generate_content(prompt)
-        raw_text = getattr(response, "text", "").strip()
+    return "\n".join(prompt_parts)
 
-        # Try to extract JSON from response
-        json_match = re.search(r'\{.*\}', raw_text, re.DOTALL)
-        if json_match:
-            raw_text = json_match.group(0)
+@app.route("/generate-interactive-story", methods=["POST"])
+@admission("text")
+def generate_interactive_story():
+    """Generate the opening segment of an interactive story and start a server-side session."""
+    payload = _json_body()
+    character = payload.get("character", "a brave adventurer")
+    theme = payload.get("theme", "Adventure")
+    companion = payload.get("companion")
+    friends = payload.get("friends", [])
+    therapeutic_prompt = payload.get("therapeutic_prompt", "")
 
-        result = json.loads(raw_text)
-        return jsonify(result), 200
+    prompt = _opening_prompt(character, theme, companion, friends, therapeutic_prompt)
+
+    friends_text = f" with {', '.join(friends)}" if friends else ""
+    fallback = {
+        "text": f"{character}{friends_text} stood at the edge of a mysterious forest, hearing strange sounds within. The {companion if companion and companion != 'None' else 'wind'} seemed to whisper of adventure ahead.",
+        "choices": [
+            {"id": "choice1", "text": "Enter the forest bravely", "description": "Face the unknown with courage"},
+            {"id": "choice2", "text": "Look for another path", "description": "Search for a safer route"},
+            {"id": "choice3", "text": "Call out to see if anyone is there", "description": "Try to make friends first"}
+        ],
+        "is_ending": False
+    }
+    result = _generate_interactive_segment(prompt, fallback, "Interactive story generation error")
 
-    except Exception as e:
-        logger.warning("Interactive story generation error: %s", e)
-        # Fallback response
-        friends_text = f" with {', '.join(friends)}" if friends else ""
-        return jsonify({
-            "text": f"{character}{friends_text} stood at the edge of a mysterious forest, hearing strange sounds within. The {companion if companion and companion != 'None' else 'wind'} seemed to whisper of adventure ahead.",
-            "choices": [
-                {"id": "choice1", "text": "Enter the forest bravely", "description": "Face the unknown with courage"},
-                {"id": "choice2", "text": "Look for another path", "description": "Search for a safer route"},
-                {"id": "choice3", "text": "Call out to see if anyone is there", "description": "Try to make friends first"}
-            ],
-            "is_ending": False
-        }), 200
+    session_id = _start_interactive_session(character, theme, companion, friends, therapeutic_prompt, result)
+    if session_id:
+        result = {**result, "session_id": session_id}
+        if payload.get("speculate") and not result.get("is_ending"):
+            _speculate_branches(session_id)
+    return jsonify(result), 200
 
 @app.route("/continue-interactive-story", methods=["POST"])
+@admission("text")
 def continue_interactive_story():
-    """Continue an interactive story based on the user's choice."""
-    payload = request.get_json(silent=True) or {}
+    """
+    Continue an interactive story based on the user's choice.
+
+    Session clients send {"session_id", "choice_id"}; the server rebuilds a bounded
+    context from stored segments. Legacy clients may still send story_so_far/choices_made.
+    """
+    payload = _json_body()
+    if payload.get("session_id"):
+        return _continue_interactive_session(str(payload["session_id"]), payload)
+
     character = payload.get("character", "the hero")
     theme = payload.get("theme", "Adventure")
     companion = payload.get("companion")
@@ -688,103 +2104,16 @@ def continue_interactive_story():
     therapeutic_prompt = payload.get("therapeutic_prompt", "")
 
     # Determine if this should be an ending (after 3-4 choices)
-    should_end = len(choices_made) >= 3
-
-    prompt_parts = [
-        "You are continuing an interactive choose-your-own-adventure story for children.",
-        f"\nCONTEXT:",
-        f"- Character: {character}",
-        f"- Theme: {theme}",
-    ]
-    if companion and companion != "None":
-        prompt_parts.append(f"- Companion: {companion}")
-    if friends:
-        prompt_parts.append(f"- Friends/Siblings in story: {', '.join(friends)}")
+    should_end = len(choices_made) >= INTERACTIVE_CHOICES_BEFORE_ENDING
 
-    if therapeutic_prompt:
-        prompt_parts.extend([
-            "\nTHERAPEUTIC ELEMENTS TO WEAVE IN:",
-            therapeutic_prompt,
-        ])
-
-    prompt_parts.extend([
-        f"\nSTORY SO FAR:\n{story_so_far}",
-        f"\nLAST CHOICE MADE: {choice}",
-        f"\nCHOICES MADE SO FAR: {len(choices_made)}",
-    ])
-
-    if should_end:
-        prompt_parts.extend([
-            "\nTASK: Create the FINAL segment that brings the story to a satisfying conclusion (150-200 words).",
-            "Resolve the adventure positively and show what the character learned.",
-        ])
-        if friends:
-            prompt_parts.append(f"Show how {character} and their friends {', '.join(friends)} worked together and what they learned.")
-
-        prompt_parts.extend([
-            "\nFORMAT YOUR RESPONSE EXACTLY AS JSON:",
-            "{",
-            '  "text": "The concluding story text...",',
-            '  "choices": null,',
-            '  "is_ending": true',
-            "}",
-        ])
-    else:
-        prompt_parts.extend([
-            "\nTASK: Continue the story based on their choice (150-200 words) and present new options.",
-        ])
-        if friends:
-            prompt_parts.append(f"Include interactions with {', '.join(friends)} to show friendship and teamwork.")
-
-        prompt_parts.extend([
-            "\nFORMAT YOUR RESPONSE EXACTLY AS JSON:",
-            "{",
-            '  "text": "The continuation text here...",',
-            '  "choices": [',
-            '    {"id": "choice1", "text": "Option 1", "description": "Brief description"},',
-            '    {"id": "choice2", "text": "Option 2", "description": "Brief description"},',
-            '    {"id": "choice3", "text": "Option 3", "description": "Brief description"}',
-            '  ],',
-            '  "is_ending": false',
-            "}",
-        ])
-
-    prompt_parts.append("\nIMPORTANT: Return ONLY valid JSON. No extra text.")
-    prompt = "\n".join(prompt_parts)
-
-    try:
-        if model is None:
-            raise RuntimeError("Model unavailable")
-        response = model.generate_content(prompt)
-        raw_text = getattr(response, "text", "").strip()
-
-        # Try to extract JSON from response
-        json_match = re.search(r'\{.*\}', raw_text, re.DOTALL)
-        if json_match:
-            raw_text = json_match.group(0)
-
-        result = json.loads(raw_text)
-        return jsonify(result), 200
-
-    except Exception as e:
-        logger.warning("Story continuation error: %s", e)
-        # Fallback response
-        friends_text = f" and {', '.join(friends)}" if friends else ""
-        if should_end:
-            return jsonify({
-                "text": f"Thanks to their brave choices, {character}{friends_text} completed the adventure successfully and returned home with wonderful memories and new confidence!",
-                "choices": None,
-                "is_ending": True
-            }), 200
-        else:
-            return jsonify({
-                "text": f"After choosing to {choice.lower()}, {character}{friends_text} discovered something wonderful that brought them closer to solving the mystery.",
-                "choices": [
-                    {"id": "choice1", "text": "Continue forward", "description": "Keep going with determination"},
-                    {"id": "choice2", "text": "Take a moment to think", "description": "Pause and consider the situation"}
-                ],
-                "is_ending": False
-            }), 200
+    prompt = _continuation_prompt(
+        character, theme, companion, friends, therapeutic_prompt,
+        _bounded_story_so_far(story_so_far), choice, len(choices_made), should_end,
+    )
+    result = _generate_interactive_segment(
+        prompt, _continuation_fallback(character, friends, choice, should_end), "Story continuation error"
+    )
+    return jsonify(result), 200
 
 
 @app.route("/generate-superhero", methods=["GET"])
@@ -829,18 +2158,34 @@ def generate_superhero():
     }), 200
 
 # --- Main execution ---
-@app.route("/extract-story-scenes", methods=["POST"])
-def extract_story_scenes():
-    """Extract key scenes from a story for illustration."""
-    payload = request.get_json(silent=True) or {}
-    story_text = payload.get("story_text", "")
-    character_name = payload.get("character_name", "the hero")
-    num_scenes = payload.get("num_scenes", 3)
-    
-    if not story_text:
-        return jsonify({"error": "story_text is required"}), 400
-    
-    prompt = f"""
+STORY_SCENES_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "scenes": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"title": {"type": "string"}, "description": {"type": "string"}},
+                "required": ["title", "description"],
+            },
+        },
+    },
+    "required": ["scenes"],
+}
+
+def _scenes_prompt(story_text, character_name, num_scenes, json_mode=None) -> str:
+    if json_mode is None:
+        json_mode = GEMINI_OUTPUT_MODE == "schema"
+    format_block = "" if json_mode else """
+Return ONLY valid JSON in this format:
+{
+  "scenes": [
+    {"title": "Scene title", "description": "Visual description here"},
+    ...
+  ]
+}
+"""
+    return f"""
 Analyze this children's story and extract {num_scenes} key visual scenes that would make great illustrations.
 
 Story:
@@ -850,31 +2195,36 @@ For each scene, provide:
 1. A brief title (3-5 words)
 2. A detailed visual description (2-3 sentences) focusing on what would be shown in the image
 3. The main character is: {character_name}
-
-Return ONLY valid JSON in this format:
-{{
-  "scenes": [
-    {{"title": "Scene title", "description": "Visual description here"}},
-    ...
-  ]
-}}
-
+{format_block}
 Focus on the most visually interesting and important moments. Make descriptions child-friendly and colorful.
 """
+
+@app.route("/extract-story-scenes", methods=["POST"])
+@admission("image")
+def extract_story_scenes():
+    """Extract key scenes from a story for illustration."""
+    payload = _json_body()
+    story_text = payload.get("story_text", "")
+    character_name = payload.get("character_name", "the hero")
+    num_scenes = payload.get("num_scenes", 3)
+    
+    if not story_text:
+        return jsonify({"error": "story_text is required"}), 400
+    
+    prompt = _scenes_prompt(story_text, character_name, num_scenes)
     
     try:
         if model is None:
             raise RuntimeError("Model unavailable")
         
-        response = model.generate_content(prompt)
-        raw_text = getattr(response, "text", "")
-        
-        # Try to extract JSON from response
-        json_match = re.search(r'\{.*\}', raw_text, re.DOTALL)
-        if json_match:
-            raw_text = json_match.group(0)
-        
-        result = json.loads(raw_text)
+        flight_key = (
+            "extract-story-scenes",
+            make_cache_key("extract-story-scenes", {"story_text": story_text, "character_name": character_name, "num_scenes": num_scenes}),
+        )
+        response, _ = single_flight.do(
+            flight_key, generation_service.generate, model, prompt, **_json_output(STORY_SCENES_SCHEMA)
+        )
+        result = extract_json(getattr(response, "text", ""), STORY_SCENES_SCHEMA)
         return jsonify(result), 200
         
     except Exception as e:
@@ -894,7 +2244,7 @@ Focus on the most visually interesting and important moments. Make descriptions
 @app.route("/generate-coloring-prompt", methods=["POST"])
 def generate_coloring_prompt():
     """Generate a prompt for a coloring book page."""
-    payload = request.get_json(silent=True) or {}
+    payload = _json_body()
     scene_description = payload.get("scene_description", "")
     character_name = payload.get("character_name", "a child")
     
@@ -977,7 +2327,15 @@ def setup_test_account():
             "message": "Isabella's test account created with everything unlocked!"
         }), 201
 
+def create_app() -> Flask:
+    """
+    The WSGI app, for servers that load an app factory (``gunicorn "app:create_app()"``).
+
+    Importing this module is cheap: the Gemini client, the database schema and
+    every background thread are set up on first use in each worker process.
+    """
+    return app
+
 if __name__ == "__main__":
-    print("*** Enhanced Story Engine Starting...")
-    print("*** Now with advanced character development, plot structures, and companion dynamics!")
-    app.run(host="0.0.0.0", port=5000, debug=False)
+    logger.warning("Flask development server; use `python run.py` for production")
+    create_app().run(host="0.0.0.0", port=5000, debug=False)
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Benchmark: N single-character calls vs one /characters/bulk call
+
+Runs against a scratch SQLite file (never characters.db) through Flask's test
+client, so the numbers measure the handler + commit cost without HTTP overhead.
+
+Usage:
+    python benchmarks/bench_bulk_characters.py [--count 200]
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def timed(label, fn):
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    print(f"  {label:<32} {elapsed * 1000:9.1f} ms")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=200, help="characters per phase (max 500 for bulk)")
+    args = parser.parse_args()
+
+    scratch = tempfile.mkdtemp(prefix="bench_bulk_")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(scratch, 'bench.db')}"
+    os.environ.setdefault("STORY_CACHE_BACKEND", "off")
+    sys.path.insert(0, BACKEND_DIR)
+    import app as story_app  # noqa: E402  (must follow DATABASE_URL)
+
+    client = story_app.app.test_client()
+    n = args.count
+    payloads = [{"name": f"Bench {i}", "age": 6 + i % 5, "likes": "dragons, space", "fears": ["the dark"]} for i in range(n)]
+
+    print(f"\n{n} characters, scratch SQLite DB\n")
+
+    print("Individual requests (one commit each):")
+    ids = []
+
+    def create_each():
+        for p in payloads:
+            ids.append(client.post("/create-character", json=p).get_json()["id"])
+
+    def update_each():
+        for char_id in ids:
+            client.patch(f"/characters/{char_id}", json={"goals": ["read a chapter book"]})
+
+    def delete_each():
+        for char_id in ids:
+            client.delete(f"/characters/{char_id}")
+
+    single = [timed("create", create_each), timed("update", update_each), timed("delete", delete_each)]
+
+    print("\n/characters/bulk (one transaction):")
+    bulk_ids = []
+
+    def create_bulk():
+        body = client.post("/characters/bulk", json={"operations": [{"op": "upsert", "character": p} for p in payloads]}).get_json()
+        bulk_ids.extend(r["id"] for r in body["results"])
+
+    def update_bulk():
+        ops = [{"op": "upsert", "character": {"id": i, "goals": ["read a chapter book"]}} for i in bulk_ids]
+        client.post("/characters/bulk", json={"operations": ops})
+
+    def delete_bulk():
+        client.post("/characters/bulk", json={"operations": [{"op": "delete", "id": i} for i in bulk_ids]})
+
+    bulk = [timed("create", create_bulk), timed("update", update_bulk), timed("delete", delete_bulk)]
+
+    print("\nSpeedup:")
+    for label, s, b in zip(("create", "update", "delete"), single, bulk):
+        print(f"  {label:<32} {s / b:9.1f}x")
+    print(f"  {'total':<32} {sum(single) / sum(bulk):9.1f}x\n")
+    shutil.rmtree(scratch, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
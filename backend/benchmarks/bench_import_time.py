@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Benchmark: cold import time of the app (what every worker spawn and test run pays)
+
+Imports ``app`` in fresh interpreters with ``python -X importtime`` and reports
+the median wall-clock import time, the slowest modules by cumulative import
+time, and the time of the first request (/health), where lazily built clients
+and the schema are now set up. Doubles as a guard: exits non-zero when the
+import exceeds ``--max-ms`` or pulls in a module that must stay lazy.
+
+Usage:
+    python benchmarks/bench_import_time.py [--runs 5] [--top 10] [--max-ms 0] [--json]
+"""
+
+import argparse
+import json
+import os
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Heavy dependencies that only the first model call or image job may import
+MUST_STAY_LAZY = ("google.generativeai", "grpc", "PIL")
+
+_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+loaded = [name for name in %r if name in sys.modules]
+app.app.test_client().get("/health")
+first_request = time.perf_counter()
+print(json.dumps({
+    "import_ms": (imported - started) * 1000,
+    "first_request_ms": (first_request - imported) * 1000,
+    "loaded": loaded,
+}))
+""" % (MUST_STAY_LAZY,)
+
+# "import time: self [us] | cumulative | imported package"
+_IMPORTTIME_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def _run_once(env: dict) -> tuple[dict, list]:
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _PROBE],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, timeout=120,
+    )
+    if proc.returncode != 0:
+        raise SystemExit(f"import failed:\n{proc.stderr[-2000:]}")
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    modules = []
+    for line in proc.stderr.splitlines():
+        match = _IMPORTTIME_RE.match(line)
+        if match:
+            modules.append((int(match.group(2)), len(match.group(3)), match.group(4)))
+    return result, modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="slowest modules imported by app to list")
+    parser.add_argument("--max-ms", type=float, default=0, help="fail when the median import is slower (0 = off)")
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    scratch = tempfile.mkdtemp(prefix="bench_import_")
+    env = {
+        **os.environ,
+        "DATABASE_URL": f"sqlite:///{os.path.join(scratch, 'bench.db')}",
+        "STORY_CACHE_PATH": os.path.join(scratch, "story_cache.db"),
+        "RATE_LIMIT_PATH": os.path.join(scratch, "rate_limits.db"),
+        "JOB_QUEUE_PATH": os.path.join(scratch, "jobs.db"),
+        "IMAGE_STORE_DIR": os.path.join(scratch, "images"),
+        "GEMINI_API_KEY": os.environ.get("GEMINI_API_KEY", "bench-placeholder-key"),  # exercise the model path
+    }
+
+    try:
+        runs = [_run_once(env) for _ in range(args.runs)]
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+    import_ms = [result["import_ms"] for result, _ in runs]
+    first_request_ms = [result["first_request_ms"] for result, _ in runs]
+    # Modules app imports directly (one nesting level, three spaces of indent) in the last run, slowest first
+    _, modules = runs[-1]
+    top = sorted(((cum, name) for cum, depth, name in modules if depth == 3), reverse=True)[: args.top]
+    loaded = runs[-1][0]["loaded"]
+
+    results = {
+        "runs": args.runs,
+        "import_ms_p50": round(statistics.median(import_ms), 1),
+        "import_ms_min": round(min(import_ms), 1),
+        "first_request_ms_p50": round(statistics.median(first_request_ms), 1),
+        "slowest_imports_ms": {name: round(cum / 1000, 1) for cum, name in top},
+        "lazy_modules_loaded": loaded,
+    }
+    failures = []
+    if loaded:
+        failures.append(f"imported at startup: {', '.join(loaded)}")
+    if args.max_ms and results["import_ms_p50"] > args.max_ms:
+        failures.append(f"import took {results['import_ms_p50']} ms (limit {args.max_ms} ms)")
+    results["ok"] = not failures
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"\nimport app: p50 {results['import_ms_p50']} ms, min {results['import_ms_min']} ms "
+              f"over {args.runs} fresh interpreters")
+        print(f"first request (/health): p50 {results['first_request_ms_p50']} ms\n")
+        print(f"  {'module':<40} {'cumulative ms':>14}")
+        for name, ms in results["slowest_imports_ms"].items():
+            print(f"  {name:<40} {ms:>14}")
+        print()
+        for failure in failures:
+            print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Benchmark: json_extract.extract_json vs the old greedy-regex + json.loads parsing
+
+Builds a seeded fuzz corpus of model-shaped responses (interactive segments and
+scene lists) with the defects seen in practice: code fences, prose around the
+JSON, braces in trailing prose, a second object, trailing commas, smart quotes,
+Python literals, raw newlines in strings, and truncated output. Reports the
+success rate per defect and the mean time per response for both parsers.
+
+A response counts as parsed when the result equals the object the model meant
+to send, or, for truncated responses, is schema-valid.
+
+Usage:
+    python benchmarks/bench_json_extract.py [--count 2000] [--seed 7] [--dump corpus.jsonl] [--json]
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from json_extract import JSONExtractionError, extract_json, validate  # noqa: E402
+
+SEGMENT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "text": {"type": "string"},
+        "choices": {"type": "array", "nullable": True, "items": {"type": "object", "required": ["text"]}},
+        "is_ending": {"type": "boolean"},
+    },
+    "required": ["text"],
+}
+SCENES_SCHEMA = {
+    "type": "object",
+    "properties": {"scenes": {"type": "array", "items": {"type": "object", "required": ["title", "description"]}}},
+    "required": ["scenes"],
+}
+
+WORDS = ("the dragon glowed softly while Mia counted stars above the quiet harbor and "
+         "Leo whispered about maps, brave hearts, lanterns and a door made of moonlight").split()
+
+
+def legacy_parse(raw_text):
+    json_match = re.search(r'\{.*\}', raw_text, re.DOTALL)
+    if json_match:
+        raw_text = json_match.group(0)
+    return json.loads(raw_text)
+
+
+def _sentence(rng, words=12):
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def _payload(rng):
+    if rng.random() < 0.6:
+        value = {
+            "text": " ".join(_sentence(rng) for _ in range(rng.randint(6, 14))),
+            "choices": [
+                {"id": f"choice{i}", "text": _sentence(rng, 4), "description": _sentence(rng, 8)}
+                for i in range(1, 4)
+            ],
+            "is_ending": False,
+        }
+        return value, SEGMENT_SCHEMA
+    value = {"scenes": [{"title": _sentence(rng, 3), "description": _sentence(rng, 25)} for _ in range(3)]}
+    return value, SCENES_SCHEMA
+
+
+def _mutate(kind, value, rng):
+    body = json.dumps(value, indent=rng.choice((None, 2)), ensure_ascii=False)
+    if kind == "clean":
+        return body
+    if kind == "fenced":
+        return f"```json\n{body}\n```"
+    if kind == "prose_around":
+        return f"Here is your story!\n\n{body}\n\nI hope the children enjoy it."
+    if kind == "braces_in_prose":
+        return f"{body}\n\nTip: you can add more choices later {{like a fourth option}}."
+    if kind == "two_objects":
+        return json.dumps({"thinking": "Plan the next scene first."}) + "\n" + body
+    if kind == "trailing_comma":
+        return re.sub(r'(["\]}el])(\s*)([}\]])', r"\1,\2\3", body, count=3)
+    if kind == "smart_quotes":
+        return re.sub(r'"([a-z_]+)":', r"“\1”:", body)
+    if kind == "python_literals":
+        return body.replace("false", "False").replace("true", "True")
+    if kind == "raw_newlines":
+        # Unescaped line breaks inside a string value (strict JSON rejects these); the expected value has them too
+        if "text" in value:
+            value["text"] = value["text"].replace(". ", ".\n", 3)
+        else:
+            value["scenes"][0]["description"] = value["scenes"][0]["description"].replace(" ", "\n", 3)
+        return json.dumps(value, indent=2, ensure_ascii=False).replace("\\n", "\n")
+    if kind == "truncated":
+        return body[: int(len(body) * rng.uniform(0.55, 0.95))]
+    raise ValueError(kind)
+
+
+KINDS = ("clean", "fenced", "prose_around", "braces_in_prose", "two_objects", "trailing_comma",
+         "smart_quotes", "python_literals", "raw_newlines", "truncated")
+
+
+def build_corpus(count, seed):
+    rng = random.Random(seed)
+    corpus = []
+    for i in range(count):
+        kind = KINDS[i % len(KINDS)]
+        value, schema = _payload(rng)
+        corpus.append({"kind": kind, "text": _mutate(kind, value, rng), "expected": value, "schema": schema})
+    return corpus
+
+
+def _ok(result, case):
+    if not isinstance(result, dict):
+        return False
+    if case["kind"] == "truncated":
+        return not validate(result, case["schema"])
+    return result == case["expected"]
+
+
+def run(parser, corpus, use_schema):
+    per_kind = {kind: [0, 0] for kind in KINDS}
+    start = time.perf_counter()
+    for case in corpus:
+        try:
+            result = parser(case["text"], case["schema"]) if use_schema else parser(case["text"])
+        except (ValueError, JSONExtractionError):
+            result = None
+        per_kind[case["kind"]][1] += 1
+        if _ok(result, case):
+            per_kind[case["kind"]][0] += 1
+    elapsed = time.perf_counter() - start
+    ok = sum(v[0] for v in per_kind.values())
+    return {
+        "success_rate": round(ok / len(corpus), 3),
+        "us_per_response": round(elapsed / len(corpus) * 1e6, 1),
+        "by_kind": {kind: round(v[0] / v[1], 3) if v[1] else None for kind, v in per_kind.items()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--dump", help="write the fuzz corpus to this JSONL file")
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    corpus = build_corpus(args.count, args.seed)
+    if args.dump:
+        with open(args.dump, "w", encoding="utf-8") as f:
+            for case in corpus:
+                f.write(json.dumps({k: case[k] for k in ("kind", "text", "expected")}, ensure_ascii=False) + "\n")
+
+    # Clean-only timing isolates the fast path from the repair work
+    clean = [c for c in corpus if c["kind"] in ("clean", "fenced", "prose_around")]
+    results = {
+        "legacy_regex": run(legacy_parse, corpus, use_schema=False),
+        "extract_json": run(extract_json, corpus, use_schema=True),
+        "clean_only_us": {
+            "legacy_regex": run(legacy_parse, clean, use_schema=False)["us_per_response"],
+            "extract_json": run(extract_json, clean, use_schema=True)["us_per_response"],
+            "extract_json_no_schema": run(extract_json, clean, use_schema=False)["us_per_response"],
+        },
+    }
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    legacy, new = results["legacy_regex"], results["extract_json"]
+    print(f"\n{len(corpus)} responses, seed {args.seed}\n")
+    print(f"  {'defect':<18} {'legacy':>8} {'extract':>8}")
+    for kind in KINDS:
+        print(f"  {kind:<18} {legacy['by_kind'][kind]:>8.0%} {new['by_kind'][kind]:>8.0%}")
+    print(f"  {'all':<18} {legacy['success_rate']:>8.0%} {new['success_rate']:>8.0%}\n")
+    print(f"  {'us/response (all)':<18} {legacy['us_per_response']:>8} {new['us_per_response']:>8}")
+    clean_us = results["clean_only_us"]
+    print(f"  {'us/response (clean)':<18} {clean_us['legacy_regex']:>8} {clean_us['extract_json']:>8}"
+          f"   ({clean_us['extract_json_no_schema']} without schema validation)\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Benchmark: request throughput of the launchers in run.py (dev server, waitress, gunicorn)
+
+Starts each server on a scratch database, seeds characters, then drives a fixed
+number of concurrent clients over a mix of read routes (/health, themes,
+character list, story search) for a fixed time. Reports requests per second and
+p50/p95/p99 latency per server. Servers that are not installed are skipped.
+
+Usage:
+    python benchmarks/bench_servers.py [--servers dev,waitress,gunicorn] [--clients 16]
+                                       [--seconds 10] [--workers N] [--threads 8] [--json]
+"""
+
+import argparse
+import json
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ROUTES = ("/health", "/get-story-themes", "/get-characters?limit=20", "/stories/search?q=dragon")
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_until_up(base_url: str, proc: subprocess.Popen, timeout: float = 30.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"server exited with {proc.returncode}")
+        try:
+            requests.get(f"{base_url}/get-story-themes", timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.2)
+    raise RuntimeError("server did not start")
+
+
+def _percentile(sorted_values: list, pct: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * pct / 100))]
+
+
+def _drive(base_url: str, clients: int, seconds: float) -> dict:
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+    stop_at = time.perf_counter() + seconds
+
+    def client(offset: int):
+        session = requests.Session()
+        i = offset
+        while time.perf_counter() < stop_at:
+            started = time.perf_counter()
+            try:
+                ok = session.get(base_url + ROUTES[i % len(ROUTES)], timeout=30).status_code == 200
+            except requests.RequestException:
+                ok = False
+            elapsed = time.perf_counter() - started
+            with lock:
+                if ok:
+                    latencies.append(elapsed)
+                else:
+                    errors[0] += 1
+            i += 1
+
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors[0],
+        "rps": round(len(latencies) / wall, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 1) if latencies else None,
+        "p95_ms": round(_percentile(latencies, 95) * 1000, 1) if latencies else None,
+        "p99_ms": round(_percentile(latencies, 99) * 1000, 1) if latencies else None,
+    }
+
+
+def _bench_server(server: str, args) -> dict:
+    scratch = tempfile.mkdtemp(prefix=f"bench_{server}_")
+    port = _free_port()
+    env = {
+        **os.environ,
+        "DATABASE_URL": f"sqlite:///{os.path.join(scratch, 'bench.db')}",
+        "JOB_QUEUE_PATH": os.path.join(scratch, "jobs.db"),
+        "IMAGE_STORE_DIR": os.path.join(scratch, "images"),
+        "STORY_CACHE_BACKEND": "off",
+        "RATE_LIMIT_BACKEND": "off",
+        "GUNICORN_ACCESS_LOG": "",
+        "WEB_THREADS": str(args.threads),
+    }
+    if args.workers:
+        env["WEB_CONCURRENCY"] = str(args.workers)
+    proc = subprocess.Popen(
+        [sys.executable, os.path.join(BACKEND_DIR, "run.py"), "--server", server,
+         "--host", "127.0.0.1", "--port", str(port)],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        _wait_until_up(base_url, proc)
+        session = requests.Session()
+        for i in range(args.characters):
+            session.post(f"{base_url}/create-character", json={"name": f"Bench {i}", "age": 6 + i % 5})
+        _drive(base_url, args.clients, min(2.0, args.seconds))  # warm up every worker
+        return _drive(base_url, args.clients, args.seconds)
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+def _installed(server: str) -> bool:
+    if server == "dev":
+        return True
+    if server == "gunicorn" and sys.platform == "win32":
+        return False
+    import importlib.util
+
+    return importlib.util.find_spec(server) is not None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--servers", default="dev,waitress,gunicorn")
+    parser.add_argument("--clients", type=int, default=16, help="concurrent client threads")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--workers", type=int, help="gunicorn worker processes (default from gunicorn.conf.py)")
+    parser.add_argument("--threads", type=int, default=8, help="threads per worker")
+    parser.add_argument("--characters", type=int, default=200, help="characters seeded before the run")
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    results = {"clients": args.clients, "seconds": args.seconds, "cpus": os.cpu_count(), "servers": {}}
+    for server in args.servers.split(","):
+        if not _installed(server):
+            results["servers"][server] = None
+            continue
+        results["servers"][server] = _bench_server(server, args)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"\n{args.clients} clients for {args.seconds:g}s, {results['cpus']} CPU(s), routes: {', '.join(ROUTES)}\n")
+    print(f"  {'server':<10} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for server, r in results["servers"].items():
+        if r is None:
+            print(f"  {server:<10} (not installed)")
+            continue
+        print(f"  {server:<10} {r['rps']:>8} {r['p50_ms']:>8} {r['p95_ms']:>8} {r['p99_ms']:>8} {r['errors']:>7}")
+    print()
+
+
+if __name__ == "__main__":
+    main()
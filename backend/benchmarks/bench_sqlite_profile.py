@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Benchmark: SQLite storage profiles under concurrent load
+
+For each STORAGE_PROFILE, runs reader and writer threads against a scratch
+database shaped like the character table and reports read/write throughput
+and lock errors. The engine is built with the same storage.engine_options()
+and install_sqlite_pragmas() the app uses.
+
+Usage:
+    python benchmarks/bench_sqlite_profile.py [--seconds 5] [--readers 8] [--writers 4] [--json]
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, Text, create_engine, select
+from sqlalchemy.exc import OperationalError, TimeoutError as PoolTimeoutError
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from storage import STORAGE_PROFILES, engine_options, install_sqlite_pragmas  # noqa: E402
+
+metadata = MetaData()
+characters = Table(
+    "character",
+    metadata,
+    Column("id", String(36), primary_key=True),
+    Column("name", String(100), nullable=False),
+    Column("age", Integer, nullable=False),
+    Column("likes", Text),
+    Column("fears", Text),
+    Column("created_at", DateTime, index=True),
+)
+
+
+def run_profile(profile: str, seconds: float, readers: int, writers: int, seed_rows: int) -> dict:
+    scratch = tempfile.mkdtemp(prefix=f"bench_{profile}_")
+    uri = f"sqlite:///{os.path.join(scratch, 'bench.db')}"
+    os.environ["WEB_THREADS"] = str(readers + writers)
+    engine = create_engine(uri, **engine_options(uri, profile))
+    install_sqlite_pragmas(engine, profile)
+    metadata.create_all(engine)
+
+    with engine.begin() as conn:
+        conn.execute(characters.insert(), [_row(i) for i in range(seed_rows)])
+
+    counts = {"reads": 0, "writes": 0, "errors": 0}
+    lock = threading.Lock()
+    stop = threading.Event()
+
+    def bump(key):
+        with lock:
+            counts[key] += 1
+
+    def reader():
+        query = select(characters.c.id, characters.c.name).order_by(characters.c.created_at.desc()).limit(50)
+        while not stop.is_set():
+            try:
+                with engine.connect() as conn:
+                    conn.execute(query).fetchall()
+                bump("reads")
+            except (OperationalError, PoolTimeoutError):
+                bump("errors")
+
+    def writer():
+        i = 0
+        while not stop.is_set():
+            i += 1
+            try:
+                with engine.begin() as conn:
+                    conn.execute(characters.insert(), _row(i))
+                bump("writes")
+            except (OperationalError, PoolTimeoutError):
+                bump("errors")
+
+    threads = [threading.Thread(target=reader) for _ in range(readers)]
+    threads += [threading.Thread(target=writer) for _ in range(writers)]
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+
+    engine.dispose()
+    shutil.rmtree(scratch, ignore_errors=True)
+    return {
+        "profile": profile,
+        "reads_per_sec": round(counts["reads"] / seconds, 1),
+        "writes_per_sec": round(counts["writes"] / seconds, 1),
+        "errors": counts["errors"],
+    }
+
+
+def _row(i: int) -> dict:
+    return {
+        "id": str(uuid.uuid4()),
+        "name": f"Bench {i}",
+        "age": 5 + i % 6,
+        "likes": json.dumps(["dragons", "space"]),
+        "fears": json.dumps(["the dark"]),
+        "created_at": datetime.now(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--seed-rows", type=int, default=2000)
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    results = [
+        run_profile(profile, args.seconds, args.readers, args.writers, args.seed_rows)
+        for profile in STORAGE_PROFILES
+    ]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"\n{args.readers} readers + {args.writers} writers, {args.seconds:g}s per profile\n")
+    print(f"  {'profile':<12} {'reads/s':>10} {'writes/s':>10} {'errors':>8}")
+    for r in results:
+        print(f"  {r['profile']:<12} {r['reads_per_sec']:>10} {r['writes_per_sec']:>10} {r['errors']:>8}")
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Benchmark: story library search, FTS5 index vs LIKE scan
+
+Fills a scratch database with generated-looking stories through the app's own
+writer path, then times GET /stories/search (via the Flask test client) with
+the FTS5 index and with the LIKE fallback used when FTS5 is unavailable.
+
+Usage:
+    python benchmarks/bench_story_search.py [--stories 5000] [--queries 200] [--json]
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+WORDS = ("dragon castle moon river brave lantern forest ocean star whisper garden robot "
+         "kitten rainbow mountain secret friend courage giggle puddle treasure map cloud").split()
+# Story text draws mostly from a long tail of filler words, as real prose does
+FILLER = [f"{a}{b}" for a in ("ba", "ko", "mi", "ru", "se", "ta", "vo", "ze") for b in
+          ("lin", "mar", "dop", "sky", "fen", "wig", "tor", "pel", "nub", "gar", "lix", "quo")] * 3
+QUERIES = ("brave dragon", "lantern", "secret treasure map", "kit", "ocean friend", "rainbow courage",
+           "story 4242", "unicorn")  # the last two match one story and none: a LIKE scan reads every row
+
+
+def _story(rng, i):
+    return {
+        "source": "generate-story",
+        "character_id": None,
+        "character_name": rng.choice(("Mia", "Leo", "Ava", "Noah")),
+        "theme": rng.choice(("Space", "Ocean", "Magic", "Dragons")),
+        "title": f"The {rng.choice(WORDS).title()} and the {rng.choice(WORDS).title()}",
+        "story_text": " ".join(
+            rng.choice(WORDS) if rng.random() < 0.03 else rng.choice(FILLER) for _ in range(rng.randint(250, 450))
+        ) + ".",
+        "wisdom_gem": f"Story {i}: being {rng.choice(WORDS)} takes courage.",
+    }
+
+
+def _time_queries(client, queries):
+    timings = []
+    for q in queries:
+        started = time.perf_counter()
+        response = client.get("/stories/search", query_string={"q": q, "limit": 20})
+        timings.append((time.perf_counter() - started) * 1000)
+        assert response.status_code == 200, response.get_json()
+    timings.sort()
+    return {
+        "p50_ms": round(statistics.median(timings), 2),
+        "p95_ms": round(timings[int(len(timings) * 0.95) - 1], 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stories", type=int, default=5000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    scratch = tempfile.mkdtemp(prefix="bench_search_")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(scratch, 'bench.db')}"
+    os.environ.setdefault("STORY_CACHE_BACKEND", "off")
+    os.environ.setdefault("IMAGE_STORE_DIR", os.path.join(scratch, "images"))
+    os.environ.setdefault("JOB_QUEUE_PATH", os.path.join(scratch, "jobs.db"))
+    sys.path.insert(0, BACKEND_DIR)
+    import app as story_app  # noqa: E402  (must follow DATABASE_URL)
+    story_app.init_db()  # the writer thread runs outside any request
+
+    rng = random.Random(7)
+    started = time.perf_counter()
+    for i in range(args.stories):
+        story_app.story_writer.submit(_story(rng, i))
+    story_app.story_writer.flush(timeout=600)
+    write_s = time.perf_counter() - started
+
+    client = story_app.app.test_client()
+    queries = [QUERIES[i % len(QUERIES)] for i in range(args.queries)]
+    results = {
+        "stories": args.stories,
+        "write_per_story_ms": round(write_s / args.stories * 1000, 3),
+        "fts5": _time_queries(client, queries) if story_app.story_fts_enabled else None,
+    }
+    story_app.story_fts_enabled = False
+    results["like_scan"] = _time_queries(client, queries[: max(10, args.queries // 10)])
+    shutil.rmtree(scratch, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"\n{args.stories} stories (saved in background batches: {results['write_per_story_ms']} ms/story)\n")
+    print(f"  {'search':<10} {'p50 ms':>8} {'p95 ms':>8}")
+    for name in ("fts5", "like_scan"):
+        if results[name]:
+            print(f"  {name:<10} {results[name]['p50_ms']:>8} {results[name]['p95_ms']:>8}")
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Benchmark: prompt tokens with hand-written JSON format instructions vs Gemini JSON mode
+
+Builds the interactive-story and scene-extraction prompts exactly as the routes
+do, once with GEMINI_OUTPUT_MODE=prompt (format block in the prompt) and once
+with schema mode (format enforced by response_schema), and counts their tokens.
+
+Tokens come from the Gemini count_tokens API when GEMINI_API_KEY is set, and are
+otherwise estimated at ~4 characters per token.
+
+Usage:
+    python benchmarks/bench_structured_prompts.py [--json]
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SAMPLE_STORY = " ".join([
+    "Mia packed her star map, a flashlight and a peanut butter sandwich.",
+    "Her dragon friend Ember yawned a tiny puff of smoke and followed her to the hill behind the school.",
+    "At the top they found a silver door standing all by itself in the grass.",
+    "When Mia knocked, the door hummed like a song and swung open onto a sky full of floating islands.",
+    "They hopped from island to island, helping a lost cloud find its way home and sharing the sandwich with a hungry comet.",
+    "By sunset Mia realized that being brave did not mean never feeling scared; it meant taking one more step anyway.",
+] * 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    scratch = tempfile.mkdtemp(prefix="bench_prompts_")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(scratch, 'bench.db')}"
+    os.environ.setdefault("STORY_CACHE_BACKEND", "off")
+    os.environ.setdefault("IMAGE_STORE_DIR", os.path.join(scratch, "images"))
+    sys.path.insert(0, BACKEND_DIR)
+    import app as story_app  # noqa: E402  (must follow DATABASE_URL)
+
+    if story_app.model is not None:
+        counter = "count_tokens"
+
+        def count(prompt):
+            return story_app.model.count_tokens(prompt).total_tokens
+    else:
+        counter = "estimate (chars / 4)"
+
+        def count(prompt):
+            return round(len(prompt) / 4)
+
+    hero = ("Mia", "Space", "Ember the dragon", ["Leo"], "Building confidence when trying new things.")
+    story_so_far = SAMPLE_STORY[:900]
+    cases = {
+        "interactive opening": lambda mode: story_app._opening_prompt(*hero, json_mode=mode),
+        "interactive continue": lambda mode: story_app._continuation_prompt(
+            *hero, story_so_far, "Knock on the silver door", 1, False, json_mode=mode),
+        "interactive ending": lambda mode: story_app._continuation_prompt(
+            *hero, story_so_far, "Follow the comet home", 3, True, json_mode=mode),
+        "scene extraction": lambda mode: story_app._scenes_prompt(SAMPLE_STORY, "Mia", 3, json_mode=mode),
+    }
+
+    results = []
+    for name, build in cases.items():
+        before, after = count(build(False)), count(build(True))
+        results.append({
+            "prompt": name,
+            "format_in_prompt": before,
+            "json_mode": after,
+            "saved": before - after,
+            "saved_pct": round((before - after) / before * 100, 1),
+        })
+    shutil.rmtree(scratch, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps({"counter": counter, "results": results}, indent=2))
+        return
+
+    print(f"\nPrompt tokens ({counter})\n")
+    print(f"  {'prompt':<22} {'format block':>12} {'JSON mode':>10} {'saved':>8}")
+    for r in results:
+        print(f"  {r['prompt']:<22} {r['format_in_prompt']:>12} {r['json_mode']:>10} {r['saved_pct']:>7}%")
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,539 @@
+#!/usr/bin/env python3
+"""
+Load test: concurrent traffic through every API route against a local stub Gemini
+
+Starts the server (through run.py) with GEMINI_MODEL=stub and the "stub" image
+provider, so no API key or network is needed and model latency/failures are
+under control. Concurrent clients then run a weighted mix of user flows over
+every route (stories, streaming, interactive sessions, characters, library,
+image jobs) for a fixed time. The report covers:
+
+  - p50/p95/p99 latency, requests per second and errors, overall and per route
+  - server memory (RSS of the whole process tree): start, peak and end
+  - the server's own /health counters (generation, caches, image providers)
+
+Results are JSON (``--json`` or ``--out``). ``--compare`` diffs a run against a
+saved one and exits non-zero when p95 latency or throughput regresses by more
+than ``--max-regression`` percent, so it can gate a change.
+
+Usage:
+    python benchmarks/load_test.py [--clients 32] [--seconds 30] [--server auto|gunicorn|waitress|dev]
+        [--llm-latency 0.5] [--llm-failure-rate 0] [--image-latency 1.0] [--image-failure-rate 0]
+        [--routes generate_story,health,...] [--out run.json] [--compare baseline.json] [--json]
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+NAMES = ("Mia", "Leo", "Ava", "Noah", "Zara", "Finn", "Ivy", "Omar", "Luna", "Kai")
+THEMES = ("Adventure", "Friendship", "Magic", "Dragons", "Space", "Ocean")
+SAMPLE_STORY = (
+    "Mia found a glowing lantern by the river. She carried it into the dark forest, "
+    "where a shy dragon was hiding. Together they lit the way home and shared the light. "
+) * 4
+
+
+# ----------------------
+# Recording
+# ----------------------
+class Recorder:
+    """Thread-safe per-route latency and status bookkeeping."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.routes = {}  # name -> {"latencies": [...], "errors": n, "throttled": n}
+
+    def add(self, route: str, status: int | None, seconds: float):
+        with self._lock:
+            entry = self.routes.setdefault(route, {"latencies": [], "errors": 0, "throttled": 0})
+            if status == 429:
+                entry["throttled"] += 1
+            elif status is None or status >= 500 or status in (400, 404):
+                entry["errors"] += 1
+            else:
+                entry["latencies"].append(seconds)
+
+
+def _percentile_ms(sorted_values: list, pct: float) -> float | None:
+    if not sorted_values:
+        return None
+    return round(sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * pct / 100))] * 1000, 1)
+
+
+def _summarize(latencies: list, errors: int, throttled: int, wall: float) -> dict:
+    latencies = sorted(latencies)
+    return {
+        "requests": len(latencies) + errors + throttled,
+        "ok": len(latencies),
+        "errors": errors,
+        "throttled": throttled,
+        "rps": round(len(latencies) / wall, 2),
+        "p50_ms": round(statistics.median(latencies) * 1000, 1) if latencies else None,
+        "p95_ms": _percentile_ms(latencies, 95),
+        "p99_ms": _percentile_ms(latencies, 99),
+    }
+
+
+# ----------------------
+# User flows
+# ----------------------
+class Client:
+    """One simulated user: a session, a random source and shared state (known IDs)."""
+
+    def __init__(self, base_url: str, recorder: Recorder, shared: dict, seed: int):
+        self.base_url = base_url
+        self.recorder = recorder
+        self.shared = shared
+        self.rng = random.Random(seed)
+        self.session = requests.Session()
+
+    def call(self, route: str, method: str, path: str, stream: bool = False, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = self.session.request(method, self.base_url + path, timeout=120, stream=stream, **kwargs)
+            if stream:
+                for _ in response.iter_content(chunk_size=None):
+                    pass  # time the whole stream, not just the first byte
+            status = response.status_code
+        except requests.RequestException:
+            response, status = None, None
+        self.recorder.add(route, status, time.perf_counter() - started)
+        return response if status and status < 400 else None
+
+    def _known(self, key: str):
+        with self.shared["lock"]:
+            values = self.shared[key]
+            return self.rng.choice(values) if values else None
+
+    def _remember(self, key: str, value):
+        with self.shared["lock"]:
+            self.shared[key].append(value)
+            del self.shared[key][:-500]
+
+    def _story_payload(self) -> dict:
+        # A small name/theme space, so some requests repeat and hit the story cache
+        return {"character": self.rng.choice(NAMES), "theme": self.rng.choice(THEMES), "character_age": 7}
+
+    # Each flow is one user action; some take several requests
+    def health(self):
+        self.call("health", "GET", "/health")
+
+    def story_themes(self):
+        self.call("get_story_themes", "GET", "/get-story-themes")
+
+    def generate_story(self):
+        response = self.call("generate_story", "POST", "/generate-story", json=self._story_payload())
+        if response is not None:
+            self._remember("stories", response.json())
+
+    def generate_story_stream(self):
+        self.call("generate_story_stream", "POST", "/generate-story?stream=1", stream=True,
+                  json={**self._story_payload(), "seed": self.rng.randint(0, 10**6)})
+
+    def continue_story(self):
+        story = self._known("stories") or {"title": "The Lantern", "story_text": SAMPLE_STORY}
+        self.call("continue_story", "POST", "/continue-story", json={
+            **self._story_payload(), "previous_title": story.get("title"),
+            "previous_story": story.get("story_text", SAMPLE_STORY), "chapter_number": 2,
+        })
+
+    def multi_character_story(self):
+        ids = [self._known("characters") for _ in range(2)]
+        if None in ids:
+            return self.create_character()
+        self.call("generate_multi_character_story", "POST", "/generate-multi-character-story",
+                  json={"character_ids": ids, "main_character_id": ids[0], "theme": self.rng.choice(THEMES)})
+
+    def interactive_story(self):
+        response = self.call("generate_interactive_story", "POST", "/generate-interactive-story",
+                             json=self._story_payload())
+        if response is None:
+            return
+        segment = response.json()
+        for _ in range(2):
+            if segment.get("is_ending") or not segment.get("choices"):
+                return
+            choice = self.rng.choice(segment["choices"])
+            response = self.call("continue_interactive_story", "POST", "/continue-interactive-story",
+                                 json={"session_id": segment["session_id"], "choice_id": choice.get("id")})
+            if response is None:
+                return
+            segment = response.json()
+
+    def create_character(self):
+        response = self.call("create_character", "POST", "/create-character", json={
+            "name": self.rng.choice(NAMES), "age": self.rng.randint(4, 10), "hair": "brown",
+            "likes": ["dragons", "space"], "fears": ["the dark"],
+        })
+        if response is not None:
+            self._remember("characters", response.json()["id"])
+
+    def update_character(self):
+        char_id = self._known("characters")
+        if char_id:
+            self.call("update_character", "PATCH", f"/characters/{char_id}",
+                      json={"goals": [self.rng.choice(("read a book", "ride a bike", "make a friend"))]})
+
+    def get_character(self):
+        char_id = self._known("characters")
+        if char_id:
+            self.call("get_character", "GET", f"/characters/{char_id}")
+
+    def list_characters(self):
+        self.call("get_characters", "GET", "/get-characters?limit=20")
+
+    def bulk_characters(self):
+        self.call("bulk_characters", "POST", "/characters/bulk", json={"operations": [
+            {"op": "upsert", "character": {"name": self.rng.choice(NAMES), "age": 6}} for _ in range(5)
+        ]})
+
+    def delete_character(self):
+        response = self.call("create_character", "POST", "/create-character",
+                             json={"name": "Temp", "age": 5})
+        if response is not None:
+            self.call("delete_character", "DELETE", f"/characters/{response.json()['id']}")
+
+    def superhero(self):
+        self.call("generate_superhero", "GET", "/generate-superhero")
+
+    def extract_scenes(self):
+        story = self._known("stories") or {"story_text": SAMPLE_STORY}
+        self.call("extract_story_scenes", "POST", "/extract-story-scenes",
+                  json={"story_text": story.get("story_text", SAMPLE_STORY), "character_name": "Mia", "num_scenes": 3})
+
+    def coloring_prompt(self):
+        self.call("generate_coloring_prompt", "POST", "/generate-coloring-prompt",
+                  json={"scene_description": "a dragon sharing a lantern", "character_name": "Mia"})
+
+    def image_job(self):
+        response = self.call("create_job", "POST", "/jobs", json={
+            "kind": self.rng.choice(("illustration", "coloring_page")),
+            "params": {"scene_description": "a dragon sharing a lantern", "character_name": "Mia"},
+        })
+        if response is None:
+            return
+        job = self.call("get_job", "GET", f"/jobs/{response.json()['job_id']}?wait=30")
+        images = ((job.json().get("result") or {}).get("images") or []) if job is not None else []
+        if images and images[0].get("image_url"):
+            self.call("get_image", "GET", images[0]["image_url"])
+
+    def story_library(self):
+        response = self.call("list_stories", "GET", "/stories?limit=20")
+        items = response.json().get("items", []) if response is not None else []
+        if items:
+            self.call("get_story", "GET", f"/stories/{self.rng.choice(items)['id']}")
+
+    def search_stories(self):
+        self.call("search_stories", "GET", "/stories/search",
+                  params={"q": self.rng.choice(("dragon", "lantern", "brave friend", "forest"))})
+
+
+# Flow name -> weight; the mix leans on generation, as real traffic does
+FLOWS = {
+    "health": 2,
+    "story_themes": 3,
+    "generate_story": 12,
+    "generate_story_stream": 6,
+    "continue_story": 4,
+    "multi_character_story": 3,
+    "interactive_story": 6,
+    "create_character": 4,
+    "update_character": 3,
+    "get_character": 4,
+    "list_characters": 6,
+    "bulk_characters": 1,
+    "delete_character": 1,
+    "superhero": 2,
+    "extract_scenes": 3,
+    "coloring_prompt": 2,
+    "image_job": 3,
+    "story_library": 4,
+    "search_stories": 4,
+}
+
+
+# ----------------------
+# Server
+# ----------------------
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _tree_rss_mb(pid: int) -> float | None:
+    """Resident memory of ``pid`` and its descendants (gunicorn workers), in MB; None if unknown."""
+    try:
+        import psutil
+    except ImportError:
+        psutil = None
+    if psutil is not None:
+        try:
+            root = psutil.Process(pid)
+            return sum(p.memory_info().rss for p in [root, *root.children(recursive=True)]) / 2**20
+        except psutil.Error:
+            return None
+    if not os.path.isdir("/proc"):
+        return None
+    # Linux without psutil: walk /proc for the process tree
+    parents = {}
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    parents[int(entry)] = int(f.read().rsplit(")", 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+    tree, frontier = {pid}, [pid]
+    while frontier:
+        parent = frontier.pop()
+        children = [child for child, ppid in parents.items() if ppid == parent and child not in tree]
+        tree.update(children)
+        frontier.extend(children)
+    total_kb = 0
+    for member in tree:
+        try:
+            with open(f"/proc/{member}/status") as f:
+                total_kb += next((int(line.split()[1]) for line in f if line.startswith("VmRSS:")), 0)
+        except OSError:
+            continue
+    return total_kb / 1024
+
+
+class MemorySampler(threading.Thread):
+    def __init__(self, pid: int, interval: float = 0.5):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.samples = []
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            rss = _tree_rss_mb(self.pid)
+            if rss is not None:
+                self.samples.append(rss)
+            self._stop_event.wait(self.interval)
+
+    def stop(self) -> dict:
+        self._stop_event.set()
+        self.join()
+        if not self.samples:
+            return {"rss_mb_start": None, "rss_mb_peak": None, "rss_mb_end": None}
+        return {
+            "rss_mb_start": round(self.samples[0], 1),
+            "rss_mb_peak": round(max(self.samples), 1),
+            "rss_mb_end": round(self.samples[-1], 1),
+        }
+
+
+def _start_server(args, scratch: str) -> tuple[subprocess.Popen, str]:
+    port = _free_port()
+    env = {
+        **os.environ,
+        "GEMINI_MODEL": "stub",
+        "STUB_MODEL_LATENCY_SECONDS": str(args.llm_latency),
+        "STUB_MODEL_FAILURE_RATE": str(args.llm_failure_rate),
+        "IMAGE_PROVIDERS": "stub",
+        "IMAGE_STUB_LATENCY_SECONDS": str(args.image_latency),
+        "IMAGE_STUB_FAILURE_RATE": str(args.image_failure_rate),
+        "DATABASE_URL": f"sqlite:///{os.path.join(scratch, 'load.db')}",
+        "STORY_CACHE_PATH": os.path.join(scratch, "story_cache.db"),
+        "RATE_LIMIT_PATH": os.path.join(scratch, "rate_limits.db"),
+        "JOB_QUEUE_PATH": os.path.join(scratch, "jobs.db"),
+        "IMAGE_STORE_DIR": os.path.join(scratch, "images"),
+        "RATE_LIMIT_BACKEND": os.environ.get("RATE_LIMIT_BACKEND", "off"),  # measure capacity, not the limiter
+        "GUNICORN_ACCESS_LOG": "",
+    }
+    log = open(os.path.join(scratch, "server.log"), "w")
+    proc = subprocess.Popen(
+        [sys.executable, os.path.join(BACKEND_DIR, "run.py"), "--server", args.server,
+         "--host", "127.0.0.1", "--port", str(port)],
+        cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f"server exited with {proc.returncode}; see {log.name}")
+        try:
+            requests.get(f"{base_url}/get-story-themes", timeout=1)
+            return proc, base_url
+        except requests.RequestException:
+            time.sleep(0.2)
+    proc.kill()
+    raise SystemExit("server did not start within 60s")
+
+
+# ----------------------
+# Run and compare
+# ----------------------
+def run_load(base_url: str, args, flows: dict) -> tuple[Recorder, float]:
+    recorder = Recorder()
+    shared = {"lock": threading.Lock(), "characters": [], "stories": []}
+    seeder = Client(base_url, Recorder(), shared, args.seed)  # seeding isn't measured
+    for _ in range(10):
+        seeder.create_character()
+
+    names, weights = list(flows), list(flows.values())
+    stop_at = time.perf_counter() + args.seconds
+
+    def worker(n: int):
+        client = Client(base_url, recorder, shared, args.seed * 1000 + n)
+        while time.perf_counter() < stop_at:
+            getattr(client, client.rng.choices(names, weights)[0])()
+
+    threads = [threading.Thread(target=worker, args=(n,), daemon=True) for n in range(args.clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return recorder, time.perf_counter() - started
+
+
+def _report(recorder: Recorder, wall: float) -> dict:
+    routes = {
+        name: _summarize(entry["latencies"], entry["errors"], entry["throttled"], wall)
+        for name, entry in sorted(recorder.routes.items())
+    }
+    everything = [latency for entry in recorder.routes.values() for latency in entry["latencies"]]
+    summary = _summarize(
+        everything,
+        sum(entry["errors"] for entry in recorder.routes.values()),
+        sum(entry["throttled"] for entry in recorder.routes.values()),
+        wall,
+    )
+    return {"summary": summary, "routes": routes}
+
+
+def compare(current: dict, baseline: dict, max_regression: float, out=sys.stdout) -> list:
+    """Print per-route deltas against ``baseline``; return the regressions beyond ``max_regression`` %."""
+    def pct(new, old):
+        return None if not old or new is None else (new - old) / old * 100
+
+    regressions = []
+    rows = [("ALL", current["summary"], baseline["summary"])] + [
+        (name, stats, baseline["routes"][name])
+        for name, stats in current["routes"].items() if name in baseline["routes"]
+    ]
+    print(f"\n  {'route':<30} {'p95 ms (base -> now)':>24} {'Δ%':>7} {'rps (base -> now)':>22} {'Δ%':>7}", file=out)
+    for name, now, base in rows:
+        p95_delta, rps_delta = pct(now["p95_ms"], base["p95_ms"]), pct(now["rps"], base["rps"])
+        print(f"  {name:<30} {str(base['p95_ms']) + ' -> ' + str(now['p95_ms']):>24} "
+              f"{'' if p95_delta is None else f'{p95_delta:+.0f}':>7} "
+              f"{str(base['rps']) + ' -> ' + str(now['rps']):>22} {'' if rps_delta is None else f'{rps_delta:+.0f}':>7}", file=out)
+        if now["ok"] < 20:
+            continue  # too few samples to call a regression
+        if p95_delta is not None and p95_delta > max_regression:
+            regressions.append(f"{name}: p95 {base['p95_ms']} -> {now['p95_ms']} ms ({p95_delta:+.0f}%)")
+        if name == "ALL" and rps_delta is not None and -rps_delta > max_regression:
+            regressions.append(f"throughput {base['rps']} -> {now['rps']} rps ({rps_delta:+.0f}%)")
+    print(file=out)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="drive an already running server instead of starting one (no memory figures)")
+    parser.add_argument("--server", choices=("auto", "gunicorn", "waitress", "dev"), default="auto")
+    parser.add_argument("--clients", type=int, default=32, help="concurrent simulated users")
+    parser.add_argument("--seconds", type=float, default=30)
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="stub model seconds per call")
+    parser.add_argument("--llm-failure-rate", type=float, default=0.0, help="fraction of stub model calls that fail")
+    parser.add_argument("--image-latency", type=float, default=1.0, help="stub image provider seconds per call")
+    parser.add_argument("--image-failure-rate", type=float, default=0.0)
+    parser.add_argument("--routes", help=f"comma-separated flows to run (default all): {', '.join(FLOWS)}")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--out", help="write the JSON results to this file")
+    parser.add_argument("--compare", help="baseline JSON from an earlier --out to diff against")
+    parser.add_argument("--max-regression", type=float, default=20.0, help="allowed p95/rps regression in percent")
+    parser.add_argument("--json", action="store_true", help="print the JSON results")
+    args = parser.parse_args()
+
+    flows = FLOWS
+    if args.routes:
+        unknown = set(args.routes.split(",")) - set(FLOWS)
+        if unknown:
+            parser.error(f"unknown flows: {', '.join(sorted(unknown))}")
+        flows = {name: FLOWS[name] for name in args.routes.split(",")}
+
+    scratch = tempfile.mkdtemp(prefix="load_test_")
+    proc = sampler = None
+    try:
+        if args.url:
+            base_url = args.url.rstrip("/")
+        else:
+            proc, base_url = _start_server(args, scratch)
+            sampler = MemorySampler(proc.pid)
+            sampler.start()
+        recorder, wall = run_load(base_url, args, flows)
+        memory = sampler.stop() if sampler else {"rss_mb_start": None, "rss_mb_peak": None, "rss_mb_end": None}
+        try:
+            health = requests.get(f"{base_url}/health", timeout=10).json()
+        except (requests.RequestException, ValueError):
+            health = {}
+    finally:
+        if proc is not None:
+            proc.terminate()
+            try:
+                proc.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    results = {
+        "config": {
+            "server": "external" if args.url else args.server, "clients": args.clients, "seconds": args.seconds,
+            "llm_latency": args.llm_latency, "llm_failure_rate": args.llm_failure_rate,
+            "image_latency": args.image_latency, "image_failure_rate": args.image_failure_rate,
+            "flows": list(flows), "seed": args.seed, "cpus": os.cpu_count(),
+        },
+        **_report(recorder, wall),
+        "memory": memory,
+        # Per worker process: with several workers these come from whichever one answered
+        "server": {key: health.get(key) for key in ("generation", "story_cache", "coalescing", "admission",
+                                                    "image_providers", "story_pool") if key in health},
+    }
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        s, m = results["summary"], results["memory"]
+        print(f"\n{args.clients} clients for {args.seconds:g}s: {s['requests']} requests, {s['rps']} ok/s, "
+              f"{s['errors']} errors, {s['throttled']} throttled; RSS {m['rss_mb_start']} -> peak "
+              f"{m['rss_mb_peak']} MB\n")
+        print(f"  {'route':<30} {'ok':>6} {'err':>5} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+        for name, r in [("ALL", s), *results["routes"].items()]:
+            print(f"  {name:<30} {r['ok']:>6} {r['errors']:>5} {r['rps']:>8} "
+                  f"{str(r['p50_ms']):>8} {str(r['p95_ms']):>8} {str(r['p99_ms']):>8}")
+        print()
+
+    if args.compare:
+        out = sys.stderr if args.json else sys.stdout  # keep stdout parseable
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.max_regression, out)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}", file=out)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+"""
+Shared pytest setup: tests that import ``app`` get the offline configuration
+(stub model and image provider, scratch databases) instead of the developer's .env.
+"""
+
+import os
+import tempfile
+
+import pytest
+
+_SCRATCH = tempfile.mkdtemp(prefix="story_tests_")
+
+# Set before any test module imports app; load_dotenv never overrides existing variables
+os.environ.update({
+    "GEMINI_MODEL": "stub",
+    "STUB_MODEL_LATENCY_SECONDS": "0",
+    "IMAGE_PROVIDERS": "stub",
+    "DATABASE_URL": f"sqlite:///{os.path.join(_SCRATCH, 'characters.db')}",
+    "JOB_QUEUE_PATH": os.path.join(_SCRATCH, "jobs.db"),
+    "IMAGE_STORE_DIR": os.path.join(_SCRATCH, "images"),
+    "STORY_CACHE_BACKEND": "off",
+    "RATE_LIMIT_BACKEND": "memory",
+    "STORY_POOL_SIZE": "0",
+    "STORY_SUMMARY_MODE": "extractive",
+})
+
+
+@pytest.fixture
+def story_app():
+    import app as story_app
+
+    return story_app
+
+
+@pytest.fixture
+def client(story_app):
+    return story_app.app.test_client()
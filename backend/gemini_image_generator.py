@@ -1,26 +1,77 @@
 """
 Gemini Image Generation Service
 Uses Google's Imagen 3.0 via Gemini API (FREE with your existing key!)
+
+With an ImageStore, each image's bytes are written to disk once and results
+carry an image_id/image_url; without one, results inline base64 image_data.
 """
 
 import os
 import google.generativeai as genai
-from PIL import Image
-import io
 import base64
 import uuid
 from datetime import datetime
 
+
+def _image_bytes(image) -> bytes:
+    """Encoded bytes of a generated image, read through the SDK's public attributes."""
+    # Imagen responses expose ``image_bytes`` either on the image or on a nested ``image``
+    for holder in (image, getattr(image, "image", None)):
+        data = getattr(holder, "image_bytes", None)
+        if data:
+            return data
+    raise ValueError(f"Generated image has no image_bytes ({type(image).__name__})")
+
+
 class GeminiImageGenerator:
-    def __init__(self, api_key=None):
-        """Initialize with Gemini API key"""
+    def __init__(self, api_key=None, image_store=None):
+        """
+        Initialize with Gemini API key
+
+        Args:
+            api_key: Gemini key (default: GEMINI_API_KEY)
+            image_store: Optional ImageStore; when set, images are saved to disk
+                and returned by ID/URL instead of as inline base64
+        """
         self.api_key = api_key or os.getenv("GEMINI_API_KEY")
+        self.image_store = image_store
         if self.api_key:
             genai.configure(api_key=self.api_key)
 
-        # Imagen 3.0 model for image generation
+        # Imagen 3.0 model for image generation; older google-generativeai releases lack it
+        if not hasattr(genai, "ImageGenerationModel"):
+            raise RuntimeError(
+                f"google-generativeai {getattr(genai, '__version__', '?')} has no ImageGenerationModel; "
+                "set IMAGE_PROVIDERS to providers that are installed (e.g. openrouter)"
+            )
         self.image_model = genai.ImageGenerationModel("imagen-3.0-generate-001")
 
+    def _package_images(self, response, prompt: str, **extra) -> list:
+        """Turn an Imagen response into result dicts, touching each image's bytes once."""
+        images = []
+        for i, image in enumerate(response.images):
+            data = _image_bytes(image)
+            result = {
+                'id': f"{uuid.uuid4()}_{i}",
+                **extra,
+                'prompt': prompt,
+                'format': 'png',
+                'generated_at': datetime.now().isoformat(),
+            }
+            if self.image_store is not None:
+                image_id = self.image_store.put(data)
+                result.update({
+                    'id': image_id,
+                    'image_id': image_id,
+                    'image_url': self.image_store.url_for(image_id),
+                    'format': image_id.rsplit('.', 1)[1],
+                })
+            else:
+                # Convert to base64 for easy storage/transmission
+                result['image_data'] = base64.b64encode(data).decode('utf-8')
+            images.append(result)
+        return images
+
     def generate_story_illustration(
         self,
         scene_description: str,
@@ -38,7 +89,7 @@ class GeminiImageGenerator:
             num_images: Number of variations to generate (1-4)
 
         Returns:
-            List of dicts with image data
+            List of dicts with image data (or image_id/image_url when using an ImageStore)
         """
         prompt = f"""
 {style} of this scene from a children's story:
@@ -65,22 +116,7 @@ Style requirements:
                 aspect_ratio="1:1",  # Square format
             )
 
-            images = []
-            for i, image in enumerate(response.images):
-                # Convert to base64 for easy storage/transmission
-                img_byte_arr = io.BytesIO()
-                image._pil_image.save(img_byte_arr, format='PNG')
-                img_byte_arr = img_byte_arr.getvalue()
-
-                images.append({
-                    'id': f"{uuid.uuid4()}_{i}",
-                    'prompt': prompt,
-                    'image_data': base64.b64encode(img_byte_arr).decode('utf-8'),
-                    'format': 'png',
-                    'generated_at': datetime.now().isoformat(),
-                })
-
-            return images
+            return self._package_images(response, prompt)
 
         except Exception as e:
             print(f"Error generating image with Gemini: {e}")
@@ -131,21 +167,7 @@ Style: Clean line drawing, coloring book page, black outlines only
                 aspect_ratio="1:1",
             )
 
-            images = []
-            for i, image in enumerate(response.images):
-                img_byte_arr = io.BytesIO()
-                image._pil_image.save(img_byte_arr, format='PNG')
-                img_byte_arr = img_byte_arr.getvalue()
-
-                images.append({
-                    'id': f"{uuid.uuid4()}_{i}",
-                    'prompt': prompt,
-                    'image_data': base64.b64encode(img_byte_arr).decode('utf-8'),
-                    'format': 'png',
-                    'generated_at': datetime.now().isoformat(),
-                })
-
-            return images
+            return self._package_images(response, prompt)
 
         except Exception as e:
             print(f"Error generating coloring page with Gemini: {e}")
@@ -242,22 +264,7 @@ Style requirements:
                 aspect_ratio="1:1",
             )
 
-            images = []
-            for i, image in enumerate(response.images):
-                img_byte_arr = io.BytesIO()
-                image._pil_image.save(img_byte_arr, format='PNG')
-                img_byte_arr = img_byte_arr.getvalue()
-
-                images.append({
-                    'id': f"{uuid.uuid4()}_{i}",
-                    'character_name': name,
-                    'prompt': prompt,
-                    'image_data': base64.b64encode(img_byte_arr).decode('utf-8'),
-                    'format': 'png',
-                    'generated_at': datetime.now().isoformat(),
-                })
-
-            return images
+            return self._package_images(response, prompt, character_name=name)
 
         except Exception as e:
             print(f"Error generating character avatar with Gemini: {e}")
@@ -0,0 +1,203 @@
+"""
+Async Generation Service
+Runs Gemini calls on a dedicated asyncio event loop, bounded by a concurrency limit.
+
+Flask views stay synchronous: they hand the call to the loop and block their
+request thread on a future until it finishes, so a process serves at most as
+many story requests at once as it has request threads (WEB_THREADS). The loop
+multiplexes the network I/O of those calls and of the background calls that
+hold no request thread (speculative branches, summaries, the story pool).
+"""
+
+import asyncio
+import concurrent.futures
+import queue
+import threading
+import time
+
+
+class GenerationQueueFull(RuntimeError):
+    """Raised when too many calls are already waiting for a concurrency slot."""
+
+
+def _chunk_text(chunk) -> str:
+    # Safety-blocked or empty chunks raise on .text instead of returning ""
+    try:
+        return chunk.text
+    except Exception:
+        return ""
+
+
+class GenerationService:
+    """Bounded-concurrency executor for model calls, with queue/in-flight metrics."""
+
+    def __init__(self, max_concurrency: int = 64, max_queue_depth: int = 1000, timeout: float = 60.0):
+        self.max_concurrency = max_concurrency
+        self.max_queue_depth = max_queue_depth
+        self.timeout = timeout
+
+        self._loop = None
+        self._thread = None
+        self._semaphore = None
+        self._start_lock = threading.Lock()
+
+        # Counters are only mutated on the loop thread
+        self.queued = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.timed_out = 0
+        self.cancelled = 0
+        self.rejected = 0
+        self._latency_total = 0.0
+
+    # ---- lifecycle ----
+    def _ensure_started(self):
+        if self._loop is not None:
+            return
+        with self._start_lock:
+            if self._loop is not None:
+                return
+            loop = asyncio.new_event_loop()
+            ready = threading.Event()
+
+            def run():
+                asyncio.set_event_loop(loop)
+                self._semaphore = asyncio.Semaphore(self.max_concurrency)
+                ready.set()
+                loop.run_forever()
+
+            self._thread = threading.Thread(target=run, name="generation-loop", daemon=True)
+            self._thread.start()
+            ready.wait()
+            self._loop = loop
+
+    def shutdown(self):
+        """Stop the event loop thread (used by tests and worker shutdown hooks)."""
+        with self._start_lock:
+            if self._loop is None:
+                return
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=5)
+            self._loop = None
+            self._thread = None
+
+    # ---- execution ----
+    async def _call(self, model, prompt, kwargs, consume=None):
+        if self.queued >= self.max_queue_depth:
+            self.rejected += 1
+            raise GenerationQueueFull(f"{self.queued} generation calls already waiting")
+
+        self.queued += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.queued -= 1
+
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        started = time.perf_counter()
+        try:
+            if hasattr(model, "generate_content_async"):
+                response = await model.generate_content_async(prompt, **kwargs)
+            else:
+                response = await asyncio.to_thread(model.generate_content, prompt, **kwargs)
+            if consume is not None:
+                await consume(response)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        except BaseException:
+            self.failed += 1
+            raise
+        else:
+            self.completed += 1
+            return response
+        finally:
+            self._latency_total += time.perf_counter() - started
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    def submit(self, model, prompt, **kwargs) -> concurrent.futures.Future:
+        """Schedule ``model.generate_content(prompt, **kwargs)`` and return a future."""
+        self._ensure_started()
+        return asyncio.run_coroutine_threadsafe(self._call(model, prompt, kwargs), self._loop)
+
+    def generate(self, model, prompt, timeout: float | None = None, **kwargs):
+        """Run a model call on the loop and block the calling thread until it finishes."""
+        future = self.submit(model, prompt, **kwargs)
+        try:
+            return future.result(timeout=timeout or self.timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            self._loop.call_soon_threadsafe(self._count_timeout)
+            raise TimeoutError(f"Model call exceeded {timeout or self.timeout:g}s") from None
+
+    def stream(self, model, prompt, timeout: float | None = None, **kwargs):
+        """
+        Yield response text chunks as the model produces them.
+
+        The streaming call holds a concurrency slot until the last chunk arrives.
+        ``timeout`` bounds the wait for each chunk. Closing the generator early
+        (e.g. a client disconnect) cancels the call.
+        """
+        chunks = queue.Queue()
+        done = object()
+
+        def pump_sync(response):
+            for chunk in response:
+                chunks.put(_chunk_text(chunk))
+
+        async def pump(response):
+            if hasattr(response, "__aiter__"):
+                async for chunk in response:
+                    chunks.put(_chunk_text(chunk))
+            else:
+                await asyncio.to_thread(pump_sync, response)
+
+        async def run():
+            try:
+                await self._call(model, prompt, {**kwargs, "stream": True}, consume=pump)
+            except BaseException as e:
+                chunks.put(e)
+                raise
+            finally:
+                chunks.put(done)
+
+        self._ensure_started()
+        future = asyncio.run_coroutine_threadsafe(run(), self._loop)
+        try:
+            while True:
+                try:
+                    item = chunks.get(timeout=timeout or self.timeout)
+                except queue.Empty:
+                    self._loop.call_soon_threadsafe(self._count_timeout)
+                    raise TimeoutError(f"No model output for {timeout or self.timeout:g}s") from None
+                if item is done:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                if item:
+                    yield item
+        finally:
+            future.cancel()
+
+    def _count_timeout(self):
+        self.timed_out += 1
+
+    # ---- metrics ----
+    def metrics(self) -> dict:
+        finished = self.completed + self.failed + self.cancelled
+        return {
+            "max_concurrency": self.max_concurrency,
+            "queue_depth": self.queued,
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "completed": self.completed,
+            "failed": self.failed,
+            "timed_out": self.timed_out,
+            "cancelled": self.cancelled,
+            "rejected": self.rejected,
+            "avg_latency_ms": round(self._latency_total / finished * 1000, 1) if finished else 0.0,
+        }
@@ -0,0 +1,61 @@
+"""
+Gunicorn Configuration
+Production settings for the story API (``python run.py`` or ``gunicorn -c gunicorn.conf.py "app:create_app()"``).
+
+Every setting can be overridden from the environment. Workers are gthread
+processes: model and image calls spend their time waiting on the network, so
+each process serves many requests on threads while separate processes spread
+the CPU-bound work (prompt building, JSON parsing, SQLite) across cores.
+
+Signals: HUP restarts workers gracefully (finishing in-flight requests); with
+preload on, new code is only picked up by USR2 (start a new master) followed by
+WINCH/QUIT to the old one. TERM stops gracefully within ``graceful_timeout``.
+"""
+
+import multiprocessing
+import os
+
+bind = f"{os.getenv('HOST', '0.0.0.0')}:{os.getenv('PORT', '5000')}"
+
+# Processes x threads; WEB_CONCURRENCY is the name most hosting platforms set
+workers = int(os.getenv("WEB_CONCURRENCY", str(min(multiprocessing.cpu_count() * 2 + 1, 8))))
+worker_class = "gthread"
+threads = int(os.getenv("WEB_THREADS", "8"))
+
+# In-memory rate limits are per process, so N workers would each grant the full quota;
+# share the buckets through SQLite unless a backend was chosen explicitly
+if workers > 1:
+    os.environ.setdefault("RATE_LIMIT_BACKEND", "sqlite")
+    # Speculated branches live in the worker that launched them; the continuation usually
+    # lands on another one, so the calls would mostly be wasted. Opt back in explicitly.
+    os.environ.setdefault("SPECULATION_MAX_IN_FLIGHT", "0")
+
+# Import the app once in the master and fork it: workers start in milliseconds and
+# share the imported code pages. Safe because importing app opens no connections or threads.
+preload_app = os.getenv("GUNICORN_PRELOAD", "1") == "1"
+
+# Recycle each worker after this many requests (plus jitter, so they don't all restart
+# together) to bound memory growth from caches and long-lived client objects
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "1000"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", "100"))
+
+# A worker silent for longer than the slowest model call is considered hung
+timeout = int(os.getenv("GUNICORN_TIMEOUT", str(int(float(os.getenv("GENERATION_TIMEOUT_SECONDS", "60"))) + 30)))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+
+accesslog = os.getenv("GUNICORN_ACCESS_LOG", "-") or None
+errorlog = "-"
+loglevel = os.getenv("GUNICORN_LOG_LEVEL", "info")
+
+
+def when_ready(server):
+    """Create the schema once in the master, so workers don't race each other to do it."""
+    if not preload_app:
+        return
+    import app as story_app
+
+    story_app.init_db()
+    with story_app.app.app_context():
+        # Workers must open their own connections, never inherit the master's
+        story_app.db.engine.dispose()
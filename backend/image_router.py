@@ -0,0 +1,302 @@
+"""
+Image Provider Router
+One entry point for every image generator, with latency-aware selection and failover.
+
+Providers (GeminiImageGenerator, OpenRouterImageGenerator, StubImageProvider)
+are built lazily from factories and share the generator method names. For each
+call the router ranks the healthy providers that implement the method by their
+rolling p50 latency, tries them in that order, and returns images in one
+normalized shape whichever provider answered:
+
+    {"id", "provider", "prompt", "format", "generated_at",
+     "image_id", "image_url", "image_data"}
+
+``image_id`` is set when the bytes are in the local ImageStore; ``image_data``
+(base64) only when they could not be stored. A provider whose recent error rate
+crosses ``max_error_rate`` is skipped for ``cooldown_seconds``, then gets one
+trial call (half-open) before rejoining the rotation. A provider whose factory
+raises (missing key, SDK without the API) is dropped for good on the first
+check() and reported as unavailable.
+"""
+
+import base64
+import logging
+import random
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+
+logger = logging.getLogger("story_engine")
+
+OPERATIONS = ("generate_story_illustration", "generate_coloring_page", "generate_character_avatar")
+
+
+class ImageProviderError(RuntimeError):
+    """Every eligible provider failed (or none implements the operation)."""
+
+
+class NoImageProviderError(ImageProviderError):
+    """No configured provider can be built or implements the operation; retrying cannot help."""
+
+
+def _percentile(sorted_values: list, pct: float) -> float:
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class ProviderHealth:
+    """Rolling latency and outcome window for one provider."""
+
+    def __init__(self, window: int = 100):
+        self.latencies = deque(maxlen=window)  # seconds, successful calls only
+        self.outcomes = deque(maxlen=window)   # True = success
+        self.requests = 0
+        self.failures = 0
+        self.open_until = 0.0  # provider skipped until then
+        self.trial_in_flight = False
+
+    def record(self, ok: bool, latency: float):
+        self.requests += 1
+        self.outcomes.append(ok)
+        if ok:
+            self.latencies.append(latency)
+        else:
+            self.failures += 1
+
+    @property
+    def error_rate(self) -> float:
+        return self.outcomes.count(False) / len(self.outcomes) if self.outcomes else 0.0
+
+    def percentile_ms(self, pct: float) -> float | None:
+        if not self.latencies:
+            return None
+        return round(_percentile(sorted(self.latencies), pct) * 1000, 1)
+
+
+class ImageRouter:
+    """Routes image calls to the fastest healthy provider and fails over on errors or empty results."""
+
+    def __init__(
+        self,
+        factories: dict,
+        image_store=None,
+        window: int = 100,
+        max_error_rate: float = 0.5,
+        min_samples: int = 5,
+        cooldown_seconds: float = 60.0,
+    ):
+        """
+        Args:
+            factories: provider name -> zero-argument callable building the provider
+                (dict order is the preference when there is no latency data yet)
+            image_store: Optional ImageStore; inline base64 results are moved into it
+            window: calls kept per provider for latency/error statistics
+            max_error_rate: error rate over the window that takes a provider out of rotation
+            min_samples: calls needed before the error rate is trusted
+            cooldown_seconds: how long an unhealthy provider is skipped before a trial call
+        """
+        self.factories = dict(factories)
+        self.image_store = image_store
+        self.max_error_rate = max_error_rate
+        self.min_samples = min_samples
+        self.cooldown_seconds = cooldown_seconds
+        self._providers = {}
+        self._unavailable = {}  # name -> why its factory failed
+        self._checked = False
+        self._health = {name: ProviderHealth(window) for name in self.factories}
+        self._lock = threading.Lock()
+
+    # ---- providers ----
+    def _provider(self, name: str):
+        with self._lock:
+            provider = self._providers.get(name)
+        if provider is None:
+            provider = self.factories[name]()
+            with self._lock:
+                provider = self._providers.setdefault(name, provider)
+        return provider
+
+    def check(self) -> list:
+        """Build every provider once, dropping (and logging) those that fail; returns the usable names."""
+        if not self._checked:
+            for name in self.factories:
+                try:
+                    self._provider(name)
+                except Exception as e:
+                    with self._lock:
+                        self._unavailable[name] = f"{type(e).__name__}: {e}"
+                    logger.error("Image provider %s unavailable, dropping it: %s", name, self._unavailable[name])
+            self._checked = True
+            if not self._providers:
+                logger.error("No image provider could be built; image jobs will fail (check IMAGE_PROVIDERS)")
+        return [name for name in self.factories if name in self._providers]
+
+    def supports(self, operation: str) -> bool:
+        """Whether any usable provider implements ``operation`` (builds the providers)."""
+        return any(hasattr(self._providers[name], operation) for name in self.check())
+
+    def _ranked(self, now: float) -> list:
+        """Healthy providers, fastest p50 first; an unmeasured provider is tried before measured ones."""
+        order = {name: i for i, name in enumerate(self.factories)}
+        ranked = []
+        with self._lock:
+            for name, health in self._health.items():
+                if name in self._unavailable:
+                    continue
+                if health.open_until > now:
+                    continue
+                if health.open_until and health.trial_in_flight:
+                    continue  # someone is already probing this provider
+                p50 = health.percentile_ms(50)
+                ranked.append((p50 is not None, p50 or 0.0, order[name], name))
+        ranked.sort()
+        return [name for *_, name in ranked]
+
+    # ---- calls ----
+    def generate(self, operation: str, *args, **kwargs) -> list:
+        """Call ``operation`` on providers in rank order until one returns images; returns normalized images."""
+        if operation not in OPERATIONS:
+            raise ValueError(f"Unknown image operation: {operation}")
+        if not self.supports(operation):
+            raise NoImageProviderError(f"No usable image provider implements {operation}")
+        errors = []
+        for name in self._ranked(time.time()):
+            method = getattr(self._providers[name], operation, None)
+            if method is None:
+                continue
+            self._begin_trial(name)
+            started = time.perf_counter()
+            try:
+                images = method(*args, **kwargs)
+                if not images:
+                    raise ImageProviderError("no images returned")
+            except Exception as e:
+                self._record(name, False, time.perf_counter() - started)
+                errors.append(f"{name}: {e}")
+                logger.warning("Image provider %s failed %s, failing over: %s", name, operation, e)
+                continue
+            self._record(name, True, time.perf_counter() - started)
+            return [self._normalize(image, name) for image in images]
+        raise ImageProviderError("; ".join(errors) or f"No healthy provider implements {operation}")
+
+    def generate_story_illustration(self, *args, **kwargs) -> list:
+        return self.generate("generate_story_illustration", *args, **kwargs)
+
+    def generate_coloring_page(self, *args, **kwargs) -> list:
+        return self.generate("generate_coloring_page", *args, **kwargs)
+
+    def generate_character_avatar(self, *args, **kwargs) -> list:
+        return self.generate("generate_character_avatar", *args, **kwargs)
+
+    def _begin_trial(self, name: str):
+        with self._lock:
+            health = self._health[name]
+            if health.open_until:
+                health.trial_in_flight = True
+
+    def _record(self, name: str, ok: bool, latency: float):
+        with self._lock:
+            health = self._health[name]
+            health.record(ok, latency)
+            if health.open_until:
+                # Half-open trial: one success closes the circuit, a failure reopens it
+                health.trial_in_flight = False
+                health.open_until = 0.0 if ok else time.time() + self.cooldown_seconds
+                if ok:
+                    health.outcomes.clear()
+            elif len(health.outcomes) >= self.min_samples and health.error_rate > self.max_error_rate:
+                health.open_until = time.time() + self.cooldown_seconds
+                logger.warning("Image provider %s unhealthy (%.0f%% errors), skipping for %ds",
+                               name, health.error_rate * 100, self.cooldown_seconds)
+
+    def _normalize(self, image: dict, provider: str) -> dict:
+        result = {
+            "id": image.get("id") or uuid.uuid4().hex,
+            "provider": provider,
+            "prompt": image.get("prompt"),
+            "format": image.get("format", "png"),
+            "generated_at": image.get("generated_at") or datetime.now().isoformat(),
+            "image_id": image.get("image_id"),
+            "image_url": image.get("image_url"),
+            "image_data": image.get("image_data"),
+        }
+        if result["image_data"] and self.image_store is not None and not result["image_id"]:
+            image_id = self.image_store.put(base64.b64decode(result["image_data"]))
+            result.update({
+                "id": image_id,
+                "image_id": image_id,
+                "image_url": self.image_store.url_for(image_id),
+                "format": image_id.rsplit(".", 1)[1],
+                "image_data": None,
+            })
+        return result
+
+    # ---- metrics ----
+    def stats(self) -> dict:
+        """
+        Per-provider health. Never builds providers: until the first ``check()``
+        (the first image job), ``available`` is None for providers not yet built.
+        """
+        now = time.time()
+        with self._lock:
+            return {
+                name: {
+                    "available": (name not in self._unavailable) if self._checked or name in self._providers else None,
+                    **({"error": self._unavailable[name]} if name in self._unavailable else {}),
+                    "healthy": name not in self._unavailable and health.open_until <= now,
+                    "requests": health.requests,
+                    "failures": health.failures,
+                    "error_rate": round(health.error_rate, 3),
+                    "p50_ms": health.percentile_ms(50),
+                    "p95_ms": health.percentile_ms(95),
+                }
+                for name, health in self._health.items()
+            }
+
+
+# 1x1 white PNG
+_STUB_PNG = base64.b64decode(
+    "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAIAAACQd1PeAAAADElEQVR4nGP4//8/AAX+Av4N70a4AAAAAElFTkSuQmCC"
+)
+
+
+class StubImageProvider:
+    """Local provider for development, tests and load tests: fixed latency, optional injected failures."""
+
+    def __init__(self, latency_seconds: float = 0.0, failure_rate: float = 0.0, seed=None):
+        self.latency_seconds = latency_seconds
+        self.failure_rate = failure_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _images(self, prompt: str, num_images: int) -> list:
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+        with self._lock:
+            failed = self._random.random() < self.failure_rate
+        if failed:
+            raise ImageProviderError("stub provider failure (injected)")
+        return [
+            {
+                "id": f"{uuid.uuid4()}_{i}",
+                "prompt": prompt,
+                "format": "png",
+                "generated_at": datetime.now().isoformat(),
+                "image_data": base64.b64encode(_STUB_PNG).decode("utf-8"),
+            }
+            for i in range(num_images)
+        ]
+
+    def generate_story_illustration(self, scene_description: str, character_name: str = "the hero",
+                                    style: str = "children's book illustration", num_images: int = 1) -> list:
+        return self._images(f"{style}: {scene_description} ({character_name})", num_images)
+
+    def generate_coloring_page(self, scene_description: str, character_name: str = "the hero",
+                               num_images: int = 1) -> list:
+        return self._images(f"coloring page: {scene_description} ({character_name})", num_images)
+
+    def generate_character_avatar(self, character_data: dict, style: str = "cute cartoon portrait",
+                                  num_images: int = 1) -> list:
+        return self._images(f"{style}: {character_data.get('name', 'character')}", num_images)
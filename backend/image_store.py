@@ -0,0 +1,71 @@
+"""
+Image Artifact Store
+Content-addressed on-disk storage for generated images.
+
+Each image is written once to <root>/<aa>/<bb>/<sha256>.<ext>, where aa/bb are
+the first two byte pairs of its SHA-256, so no directory grows unbounded and
+identical images are stored only once. Generators return the image ID (and a
+URL under /images/) instead of inlining base64 into every response.
+"""
+
+import hashlib
+import os
+import re
+import tempfile
+
+_IMAGE_ID_RE = re.compile(r"^[0-9a-f]{64}\.(png|jpg|webp)$")
+
+MIMETYPES = {"png": "image/png", "jpg": "image/jpeg", "webp": "image/webp"}
+
+
+def sniff_format(data: bytes) -> str:
+    """Best-effort file extension from magic bytes (defaults to png)."""
+    if data.startswith(b"\xff\xd8\xff"):
+        return "jpg"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "webp"
+    return "png"
+
+
+class ImageStore:
+    """Sharded, write-once image files keyed by SHA-256."""
+
+    def __init__(self, root: str, url_prefix: str = "/images"):
+        self.root = root
+        self.url_prefix = url_prefix.rstrip("/")
+        # No mkdir here: the app builds its store at import, and put() creates root with the first shard
+
+    def put(self, data: bytes, ext: str | None = None) -> str:
+        """Store ``data`` (no-op if already present) and return its image ID."""
+        ext = ext or sniff_format(data)
+        image_id = f"{hashlib.sha256(data).hexdigest()}.{ext}"
+        path = self._path(image_id)
+        if os.path.exists(path):
+            return image_id
+
+        shard = os.path.dirname(path)
+        os.makedirs(shard, exist_ok=True)
+        # Write to a temp file in the same directory, then rename: readers never see partial files
+        fd, tmp_path = tempfile.mkstemp(dir=shard, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        return image_id
+
+    def path_for(self, image_id: str) -> str | None:
+        """Filesystem path for a stored image, or None if the ID is invalid or unknown."""
+        if not _IMAGE_ID_RE.match(image_id or ""):
+            return None
+        path = self._path(image_id)
+        return path if os.path.exists(path) else None
+
+    def url_for(self, image_id: str) -> str:
+        return f"{self.url_prefix}/{image_id}"
+
+    def _path(self, image_id: str) -> str:
+        return os.path.join(self.root, image_id[:2], image_id[2:4], image_id)
@@ -0,0 +1,397 @@
+"""
+Background Job Queue
+Durable SQLite-backed queue with a local worker pool, for slow image generation.
+
+Jobs are rows in a SQLite file, so queued work survives restarts and every
+worker process on the host shares one queue. Workers claim the highest
+priority ready job under ``BEGIN IMMEDIATE``, hold it with a lease (a crashed
+worker's job is requeued when the lease runs out), retry failures with jittered
+exponential backoff and move a job to ``dead`` once its attempts are used up.
+
+Clients poll (or long-poll) for the result, or pass a webhook URL that gets the
+finished job POSTed to it. Webhook hosts must be on the allowlist when one is
+set; otherwise they must resolve only to public addresses, checked when the job
+is submitted and again before each delivery.
+"""
+
+import ipaddress
+import json
+import logging
+import random
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+
+
+logger = logging.getLogger("story_engine")
+
+QUEUED, RUNNING, SUCCEEDED, DEAD = "queued", "running", "succeeded", "dead"
+TERMINAL = (SUCCEEDED, DEAD)
+
+_COLUMNS = ("id, kind, payload, priority, status, attempts, max_attempts, result, error, "
+            "webhook_url, webhook_status, created_at, updated_at")
+
+
+class JobFailed(Exception):
+    """Raise from a handler to dead-letter the job without retrying (the input can never succeed)."""
+
+
+def resolve_webhook(url: str, allowed_hosts=()):
+    """
+    Check ``url`` and resolve its host once: ``(error, address)``, exactly one of them None.
+
+    Hosts on ``allowed_hosts`` are trusted as configured. Any other host must
+    resolve only to global addresses, so a client can't point deliveries at
+    loopback, private-network or link-local (cloud metadata) services. Delivery
+    connects to the returned address, so DNS can't change the answer in between.
+    """
+    try:
+        parts = urlsplit(str(url))
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+    except ValueError:
+        return "webhook_url is not a valid URL", None
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        return "webhook_url must be an http(s) URL", None
+    host = parts.hostname.lower()
+    if allowed_hosts and host not in allowed_hosts:
+        return f"webhook host {host} is not allowed", None
+    try:
+        addresses = [info[4][0] for info in socket.getaddrinfo(host, port, proto=socket.IPPROTO_TCP)]
+    except (socket.gaierror, UnicodeError):
+        return f"webhook host {host} does not resolve", None
+    if not allowed_hosts:
+        for address in addresses:
+            ip = ipaddress.ip_address(address.split("%", 1)[0])
+            if not ip.is_global or ip.is_multicast:
+                return f"webhook host {host} resolves to a non-public address", None
+    return None, addresses[0]
+
+
+def webhook_url_error(url: str, allowed_hosts=()) -> str | None:
+    """Why ``url`` may not receive webhooks, or None if it may."""
+    return resolve_webhook(url, allowed_hosts)[0]
+
+
+def _post_to_address(url: str, address: str, body: bytes, timeout: float) -> int:
+    """POST ``body`` to ``url`` over a connection to ``address``; TLS still verifies the URL's host."""
+    import urllib3
+
+    parts = urlsplit(url)
+    host = parts.hostname
+    port = parts.port or (443 if parts.scheme == "https" else 80)
+    if parts.scheme == "https":
+        pool = urllib3.HTTPSConnectionPool(address, port, server_hostname=host, assert_hostname=host,
+                                           cert_reqs="CERT_REQUIRED", timeout=timeout, retries=False)
+    else:
+        pool = urllib3.HTTPConnectionPool(address, port, timeout=timeout, retries=False)
+    path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+    default_port = port == (443 if parts.scheme == "https" else 80)
+    headers = {"Host": host if default_port else f"{host}:{port}", "Content-Type": "application/json"}
+    with pool:
+        # No redirects: they could lead to an address that was never checked
+        return pool.urlopen("POST", path, body=body, headers=headers, redirect=False).status
+
+
+def _iso(ts: float) -> str:
+    return datetime.fromtimestamp(ts, tz=timezone.utc).isoformat()
+
+
+class JobQueue:
+    """Priority job queue persisted in SQLite, processed by a pool of worker threads."""
+
+    def __init__(
+        self,
+        path: str,
+        handlers: dict,
+        workers: int = 2,
+        max_attempts: int = 3,
+        retry_base_seconds: float = 5.0,
+        lease_seconds: float = 600.0,
+        retention_hours: float = 72.0,
+        poll_seconds: float = 1.0,
+        webhook_hosts=(),
+    ):
+        """
+        Args:
+            path: SQLite file holding the queue
+            handlers: job kind -> callable(payload dict) returning a JSON-serializable result
+            workers: worker threads in this process
+            max_attempts: attempts before a job is dead-lettered
+            retry_base_seconds: first retry delay (doubles per attempt, jittered)
+            lease_seconds: how long a running job may go unfinished before it is requeued
+            retention_hours: finished jobs older than this are deleted
+            poll_seconds: how often idle workers look for jobs submitted by other processes
+            webhook_hosts: hostnames allowed to receive webhooks; empty allows any public address
+        """
+        self.path = path
+        self.handlers = handlers
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_base_seconds = retry_base_seconds
+        self.lease_seconds = lease_seconds
+        self.retention_seconds = retention_hours * 3600
+        self.poll_seconds = poll_seconds
+        self.webhook_hosts = frozenset(host.lower() for host in webhook_hosts)
+
+        self._lock = threading.Lock()  # guards the connection
+        self._changed = threading.Condition()  # notified on submit and on every job completion
+        self._threads = []
+        self._stopping = False
+        self._last_sweep = 0.0
+
+        self.processed = 0
+        self.retried = 0
+        self.dead_lettered = 0
+        self.webhook_failures = 0
+
+        self._conn = None  # opened on first use
+
+    def _db(self) -> sqlite3.Connection:
+        """The queue connection, created (with its schema) on first use; call with ``_lock`` held."""
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " id TEXT PRIMARY KEY,"
+                " kind TEXT NOT NULL,"
+                " payload TEXT NOT NULL,"
+                " priority INTEGER NOT NULL DEFAULT 0,"
+                " status TEXT NOT NULL,"
+                " attempts INTEGER NOT NULL DEFAULT 0,"
+                " max_attempts INTEGER NOT NULL,"
+                " run_after REAL NOT NULL,"
+                " lease_until REAL,"
+                " result TEXT,"
+                " error TEXT,"
+                " webhook_url TEXT,"
+                " webhook_status TEXT,"
+                " created_at REAL NOT NULL,"
+                " updated_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_jobs_ready ON jobs (status, priority DESC, run_after)")
+            self._conn = conn
+        return self._conn
+
+    # ---- lifecycle ----
+    def start(self):
+        """Start the worker threads (idempotent; replaces any that died)."""
+        with self._changed:
+            self._threads = [thread for thread in self._threads if thread.is_alive()]
+            if len(self._threads) >= self.workers:
+                return
+            self._stopping = False
+            for i in range(len(self._threads), self.workers):
+                thread = threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def shutdown(self, timeout: float = 5.0):
+        """Stop the workers after their current job (used by tests and worker shutdown hooks)."""
+        with self._changed:
+            self._stopping = True
+            self._changed.notify_all()
+            threads, self._threads = self._threads, []
+        for thread in threads:
+            thread.join(timeout=timeout)
+
+    # ---- client API ----
+    def submit(self, kind: str, payload: dict, priority: int = 0, webhook_url: str | None = None) -> dict:
+        """Queue a job and return it; raises ValueError for an unknown kind."""
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._db().execute(
+                "INSERT INTO jobs (id, kind, payload, priority, status, max_attempts, run_after,"
+                " webhook_url, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, kind, json.dumps(payload, ensure_ascii=False), priority, QUEUED,
+                 self.max_attempts, now, webhook_url, now, now),
+            )
+        self.start()
+        with self._changed:
+            self._changed.notify()
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> dict | None:
+        with self._lock:
+            row = self._db().execute(f"SELECT {_COLUMNS} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row) if row else None
+
+    def wait(self, job_id: str, timeout: float) -> dict | None:
+        """Long-poll: return the job once it is finished, or as it stands after ``timeout`` seconds."""
+        deadline = time.monotonic() + timeout
+        while True:
+            job = self.get(job_id)
+            remaining = deadline - time.monotonic()
+            if job is None or job["status"] in TERMINAL or remaining <= 0:
+                return job
+            # Local completions notify; the timeout also catches jobs finished by other processes
+            with self._changed:
+                self._changed.wait(min(remaining, self.poll_seconds))
+
+    # ---- workers ----
+    def _work(self):
+        while not self._stopping:
+            try:
+                job = self._claim()
+            except sqlite3.Error as e:
+                logger.error("Job claim failed: %s", e)
+                job = None
+            if job is None:
+                with self._changed:
+                    if not self._stopping:
+                        self._changed.wait(self.poll_seconds)
+                continue
+            try:
+                self._run(job)
+            except Exception as e:
+                # Recording the outcome failed (database locked, result not JSON); the job stays
+                # RUNNING until its lease expires and the sweep requeues it. Keep this worker alive.
+                logger.exception("Job %s (%s) could not be finished: %s", job["id"], job["kind"], e)
+
+    def _claim(self):
+        now = time.time()
+        with self._lock:
+            conn = self._db()
+            # BEGIN IMMEDIATE takes the write lock up front so two workers never claim the same row
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if now - self._last_sweep > 30:
+                    self._sweep(conn, now)
+                row = conn.execute(
+                    "SELECT id, kind, payload, attempts, max_attempts, webhook_url FROM jobs"
+                    " WHERE status = ? AND run_after <= ? ORDER BY priority DESC, created_at LIMIT 1",
+                    (QUEUED, now),
+                ).fetchone()
+                if row:
+                    conn.execute(
+                        "UPDATE jobs SET status = ?, attempts = attempts + 1, lease_until = ?, updated_at = ?"
+                        " WHERE id = ?",
+                        (RUNNING, now + self.lease_seconds, now, row[0]),
+                    )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        job_id, kind, payload, attempts, max_attempts, webhook_url = row
+        return {"id": job_id, "kind": kind, "payload": json.loads(payload), "attempt": attempts + 1,
+                "max_attempts": max_attempts, "webhook_url": webhook_url}
+
+    def _sweep(self, conn, now: float):
+        """Requeue jobs whose worker died (lease expired) and delete old finished jobs."""
+        conn.execute(
+            "UPDATE jobs SET status = CASE WHEN attempts >= max_attempts THEN ? ELSE ? END,"
+            " error = COALESCE(error, 'Worker lease expired'), updated_at = ?"
+            " WHERE status = ? AND lease_until < ?",
+            (DEAD, QUEUED, now, RUNNING, now),
+        )
+        conn.execute(
+            "DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?",
+            (SUCCEEDED, DEAD, now - self.retention_seconds),
+        )
+        self._last_sweep = now
+
+    def _run(self, job: dict):
+        try:
+            result = self.handlers[job["kind"]](job["payload"])
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            if job["attempt"] < job["max_attempts"] and not isinstance(e, JobFailed):
+                delay = random.uniform(0.5, 1.0) * min(self.retry_base_seconds * 2 ** (job["attempt"] - 1), 300)
+                logger.warning("Job %s (%s) attempt %d failed, retrying in %.0fs: %s",
+                               job["id"], job["kind"], job["attempt"], delay, error)
+                self._finish(job["id"], QUEUED, error=error, run_after=time.time() + delay)
+                self.retried += 1
+                return
+            logger.error("Job %s (%s) dead-lettered after %d attempts: %s",
+                         job["id"], job["kind"], job["attempt"], error)
+            self._finish(job["id"], DEAD, error=error)
+            self.dead_lettered += 1
+        else:
+            self._finish(job["id"], SUCCEEDED, result=result)
+            self.processed += 1
+        if job["webhook_url"]:
+            self._deliver_webhook(job["id"], job["webhook_url"])
+
+    def _finish(self, job_id: str, status: str, result=None, error: str | None = None, run_after: float | None = None):
+        now = time.time()
+        with self._lock:
+            self._db().execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, run_after = COALESCE(?, run_after),"
+                " lease_until = NULL, updated_at = ? WHERE id = ?",
+                (status, json.dumps(result, ensure_ascii=False) if result is not None else None,
+                 error, run_after, now, job_id),
+            )
+        with self._changed:
+            self._changed.notify_all()
+
+    def _deliver_webhook(self, job_id: str, url: str, attempts: int = 3):
+        import urllib3  # ships with requests; only webhook deliveries need it
+
+        # Re-checked at delivery, and the connection goes to the address checked here
+        error, address = resolve_webhook(url, self.webhook_hosts)
+        if error:
+            logger.warning("Webhook for job %s refused: %s", job_id, error)
+            self.webhook_failures += 1
+            self._set_webhook_status(job_id, f"refused: {error}")
+            return
+        body = json.dumps(self.get(job_id), ensure_ascii=False).encode("utf-8")
+        for attempt in range(attempts):
+            try:
+                status = _post_to_address(url, address, body, timeout=10)
+                if status < 400:
+                    self._set_webhook_status(job_id, "delivered")
+                    return
+                error = f"HTTP {status}"
+            except urllib3.exceptions.HTTPError as e:
+                error = str(e)
+            if attempt < attempts - 1:
+                time.sleep(random.uniform(0, 2 ** attempt))
+        logger.warning("Webhook for job %s failed: %s", job_id, error)
+        self.webhook_failures += 1
+        self._set_webhook_status(job_id, f"failed: {error}")
+
+    def _set_webhook_status(self, job_id: str, webhook_status: str):
+        with self._lock:
+            self._db().execute("UPDATE jobs SET webhook_status = ? WHERE id = ?", (webhook_status, job_id))
+
+    # ---- serialization & metrics ----
+    @staticmethod
+    def _to_dict(row) -> dict:
+        (job_id, kind, _payload, priority, status, attempts, max_attempts, result, error,
+         webhook_url, webhook_status, created_at, updated_at) = row
+        job = {
+            "job_id": job_id,
+            "kind": kind,
+            "status": status,
+            "priority": priority,
+            "attempts": attempts,
+            "max_attempts": max_attempts,
+            "result": json.loads(result) if result else None,
+            "error": error,
+            "created_at": _iso(created_at),
+            "updated_at": _iso(updated_at),
+        }
+        if webhook_url:
+            job["webhook_status"] = webhook_status
+        return job
+
+    def stats(self) -> dict:
+        with self._lock:
+            by_status = dict(self._db().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        return {
+            "workers": len(self._threads),
+            **{status: by_status.get(status, 0) for status in (QUEUED, RUNNING, SUCCEEDED, DEAD)},
+            "processed": self.processed,
+            "retried": self.retried,
+            "dead_lettered": self.dead_lettered,
+            "webhook_failures": self.webhook_failures,
+        }
@@ -0,0 +1,262 @@
+"""
+JSON Extraction for Model Responses
+Pulls the first schema-valid JSON object out of free-form model output.
+
+Replaces the greedy ``re.search(r'\\{.*\\}', ...)`` + ``json.loads`` pattern,
+which swallows everything between the first "{" and the last "}" and so breaks
+on trailing prose, two objects, or a "}" inside later text.
+
+- Fast path: decode straight from the first "{" (bare JSON, ```json fences and
+  prose before/after all succeed here with one C-level decode).
+- Slow path: one left-to-right scan that jumps between structural characters,
+  yields each balanced top-level object (and a truncated tail, closed off),
+  and retries failed candidates after repairing common LLM mistakes: trailing
+  commas, “smart quotes” used as delimiters and Python True/False/None. Raw
+  newlines inside strings are accepted by decoding non-strictly.
+- Every candidate is checked against an optional schema (the OpenAPI subset
+  Gemini's response_schema uses: type, properties, required, items, nullable).
+
+Cost on clean responses (benchmarks/bench_json_extract.py, 1 vCPU): about 5 us
+to decode against about 7 us for regex + json.loads, since the fast path is a
+single decode with no regex pass. The schema check adds 3-4 us that the old
+parser never paid, so a validated clean parse costs about 9 us. It is not
+faster than the old parser; the gain is in the responses it recovers.
+"""
+
+import json
+import re
+
+# Lenient about control characters: models put raw newlines inside story text
+_DECODER = json.JSONDecoder(strict=False)
+
+# The only characters that change nesting/string state; finditer skips everything else at C speed
+_STRUCTURAL = re.compile(r'[{}\[\]"\\]')
+
+_PY_LITERALS = {"True": "true", "False": "false", "None": "null"}
+
+# One C-level pass over the candidate; the callback only runs on tokens that may need fixing.
+# Straight-quoted strings are matched first so nothing inside them is ever rewritten.
+_REPAIR_RE = re.compile(
+    r'"(?:[^"\\]|\\.)*"'        # a JSON string
+    r'|[“„]([^”“]*)[”“]'        # a string delimited by smart quotes
+    r'|,(\s*[}\]])'              # trailing comma before a closer
+    r'|\b(True|False|None)\b',   # Python literals
+    re.DOTALL,
+)
+
+_TYPES = {
+    "object": dict,
+    "array": list,
+    "string": str,
+    "boolean": bool,
+    "integer": int,
+    "number": (int, float),
+}
+
+
+class JSONExtractionError(ValueError):
+    """No schema-valid JSON object could be recovered from the text."""
+
+
+def validate(value, schema: dict, path: str = "$") -> list[str]:
+    """Return a list of schema violations (empty when ``value`` conforms)."""
+    errors = []
+    _check(value, schema, (path,), errors)
+    return errors
+
+
+def is_valid(value, schema: dict) -> bool:
+    """``not validate(value, schema)``, without building error paths; the fast check for the common case."""
+    if value is None:
+        return bool(schema.get("nullable"))
+    expected = schema.get("type")
+    if expected is None:
+        return True
+    expected = expected.lower()
+    if not isinstance(value, _TYPES[expected]) or (expected in ("integer", "number") and isinstance(value, bool)):
+        return False
+    if expected == "object":
+        for key in schema.get("required", ()):
+            if key not in value:
+                return False
+        properties = schema.get("properties")
+        if properties:
+            for key, sub_schema in properties.items():
+                if key in value and not is_valid(value[key], sub_schema):
+                    return False
+    elif expected == "array":
+        items = schema.get("items")
+        if items:
+            for item in value:
+                if not is_valid(item, items):
+                    return False
+    return True
+
+
+def _format_path(path: tuple) -> str:
+    # Paths are linked (parent, key) tuples so the common no-error case never builds strings
+    parts = []
+    while len(path) == 2:
+        path, key = path
+        parts.append(f"[{key}]" if isinstance(key, int) else f".{key}")
+    return path[0] + "".join(reversed(parts))
+
+
+def _check(value, schema: dict, path: tuple, errors: list):
+    if value is None:
+        if not schema.get("nullable"):
+            errors.append(f"{_format_path(path)}: must not be null")
+        return
+    expected = schema.get("type")
+    if expected is None:
+        return
+    expected = expected.lower()
+    if not isinstance(value, _TYPES[expected]) or (expected in ("integer", "number") and isinstance(value, bool)):
+        errors.append(f"{_format_path(path)}: expected {expected}")
+        return
+
+    if expected == "object":
+        for key in schema.get("required", ()):
+            if key not in value:
+                errors.append(f"{_format_path(path)}.{key}: required")
+        properties = schema.get("properties")
+        if properties:
+            for key, sub_schema in properties.items():
+                if key in value:
+                    _check(value[key], sub_schema, (path, key), errors)
+    elif expected == "array":
+        items = schema.get("items")
+        if items:
+            for i, item in enumerate(value):
+                _check(item, items, (path, i), errors)
+
+
+def _object_spans(text: str):
+    """
+    Yield ``(start, end, open_stack, in_string)`` for each top-level {...} in one pass.
+
+    Complete objects come back with an empty stack; if the text ends inside an
+    object (a truncated response) the last span carries what is still open.
+    """
+    stack = []
+    in_string = False
+    skip_to = -1  # index after an escaped character
+    start = 0
+    for match in _STRUCTURAL.finditer(text):
+        i = match.start()
+        ch = match.group()
+        if in_string:
+            if i < skip_to:
+                continue
+            if ch == "\\":
+                skip_to = i + 2
+            elif ch == '"':
+                in_string = False
+            continue
+        if not stack:
+            if ch == "{":
+                start = i
+                stack.append(ch)
+            continue
+        if ch == '"':
+            in_string = True
+        elif ch in "{[":
+            stack.append(ch)
+        elif ch in "}]":
+            stack.pop()
+            if not stack:
+                yield start, i + 1, (), False
+    if stack:
+        yield start, len(text), tuple(stack), in_string
+
+
+def _close_truncated(span: str, open_stack: tuple, in_string: bool) -> str:
+    """Best-effort completion of a response that was cut off mid-object."""
+    if in_string:
+        span += '"'
+    span = span.rstrip()
+    if span.endswith(":"):
+        span += " null"
+    elif span.endswith(","):
+        span = span[:-1]
+    elif open_stack[-1] == "{":
+        # A dangling key with no value yet: {"a": 1, "b"
+        span = re.sub(r'([{,])\s*"(?:[^"\\]|\\.)*"$', lambda m: "" if m.group(1) == "," else "{", span)
+    return span + "".join("}" if c == "{" else "]" for c in reversed(open_stack))
+
+
+def _truncated_candidates(span: str, open_stack: tuple, in_string: bool, retries: int = 3):
+    """Close the cut-off object; if that fails, also try dropping back to each of the last few commas."""
+    yield _close_truncated(span, open_stack, in_string)
+    for _ in range(retries):
+        cut = span.rfind(",")
+        if cut <= 0:
+            return
+        span = span[:cut]
+        tail = list(_object_spans(span))
+        if not tail or not tail[-1][2]:
+            return
+        _, _, open_stack, in_string = tail[-1]
+        yield _close_truncated(span, open_stack, in_string)
+
+
+def _repair_token(match) -> str:
+    token = match.group(0)
+    if token[0] == '"':
+        return token  # a well-formed string: leave untouched
+    if match.group(1) is not None:
+        inner = match.group(1).replace("\\", "\\\\").replace('"', '\\"')
+        return f'"{inner}"'
+    if match.group(2) is not None:
+        return match.group(2)  # drop the trailing comma, keep the closer
+    return _PY_LITERALS[match.group(3)]
+
+
+def repair_json(span: str) -> str:
+    """Fix trailing commas, smart-quote delimiters and Python literals (raw newlines are decoded leniently)."""
+    return _REPAIR_RE.sub(_repair_token, span)
+
+
+def _decode(candidate: str, schema: dict | None):
+    try:
+        value = _DECODER.decode(candidate)
+    except ValueError:
+        return None, "invalid JSON"
+    if not isinstance(value, dict):
+        return None, "not an object"
+    if schema is not None and not is_valid(value, schema):
+        return None, "; ".join(validate(value, schema)[:3])
+    return value, None
+
+
+def extract_json(text: str, schema: dict | None = None) -> dict:
+    """Return the first JSON object in ``text`` that parses (after repair) and matches ``schema``."""
+    text = text or ""
+    first = text.find("{")
+    if first == -1:
+        raise JSONExtractionError("No JSON object in model response")
+
+    # Fast path: one C-level decode from the first brace
+    try:
+        value, _ = _DECODER.raw_decode(text, first)
+    except ValueError:
+        fast_ok = False
+    else:
+        fast_ok = True
+        if isinstance(value, dict) and (schema is None or is_valid(value, schema)):
+            return value
+
+    last_error = "invalid JSON"
+    for start, end, open_stack, in_string in _object_spans(text):
+        if fast_ok and start == first and not open_stack:
+            continue  # already decoded above; it failed the schema
+        span = text[start:end]
+        candidates = _truncated_candidates(span, open_stack, in_string) if open_stack else (span,)
+        for candidate in candidates:
+            value, error = _decode(candidate, schema)
+            if value is None and error == "invalid JSON":
+                value, error = _decode(repair_json(candidate), schema)
+            if value is not None:
+                return value
+            last_error = error
+    raise JSONExtractionError(f"No usable JSON object in model response ({last_error})")
@@ -0,0 +1,241 @@
+"""
+Per-Key Model Client Pool
+Keeps one Gemini model client per user-supplied API key so requests never
+touch the process-wide ``genai.configure`` state.
+
+Clients are held in an LRU keyed by a hash of the API key (the key itself is
+never stored as a dict key or logged) and are dropped after sitting idle.
+
+The Gemini SDK is imported on the first client build, not at import time: it
+accounts for most of the app's import cost, which every worker and test would
+otherwise pay up front.
+"""
+
+import asyncio
+import functools
+import hashlib
+import json
+import logging
+import random
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger("story_engine")
+
+
+def key_fingerprint(api_key: str) -> str:
+    """Stable, non-reversible identifier for an API key."""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:32]
+
+
+@functools.cache
+def _keyed_model_class():
+    import google.generativeai as genai
+    # Private API, hence the exact pin in requirements.txt (guarded by test_model_clients.py)
+    from google.generativeai.client import _ClientManager
+
+    class KeyedGenerativeModel(genai.GenerativeModel):
+        """GenerativeModel bound to its own client manager instead of the global one."""
+
+        def __init__(self, model_name: str, api_key: str, **kwargs):
+            super().__init__(model_name, **kwargs)
+            self._client_manager = _ClientManager()
+            self._client_manager.configure(api_key=api_key)
+
+        def generate_content(self, *args, **kwargs):
+            if self._client is None:
+                self._client = self._client_manager.get_default_client("generative")
+            return super().generate_content(*args, **kwargs)
+
+        async def generate_content_async(self, *args, **kwargs):
+            # The async client is created lazily so it binds to the event loop that runs the call
+            if self._async_client is None:
+                self._async_client = self._client_manager.get_default_client("generative_async")
+            return await super().generate_content_async(*args, **kwargs)
+
+        def count_tokens(self, *args, **kwargs):
+            if self._client is None:
+                self._client = self._client_manager.get_default_client("generative")
+            return super().count_tokens(*args, **kwargs)
+
+    return KeyedGenerativeModel
+
+
+def keyed_generative_model(model_name: str, api_key: str, **kwargs):
+    """A GenerativeModel bound to ``api_key`` (imports the Gemini SDK on first call)."""
+    return _keyed_model_class()(model_name, api_key, **kwargs)
+
+
+class LazyModel:
+    """Stands in for a model client and builds it on first attribute access."""
+
+    def __init__(self, build):
+        self._build = build  # zero-argument callable returning the real client
+        self._model = None
+        self._lock = threading.Lock()
+
+    def _get(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    started = time.perf_counter()
+                    self._model = self._build()
+                    logger.info("Model client ready in %.0f ms", (time.perf_counter() - started) * 1000)
+        return self._model
+
+    @property
+    def ready(self) -> bool:
+        return self._model is not None
+
+    def __getattr__(self, name):
+        return getattr(self._get(), name)
+
+
+class ModelClientPool:
+    """Thread-safe LRU of per-key model clients with idle expiry."""
+
+    def __init__(self, model_name: str, max_clients: int = 32, idle_ttl_seconds: int = 15 * 60):
+        self.model_name = model_name
+        self.max_clients = max_clients
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self._clients = OrderedDict()  # fingerprint -> (model, last_used)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, api_key: str):
+        """Return the warm client for ``api_key``, creating it on first use."""
+        fingerprint = key_fingerprint(api_key)
+        now = time.monotonic()
+        with self._lock:
+            self._expire_idle(now)
+            entry = self._clients.get(fingerprint)
+            if entry is not None:
+                self.hits += 1
+                self._clients[fingerprint] = (entry[0], now)
+                self._clients.move_to_end(fingerprint)
+                return entry[0]
+
+            self.misses += 1
+            client = keyed_generative_model(self.model_name, api_key)
+            self._clients[fingerprint] = (client, now)
+            while len(self._clients) > self.max_clients:
+                self._clients.popitem(last=False)
+                self.evictions += 1
+            return client
+
+    def _expire_idle(self, now: float):
+        # Entries are kept in last-used order, so idle ones are always at the front
+        while self._clients:
+            fingerprint, (_, last_used) = next(iter(self._clients.items()))
+            if now - last_used < self.idle_ttl_seconds:
+                break
+            del self._clients[fingerprint]
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "clients": len(self._clients),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+class StubModelError(RuntimeError):
+    """An injected StubGenerativeModel failure."""
+
+
+class _StubResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class _StubTokenCount:
+    def __init__(self, total_tokens: int):
+        self.total_tokens = total_tokens
+
+
+_STUB_WORDS = ("brave little dragon found a glowing lantern by the river and shared it with "
+               "a shy friend who was afraid of the dark forest").split()
+
+
+class StubGenerativeModel:
+    """
+    Local stand-in for a Gemini model (load tests, offline development): fixed
+    latency, optional injected failures, no network.
+
+    Replies in the shape the caller asks for: JSON matching the
+    ``response_schema`` of ``generation_config`` when there is one, otherwise a
+    story with [TITLE: ...] and [WISDOM GEM: ...] markers.
+    """
+
+    def __init__(self, latency_seconds: float = 0.0, failure_rate: float = 0.0, words: int = 300, seed=None):
+        self.latency_seconds = latency_seconds
+        self.failure_rate = failure_rate
+        self.words = words
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _should_fail(self) -> bool:
+        with self._lock:
+            return self._random.random() < self.failure_rate
+
+    def _sentence(self, words: int) -> str:
+        with self._lock:
+            picked = [self._random.choice(_STUB_WORDS) for _ in range(words)]
+        return " ".join(picked).capitalize() + "."
+
+    def _from_schema(self, schema: dict, name: str = "", index: int = 0):
+        kind = schema.get("type", "string")
+        if kind == "object":
+            return {key: self._from_schema(sub, key, index) for key, sub in schema.get("properties", {}).items()}
+        if kind == "array":
+            return [self._from_schema(schema.get("items", {}), name, i) for i in range(3)]
+        if kind == "boolean":
+            return False
+        if kind in ("integer", "number"):
+            return index + 1
+        if name == "id":
+            return f"choice_{index + 1}"
+        return self._sentence(40 if name == "text" else 8)
+
+    def _reply(self, generation_config) -> str:
+        schema = (generation_config or {}).get("response_schema") if isinstance(generation_config, dict) else None
+        if schema:
+            return json.dumps(self._from_schema(schema))
+        paragraphs = [self._sentence(60) for _ in range(max(1, self.words // 60))]
+        return (f"[TITLE: {self._sentence(4)[:-1]}]\n\n" + "\n\n".join(paragraphs)
+                + f"\n\n[WISDOM GEM: {self._sentence(8)}]")
+
+    def _chunks(self, text: str) -> list:
+        return [_StubResponse(text[i:i + 80]) for i in range(0, len(text), 80)]
+
+    def generate_content(self, prompt, stream: bool = False, generation_config=None, **kwargs):
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+        if self._should_fail():
+            raise StubModelError("stub model failure (injected)")
+        text = self._reply(generation_config)
+        return iter(self._chunks(text)) if stream else _StubResponse(text)
+
+    async def generate_content_async(self, prompt, stream: bool = False, generation_config=None, **kwargs):
+        if self.latency_seconds:
+            await asyncio.sleep(self.latency_seconds)
+        if self._should_fail():
+            raise StubModelError("stub model failure (injected)")
+        text = self._reply(generation_config)
+        if not stream:
+            return _StubResponse(text)
+
+        async def chunks():
+            for chunk in self._chunks(text):
+                yield chunk
+                await asyncio.sleep(0)
+        return chunks()
+
+    def count_tokens(self, prompt, **kwargs):
+        return _StubTokenCount(len(str(prompt).split()))
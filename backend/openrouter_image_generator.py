@@ -2,20 +2,151 @@
 OpenRouter Image Generation Service
 Uses Stable Diffusion via OpenRouter (CHEAP: ~$0.002-0.005 per image!)
 Compatible with your existing OpenRouter API key
+
+Multi-image requests run concurrently over one pooled HTTP session, paced by a
+token-bucket rate limiter, with jittered exponential backoff on 429/5xx.
 """
 
 import os
+import random
+import threading
 import requests
-import base64
+from requests.adapters import HTTPAdapter
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import time
 
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """Thread-safe token bucket: ``rate`` tokens per second, bursts up to ``capacity``."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available, then take it."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
 class OpenRouterImageGenerator:
-    def __init__(self, api_key=None):
-        """Initialize with OpenRouter API key"""
+    def __init__(
+        self,
+        api_key=None,
+        requests_per_second: float = 2.0,
+        burst: int = 4,
+        max_workers: int = 4,
+        max_retries: int = 3,
+        backoff_base: float = 0.5,
+    ):
+        """
+        Initialize with OpenRouter API key
+
+        Args:
+            api_key: OpenRouter key (default: OPENROUTER_API_KEY)
+            requests_per_second: Sustained request rate allowed by the limiter
+            burst: Requests that may start back-to-back before pacing kicks in
+            max_workers: Images generated concurrently (also the HTTP pool size)
+            max_retries: Retries per image on 429/5xx/network errors
+            backoff_base: First backoff ceiling in seconds (doubles per retry, full jitter)
+        """
         self.api_key = api_key or os.getenv("OPENROUTER_API_KEY")
         self.base_url = "https://openrouter.ai/api/v1"
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.rate_limiter = TokenBucket(requests_per_second, burst)
+
+        # One keep-alive session for every request this generator makes
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({
+            "Authorization": f"Bearer {self.api_key}",
+            "HTTP-Referer": "http://localhost:5000",  # Your app URL
+            "X-Title": "Story Creator App",
+        })
+
+    def generate_batch(self, prompts: list) -> list:
+        """
+        Generate one image per prompt concurrently.
+
+        Args:
+            prompts: Image prompts
+
+        Returns:
+            List aligned with ``prompts``: an image dict, or None where generation failed
+        """
+        if not prompts:
+            return []
+        workers = min(self.max_workers, len(prompts))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="openrouter") as pool:
+            return list(pool.map(self._generate_one, prompts, range(len(prompts))))
+
+    def _generate_one(self, prompt: str, index: int):
+        """POST one image request, retrying 429/5xx and network errors with jittered backoff."""
+        for attempt in range(self.max_retries + 1):
+            self.rate_limiter.acquire()
+            retry_after = None
+            try:
+                # Use Stable Diffusion XL via OpenRouter
+                response = self.session.post(
+                    f"{self.base_url}/images/generations",
+                    json={
+                        "model": "stabilityai/stable-diffusion-xl-base-1.0",  # Cheap & good
+                        "prompt": prompt,
+                        "n": 1,
+                        "size": "1024x1024",
+                    },
+                    timeout=60,
+                )
+                if response.status_code == 200:
+                    data = response.json()
+                    return {
+                        'id': f"{uuid.uuid4()}_{index}",
+                        'prompt': prompt,
+                        'image_url': data['data'][0]['url'],
+                        'format': 'png',
+                        'generated_at': datetime.now().isoformat(),
+                    }
+                if response.status_code not in RETRYABLE_STATUS:
+                    print(f"OpenRouter API error: {response.status_code} - {response.text}")
+                    return None
+                retry_after = response.headers.get("Retry-After")
+                print(f"OpenRouter API error: {response.status_code} (attempt {attempt + 1})")
+            except (requests.ConnectionError, requests.Timeout) as e:
+                print(f"Error generating image {index + 1} (attempt {attempt + 1}): {e}")
+            except Exception as e:
+                print(f"Error generating image {index + 1}: {e}")
+                return None
+
+            if attempt < self.max_retries:
+                time.sleep(self._backoff(attempt, retry_after))
+        return None
+
+    def _backoff(self, attempt: int, retry_after=None) -> float:
+        """Full-jitter exponential backoff, never shorter than the server's Retry-After."""
+        delay = random.uniform(0, self.backoff_base * (2 ** attempt))
+        try:
+            return max(delay, float(retry_after)) if retry_after else delay
+        except ValueError:
+            return delay
 
     def generate_story_illustration(
         self,
@@ -31,7 +162,7 @@ class OpenRouterImageGenerator:
             scene_description: Description of the scene to illustrate
             character_name: Name of the main character
             style: Art style
-            num_images: Number of images (note: generates 1 at a time)
+            num_images: Number of images (generated concurrently)
 
         Returns:
             List of dicts with image URLs or base64 data
@@ -46,48 +177,7 @@ Main character: {character_name}
 Style: colorful, vibrant, child-friendly, professional illustration, ages 4-8, engaging, imaginative, no text, clean composition
 """.strip()
 
-        images = []
-        for i in range(num_images):
-            try:
-                # Use Stable Diffusion XL via OpenRouter
-                response = requests.post(
-                    f"{self.base_url}/images/generations",
-                    headers={
-                        "Authorization": f"Bearer {self.api_key}",
-                        "HTTP-Referer": "http://localhost:5000",  # Your app URL
-                        "X-Title": "Story Creator App",
-                    },
-                    json={
-                        "model": "stabilityai/stable-diffusion-xl-base-1.0",  # Cheap & good
-                        "prompt": prompt,
-                        "n": 1,
-                        "size": "1024x1024",
-                    },
-                    timeout=60,
-                )
-
-                if response.status_code == 200:
-                    data = response.json()
-                    image_url = data['data'][0]['url']
-
-                    images.append({
-                        'id': f"{uuid.uuid4()}_{i}",
-                        'prompt': prompt,
-                        'image_url': image_url,
-                        'format': 'png',
-                        'generated_at': datetime.now().isoformat(),
-                    })
-                else:
-                    print(f"OpenRouter API error: {response.status_code} - {response.text}")
-
-                # Rate limiting
-                if i < num_images - 1:
-                    time.sleep(1)
-
-            except Exception as e:
-                print(f"Error generating image {i+1}: {e}")
-
-        return images
+        return [image for image in self.generate_batch([prompt] * num_images) if image]
 
     def generate_coloring_page(
         self,
@@ -116,46 +206,7 @@ Main character: {character_name}
 Style: simple black outlines only, no colors, no shading, no gray, thick bold lines, large areas to color, high contrast, white background, suitable for printing, similar to Disney coloring books, ages 4-8, no text
 """.strip()
 
-        images = []
-        for i in range(num_images):
-            try:
-                response = requests.post(
-                    f"{self.base_url}/images/generations",
-                    headers={
-                        "Authorization": f"Bearer {self.api_key}",
-                        "HTTP-Referer": "http://localhost:5000",
-                        "X-Title": "Story Creator App",
-                    },
-                    json={
-                        "model": "stabilityai/stable-diffusion-xl-base-1.0",
-                        "prompt": prompt,
-                        "n": 1,
-                        "size": "1024x1024",
-                    },
-                    timeout=60,
-                )
-
-                if response.status_code == 200:
-                    data = response.json()
-                    image_url = data['data'][0]['url']
-
-                    images.append({
-                        'id': f"{uuid.uuid4()}_{i}",
-                        'prompt': prompt,
-                        'image_url': image_url,
-                        'format': 'png',
-                        'generated_at': datetime.now().isoformat(),
-                    })
-                else:
-                    print(f"OpenRouter API error: {response.status_code} - {response.text}")
-
-                if i < num_images - 1:
-                    time.sleep(1)
-
-            except Exception as e:
-                print(f"Error generating coloring page {i+1}: {e}")
-
-        return images
+        return [image for image in self.generate_batch([prompt] * num_images) if image]
 
 
 # Example usage & testing
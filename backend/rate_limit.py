@@ -0,0 +1,196 @@
+"""
+Rate Limiting and Admission Control
+Token buckets per client and per API key, checked before a generation route runs.
+
+Each bucket class ("text", "image") has a burst capacity and a refill rate.
+Requests that bring their own ``user_api_key`` to a route that runs on it are
+charged to a bucket keyed by the key's fingerprint (they spend their own quota,
+so their limits are scaled up); everyone on the server key is charged by client
+address.
+
+Two storage backends are available:
+- memory: in-process buckets (per worker)
+- sqlite: shared file, so every worker on the host enforces one limit
+"""
+
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class BucketLimit:
+    """Burst ``capacity`` tokens, refilled at ``per_minute`` tokens per minute."""
+
+    def __init__(self, capacity: float, per_minute: float):
+        self.capacity = float(capacity)
+        self.rate = per_minute / 60.0
+
+    def scaled(self, factor: float) -> "BucketLimit":
+        return BucketLimit(self.capacity * factor, self.rate * 60.0 * factor)
+
+    def take(self, tokens: float, updated: float, now: float, cost: float):
+        """
+        Refill, then try to spend ``cost``.
+
+        Returns ``(allowed, tokens_left, retry_after_seconds)``.
+        """
+        tokens = min(self.capacity, tokens + (now - updated) * self.rate)
+        if tokens >= cost:
+            return True, tokens - cost, 0.0
+        if self.rate <= 0:
+            return False, tokens, math.inf
+        return False, tokens, (cost - tokens) / self.rate
+
+
+class MemoryBucketStore:
+    """In-process bucket state, bounded by the number of tracked identities."""
+
+    name = "memory"
+
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # key -> (tokens, updated)
+        self._lock = threading.Lock()
+
+    def take(self, key: str, limit: BucketLimit, now: float, cost: float):
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (limit.capacity, now))
+            allowed, tokens, retry_after = limit.take(tokens, updated, now, cost)
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                # Least recently charged first; an idle bucket has refilled anyway
+                self._buckets.popitem(last=False)
+            return allowed, retry_after
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"tracked": len(self._buckets)}
+
+
+class SQLiteBucketStore:
+    """SQLite-backed bucket state, shared between worker processes on the same host."""
+
+    name = "sqlite"
+
+    def __init__(self, path: str, idle_seconds: float = 3600):
+        self.path = path
+        self.idle_seconds = idle_seconds
+        self._lock = threading.Lock()
+        self._last_prune = 0.0
+        self._conn = None  # opened on first use, so a pre-fork master never holds it
+
+    def _db(self) -> sqlite3.Connection:
+        """The bucket connection, created (with its schema) on first use; call with ``_lock`` held."""
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS rate_buckets ("
+                " key TEXT PRIMARY KEY,"
+                " tokens REAL NOT NULL,"
+                " updated REAL NOT NULL)"
+            )
+            self._conn = conn
+        return self._conn
+
+    def take(self, key: str, limit: BucketLimit, now: float, cost: float):
+        with self._lock:
+            conn = self._db()
+            # BEGIN IMMEDIATE takes the write lock up front so read-modify-write is atomic across workers
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT tokens, updated FROM rate_buckets WHERE key = ?", (key,)).fetchone()
+                tokens, updated = row if row else (limit.capacity, now)
+                allowed, tokens, retry_after = limit.take(tokens, updated, now, cost)
+                conn.execute(
+                    "INSERT OR REPLACE INTO rate_buckets (key, tokens, updated) VALUES (?, ?, ?)",
+                    (key, tokens, now),
+                )
+                if now - self._last_prune > 60:
+                    conn.execute("DELETE FROM rate_buckets WHERE updated < ?", (now - self.idle_seconds,))
+                    self._last_prune = now
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            return allowed, retry_after
+
+    def stats(self) -> dict:
+        with self._lock:
+            conn = self._db()
+            (count,) = conn.execute("SELECT COUNT(*) FROM rate_buckets").fetchone()
+        return {"tracked": count}
+
+
+class RateLimiter:
+    """Named bucket classes over one store, with allowed/limited accounting."""
+
+    def __init__(self, store, limits: dict, user_key_factor: float = 4.0):
+        self.store = store
+        self.limits = limits  # bucket name -> BucketLimit
+        self.user_key_limits = {name: limit.scaled(user_key_factor) for name, limit in limits.items()}
+        self.user_key_factor = user_key_factor
+        self._lock = threading.Lock()
+        self._counts = {name: [0, 0] for name in limits}  # name -> [allowed, limited]
+
+    def acquire(self, bucket: str, identity: str, user_key: bool = False, cost: float = 1.0):
+        """
+        Charge ``cost`` tokens from ``identity``'s ``bucket``.
+
+        Returns ``(allowed, retry_after_seconds)``.
+        """
+        limit = (self.user_key_limits if user_key else self.limits)[bucket]
+        allowed, retry_after = self.store.take(f"{bucket}:{identity}", limit, time.time(), cost)
+        with self._lock:
+            self._counts[bucket][0 if allowed else 1] += 1
+        return allowed, retry_after
+
+    def stats(self) -> dict:
+        with self._lock:
+            counts = {name: {"allowed": c[0], "limited": c[1]} for name, c in self._counts.items()}
+        return {
+            "backend": self.store.name,
+            "buckets": {
+                name: {"burst": limit.capacity, "per_minute": round(limit.rate * 60, 2), **counts[name]}
+                for name, limit in self.limits.items()
+            },
+            "user_key_factor": self.user_key_factor,
+            **self.store.stats(),
+        }
+
+
+def retry_after_header(seconds: float) -> str:
+    """Whole seconds for a Retry-After header (at least 1)."""
+    if math.isinf(seconds):
+        return "3600"
+    return str(max(1, math.ceil(seconds)))
+
+
+def build_rate_limiter_from_env(basedir: str):
+    """
+    Create the rate limiter described by the RATE_LIMIT_* environment variables.
+
+    Returns None when RATE_LIMIT_BACKEND is "off".
+    """
+    backend_name = os.getenv("RATE_LIMIT_BACKEND", "memory").lower()
+    if backend_name in ("off", "none", "disabled", ""):
+        return None
+
+    limits = {
+        "text": BucketLimit(
+            float(os.getenv("RATE_LIMIT_TEXT_BURST", "10")),
+            float(os.getenv("RATE_LIMIT_TEXT_PER_MINUTE", "30")),
+        ),
+        "image": BucketLimit(
+            float(os.getenv("RATE_LIMIT_IMAGE_BURST", "4")),
+            float(os.getenv("RATE_LIMIT_IMAGE_PER_MINUTE", "10")),
+        ),
+    }
+    if backend_name == "sqlite":
+        store = SQLiteBucketStore(os.getenv("RATE_LIMIT_PATH", os.path.join(basedir, "rate_limits.db")))
+    else:
+        store = MemoryBucketStore()
+    return RateLimiter(store, limits, user_key_factor=float(os.getenv("RATE_LIMIT_USER_KEY_FACTOR", "4")))
@@ -1,13 +1,101 @@
-"""Wrapper to run app.py with proper UTF-8 encoding"""
-import sys
+"""
+Production launcher for the story API
+
+    python run.py                      # best available server (gunicorn, else waitress)
+    python run.py --server waitress    # force one: gunicorn | waitress | dev
+    python run.py --workers 4 --threads 16 --port 8000
+
+gunicorn (Linux/macOS) runs multi-process gthread workers configured by
+gunicorn.conf.py. waitress (Windows, or wherever gunicorn is missing) runs one
+multi-threaded process. ``dev`` is Flask's development server, for debugging only.
+Flags override the matching environment variables (PORT, WEB_CONCURRENCY, WEB_THREADS).
+"""
+
+import argparse
+import importlib.util
+import logging
 import os
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+logger = logging.getLogger("story_engine")
+
+
+def _available(module: str) -> bool:
+    return importlib.util.find_spec(module) is not None
+
+
+def _pick_server(requested: str) -> str:
+    if requested != "auto":
+        return requested
+    if sys.platform != "win32" and _available("gunicorn"):
+        return "gunicorn"
+    if _available("waitress"):
+        return "waitress"
+    logger.warning("Neither gunicorn nor waitress is installed; falling back to the Flask dev server")
+    return "dev"
+
+
+def _run_gunicorn():
+    # Replace this process, so signals (HUP/USR2/TERM) go straight to the gunicorn master
+    os.execvp(sys.executable, [
+        sys.executable, "-m", "gunicorn",
+        "--config", os.path.join(BACKEND_DIR, "gunicorn.conf.py"),
+        "app:create_app()",
+    ])
+
+
+def _run_waitress(host: str, port: int, threads: int):
+    from waitress import serve
+
+    from app import create_app
+
+    logger.info("Serving on http://%s:%d with waitress (%d threads)", host, port, threads)
+    # Model calls hold a thread while they wait, so allow as many queued connections as threads
+    serve(create_app(), host=host, port=port, threads=threads, connection_limit=max(100, threads * 4))
+
+
+def _run_dev(host: str, port: int):
+    from app import create_app
+
+    create_app().run(host=host, port=port, debug=False, threaded=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--server", choices=("auto", "gunicorn", "waitress", "dev"),
+                        default=os.getenv("STORY_SERVER", "auto"))
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "5000")))
+    parser.add_argument("--workers", type=int, help="gunicorn worker processes (WEB_CONCURRENCY)")
+    parser.add_argument("--threads", type=int, help="threads per worker (WEB_THREADS)")
+    args = parser.parse_args()
+
+    # Windows consoles default to a legacy code page; story text is full of emoji and accents
+    sys.stdout.reconfigure(encoding="utf-8")
+    sys.stderr.reconfigure(encoding="utf-8")
+    os.chdir(BACKEND_DIR)
+    if BACKEND_DIR not in sys.path:
+        sys.path.insert(0, BACKEND_DIR)
+
+    # Everything goes through the environment, so gunicorn.conf.py sees the same values
+    os.environ["HOST"] = args.host
+    os.environ["PORT"] = str(args.port)
+    if args.workers:
+        os.environ["WEB_CONCURRENCY"] = str(args.workers)
+    if args.threads:
+        os.environ["WEB_THREADS"] = str(args.threads)
 
-# Set UTF-8 encoding for stdout and stderr
-sys.stdout.reconfigure(encoding='utf-8')
-sys.stderr.reconfigure(encoding='utf-8')
+    server = _pick_server(args.server)
+    if server == "gunicorn":
+        _run_gunicorn()
+    elif server == "waitress":
+        _run_waitress(args.host, args.port, int(os.getenv("WEB_THREADS", "8")))
+    else:
+        _run_dev(args.host, args.port)
 
-# Change to the backend directory
-os.chdir(os.path.dirname(os.path.abspath(__file__)))
 
-# Import and run the app
-import app
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
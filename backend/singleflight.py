@@ -0,0 +1,65 @@
+"""
+Request Coalescing (single flight)
+Concurrent calls with the same key share one execution and its result.
+
+Retries, double-taps and a classroom of tablets sending the same request in
+the same second otherwise each reach Gemini. The first caller for a key runs
+the call; everyone arriving while it is in flight waits for that result (or
+exception). Nothing is kept once the call finishes, so this complements the
+story cache rather than replacing it.
+"""
+
+import concurrent.futures
+import threading
+
+
+class SingleFlight:
+    """Per-key deduplication of in-flight calls, with per-route counters."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}    # key -> Future shared by the leader and its followers
+        self._counts = {}   # route -> [executed, coalesced]
+
+    def do(self, key: tuple, fn, *args, **kwargs):
+        """
+        Run ``fn(*args, **kwargs)`` unless an identical call is already running.
+
+        ``key[0]`` names the route for the counters. Returns ``(result, shared)``
+        where ``shared`` is True for callers that reused another call's result.
+        """
+        with self._lock:
+            counts = self._counts.setdefault(key[0], [0, 0])
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = concurrent.futures.Future()
+                self._calls[key] = future
+                counts[0] += 1
+            else:
+                counts[1] += 1
+
+        if not leader:
+            return future.result(), True
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            executed = sum(c[0] for c in self._counts.values())
+            coalesced = sum(c[1] for c in self._counts.values())
+            return {
+                "in_flight": len(self._calls),
+                "executed": executed,
+                "coalesced": coalesced,
+                "by_route": {route: {"executed": c[0], "coalesced": c[1]} for route, c in self._counts.items()},
+            }
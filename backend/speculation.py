@@ -0,0 +1,187 @@
+"""
+Speculative Branch Generation
+Pre-generates the continuation for every choice an interactive story offers
+while the child is still reading, so the picked branch is ready (or already in
+flight) when they choose.
+
+Speculative calls go through the shared GenerationService but are capped
+separately (in flight, per session, and only while no real request is queued),
+so they never crowd out live traffic. Branches are kept in process memory:
+a hit needs the continuation to reach the worker that launched it, which is
+why gunicorn.conf.py turns speculation off when it runs more than one worker.
+"""
+
+import concurrent.futures
+import threading
+import time
+
+
+def response_tokens(response) -> int:
+    """Output tokens of a model response (usage metadata, else ~4 characters per token)."""
+    usage = getattr(response, "usage_metadata", None)
+    count = getattr(usage, "candidates_token_count", None) if usage is not None else None
+    if count:
+        return int(count)
+    try:
+        text = response.text or ""
+    except Exception:
+        text = ""
+    return len(text) // 4
+
+
+class _Branch:
+    __slots__ = ("prompt", "future", "created")
+
+    def __init__(self, prompt, future):
+        self.prompt = prompt
+        self.future = future
+        self.created = time.monotonic()
+
+
+class BranchSpeculator:
+    """Launches, claims and discards speculative continuations keyed by (session, segment, choice)."""
+
+    def __init__(self, service, max_in_flight: int = 16, session_budget: int = 9, ttl_seconds: float = 600):
+        self.service = service
+        self.max_in_flight = max_in_flight
+        self.session_budget = session_budget
+        self.ttl_seconds = ttl_seconds
+
+        # Re-entrant: cancelling a future runs its done callbacks (which lock) synchronously
+        self._lock = threading.RLock()
+        self._branches = {}   # (session_id, position) -> {choice_id: _Branch}
+        self._spent = {}      # session_id -> (speculative calls launched, last used)
+        self._in_flight = 0
+
+        self.launched = 0
+        self.hits = 0
+        self.misses = 0
+        self.failed = 0
+        self.discarded = 0
+        self.cancelled = 0
+        self.skipped_budget = 0
+        self.skipped_capacity = 0
+        self.wasted_tokens = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_in_flight > 0 and self.session_budget > 0
+
+    def launch(self, session_id: str, position: int, model, prompts: dict, **kwargs) -> int:
+        """Start one call per ``{choice_id: prompt}`` (``kwargs`` go to generate_content); returns how many were launched."""
+        if not self.enabled or model is None or not prompts:
+            return 0
+        launched = 0
+        with self._lock:
+            self._expire()
+            spent, _ = self._spent.get(session_id, (0, 0))
+            branches = self._branches.setdefault((session_id, position), {})
+            for choice_id, prompt in prompts.items():
+                if choice_id in branches:
+                    continue
+                if spent >= self.session_budget:
+                    self.skipped_budget += 1
+                    continue
+                # Live requests waiting for a slot always win over speculation
+                if self._in_flight >= self.max_in_flight or self.service.queued > 0:
+                    self.skipped_capacity += 1
+                    continue
+                future = self.service.submit(model, prompt, **kwargs)
+                self._in_flight += 1
+                future.add_done_callback(self._on_done)
+                branches[choice_id] = _Branch(prompt, future)
+                spent += 1
+                launched += 1
+            self._spent[session_id] = (spent, time.monotonic())
+            self.launched += launched
+            if not branches:
+                del self._branches[(session_id, position)]
+        return launched
+
+    def claim(self, session_id: str, position: int, choice_id, prompt: str, timeout: float | None = None):
+        """
+        Take the speculative response for the chosen branch, discarding its siblings.
+
+        Returns None when nothing was launched for this choice, the stored
+        prompt no longer matches, or the call failed; the caller then generates
+        normally. ``wasted_tokens`` counts only branches that finished before
+        being discarded; cancelled ones are counted separately.
+        """
+        with self._lock:
+            branches = self._branches.pop((session_id, position), None)
+            if not branches:
+                return None  # nothing was speculated for this turn; not counted as a miss
+
+            chosen = branches.pop(str(choice_id), None) if choice_id is not None else None
+            for branch in branches.values():
+                self._discard(branch)
+            if chosen is None or chosen.prompt != prompt:
+                if chosen is not None:
+                    self._discard(chosen)
+                self.misses += 1
+                return None
+
+        try:
+            response = chosen.future.result(timeout=timeout or self.service.timeout)
+        except Exception:
+            chosen.future.cancel()
+            with self._lock:
+                self.failed += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return response
+
+    def forget(self, session_id: str):
+        """Discard every pending branch of a finished session."""
+        with self._lock:
+            for key in [key for key in self._branches if key[0] == session_id]:
+                for branch in self._branches.pop(key).values():
+                    self._discard(branch)
+            self._spent.pop(session_id, None)
+
+    # ---- internals ----
+    def _on_done(self, _future):
+        with self._lock:
+            self._in_flight -= 1
+
+    def _discard(self, branch: _Branch):
+        """Cancel an unfinished branch, or count a finished one's output as wasted (caller holds the lock)."""
+        if branch.future.cancel():
+            self.cancelled += 1
+            return
+        self.discarded += 1
+        try:
+            self.wasted_tokens += response_tokens(branch.future.result(timeout=0))
+        except (Exception, concurrent.futures.CancelledError):
+            pass
+
+    def _expire(self):
+        """Drop branches and budgets untouched for ttl_seconds (caller holds the lock)."""
+        cutoff = time.monotonic() - self.ttl_seconds
+        for key in [k for k, b in self._branches.items() if all(x.created < cutoff for x in b.values())]:
+            for branch in self._branches.pop(key).values():
+                self._discard(branch)
+        for session_id in [s for s, (_, used) in self._spent.items() if used < cutoff]:
+            del self._spent[session_id]
+
+    # ---- metrics ----
+    def metrics(self) -> dict:
+        claimed = self.hits + self.misses + self.failed
+        return {
+            "enabled": self.enabled,
+            "max_in_flight": self.max_in_flight,
+            "session_budget": self.session_budget,
+            "in_flight": self._in_flight,
+            "pending_branches": sum(len(b) for b in self._branches.values()),
+            "launched": self.launched,
+            "hits": self.hits,
+            "misses": self.misses,
+            "failed": self.failed,
+            "hit_rate": round(self.hits / claimed, 3) if claimed else 0.0,
+            "discarded": self.discarded,
+            "cancelled": self.cancelled,
+            "skipped_budget": self.skipped_budget,
+            "skipped_capacity": self.skipped_capacity,
+            "wasted_tokens": self.wasted_tokens,
+        }
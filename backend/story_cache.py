@@ -0,0 +1,243 @@
+"""
+Story Response Cache
+Content-addressed cache for generated stories, keyed on the normalized request.
+
+Two storage backends are available:
+- memory: in-process LRU (fastest, per worker)
+- sqlite: shared file, survives restarts and is visible to every worker
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def _normalize_text(value: str) -> str:
+    """Trim and collapse runs of whitespace so cosmetic differences share a key."""
+    return " ".join(value.split())
+
+
+def normalize_inputs(value):
+    """Recursively normalize request inputs into a JSON-stable structure."""
+    if isinstance(value, str):
+        return _normalize_text(value)
+    if isinstance(value, dict):
+        return {str(k): normalize_inputs(v) for k, v in sorted(value.items(), key=lambda kv: str(kv[0]))}
+    if isinstance(value, (list, tuple)):
+        return [normalize_inputs(v) for v in value]
+    return value
+
+
+def make_cache_key(route: str, inputs: dict, seed=0) -> str:
+    """
+    Build a SHA-256 key from the route, its normalized inputs and a seed.
+
+    The key is derived from the inputs rather than the final prompt text, because
+    prompt construction involves random choices that are themselves seeded from it.
+    """
+    material = json.dumps(
+        {"route": route, "inputs": normalize_inputs(inputs), "seed": seed},
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class MemoryCacheBackend:
+    """In-process LRU keyed by cache key, bounded by entry count and total bytes."""
+
+    name = "memory"
+
+    def __init__(self, max_entries: int = 1000, max_bytes: int = 64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (encoded value, expires_at)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key: str, now: float):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            encoded, expires_at = entry
+            if expires_at <= now:
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return encoded
+
+    def set(self, key: str, encoded: str, expires_at: float):
+        size = len(encoded.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (encoded, expires_at)
+            self._bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def _remove(self, key: str):
+        encoded, _ = self._entries.pop(key)
+        self._bytes -= len(encoded.encode("utf-8"))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._bytes, "evictions": self.evictions}
+
+
+class SQLiteCacheBackend:
+    """SQLite-backed LRU, shared between worker processes on the same host."""
+
+    name = "sqlite"
+
+    def __init__(self, path: str, max_entries: int = 1000, max_bytes: int = 64 * 1024 * 1024):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self._conn = None  # opened on first use, so a pre-fork master never holds it
+
+    def _db(self) -> sqlite3.Connection:
+        """The cache connection, created (with its schema) on first use; call with ``_lock`` held."""
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=5.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS story_cache ("
+                " key TEXT PRIMARY KEY,"
+                " value TEXT NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " expires_at REAL NOT NULL,"
+                " last_access REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_story_cache_last_access ON story_cache (last_access)")
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def get(self, key: str, now: float):
+        with self._lock:
+            conn = self._db()
+            row = conn.execute(
+                "SELECT value, expires_at FROM story_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            encoded, expires_at = row
+            if expires_at <= now:
+                conn.execute("DELETE FROM story_cache WHERE key = ?", (key,))
+                conn.commit()
+                return None
+            conn.execute("UPDATE story_cache SET last_access = ? WHERE key = ?", (now, key))
+            conn.commit()
+            return encoded
+
+    def set(self, key: str, encoded: str, expires_at: float):
+        size = len(encoded.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock:
+            conn = self._db()
+            conn.execute(
+                "INSERT OR REPLACE INTO story_cache (key, value, size, expires_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, encoded, size, expires_at, now),
+            )
+            conn.execute("DELETE FROM story_cache WHERE expires_at <= ?", (now,))
+            self._evict()
+            conn.commit()
+
+    def _evict(self):
+        conn = self._db()
+        count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM story_cache").fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+        rows = conn.execute("SELECT key, size FROM story_cache ORDER BY last_access ASC").fetchall()
+        doomed = []
+        for key, size in rows:
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            doomed.append((key,))
+            count -= 1
+            total -= size
+        conn.executemany("DELETE FROM story_cache WHERE key = ?", doomed)
+        self.evictions += len(doomed)
+
+    def stats(self) -> dict:
+        with self._lock:
+            conn = self._db()
+            count, total = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM story_cache"
+            ).fetchone()
+        return {"entries": count, "bytes": total, "evictions": self.evictions}
+
+
+class StoryCache:
+    """TTL cache for story responses with hit/miss accounting."""
+
+    def __init__(self, backend, ttl_seconds: int = 24 * 60 * 60):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        encoded = self.backend.get(key, time.time())
+        with self._lock:
+            if encoded is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(encoded)
+
+    def set(self, key: str, value: dict):
+        encoded = json.dumps(value, ensure_ascii=False)
+        self.backend.set(key, encoded, time.time() + self.ttl_seconds)
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        return {
+            "backend": self.backend.name,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / total, 4) if total else 0.0,
+            "ttl_seconds": self.ttl_seconds,
+            **self.backend.stats(),
+        }
+
+
+def build_story_cache_from_env(basedir: str):
+    """
+    Create the story cache described by the STORY_CACHE_* environment variables.
+
+    Returns None when STORY_CACHE_BACKEND is "off".
+    """
+    backend_name = os.getenv("STORY_CACHE_BACKEND", "memory").lower()
+    if backend_name in ("off", "none", "disabled", ""):
+        return None
+
+    max_entries = int(os.getenv("STORY_CACHE_MAX_ENTRIES", "1000"))
+    max_bytes = int(os.getenv("STORY_CACHE_MAX_MB", "64")) * 1024 * 1024
+    ttl_seconds = int(os.getenv("STORY_CACHE_TTL_SECONDS", str(24 * 60 * 60)))
+
+    if backend_name == "sqlite":
+        path = os.getenv("STORY_CACHE_PATH", os.path.join(basedir, "story_cache.db"))
+        backend = SQLiteCacheBackend(path, max_entries=max_entries, max_bytes=max_bytes)
+    else:
+        backend = MemoryCacheBackend(max_entries=max_entries, max_bytes=max_bytes)
+    return StoryCache(backend, ttl_seconds=ttl_seconds)
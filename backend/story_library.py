@@ -0,0 +1,162 @@
+"""
+Story Library
+Background persistence and full-text search for generated stories.
+
+Routes hand finished stories to a StoryWriter, which inserts them in batches on
+its own thread so saving never adds latency to a response. On SQLite the
+``story`` table is mirrored into an FTS5 index (kept in sync by triggers) over
+title, body and wisdom gem; other databases fall back to ILIKE matching.
+"""
+
+import logging
+import queue
+import re
+import threading
+
+from sqlalchemy import text
+
+logger = logging.getLogger("story_engine")
+
+FTS_TABLE = "story_fts"
+
+# External-content FTS5 table: the index stores only tokens, the text stays in ``story``
+_FTS_DDL = (
+    f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+    " title, story_text, wisdom_gem, content='story', content_rowid='id', tokenize='porter unicode61')",
+    f"CREATE TRIGGER story_fts_ai AFTER INSERT ON story BEGIN"
+    f" INSERT INTO {FTS_TABLE}(rowid, title, story_text, wisdom_gem)"
+    " VALUES (new.id, new.title, new.story_text, new.wisdom_gem); END",
+    f"CREATE TRIGGER story_fts_ad AFTER DELETE ON story BEGIN"
+    f" INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, story_text, wisdom_gem)"
+    " VALUES ('delete', old.id, old.title, old.story_text, old.wisdom_gem); END",
+    f"CREATE TRIGGER story_fts_au AFTER UPDATE ON story BEGIN"
+    f" INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, story_text, wisdom_gem)"
+    " VALUES ('delete', old.id, old.title, old.story_text, old.wisdom_gem);"
+    f" INSERT INTO {FTS_TABLE}(rowid, title, story_text, wisdom_gem)"
+    " VALUES (new.id, new.title, new.story_text, new.wisdom_gem); END",
+)
+
+_TERM_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def install_story_fts(engine) -> bool:
+    """Create the FTS5 index and its triggers if missing; False when FTS5 is unavailable (or not SQLite)."""
+    if engine.dialect.name != "sqlite":
+        return False
+    with engine.begin() as conn:
+        exists = conn.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": FTS_TABLE}
+        ).first()
+        if exists:
+            return True
+        try:
+            for statement in _FTS_DDL:
+                conn.exec_driver_sql(statement)
+            # Default ``ORDER BY rank``: title matches count most, then the wisdom gem, then the body
+            conn.exec_driver_sql(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rank) VALUES ('rank', 'bm25(5.0, 1.0, 2.0)')")
+            # Index stories saved before the FTS table existed
+            conn.exec_driver_sql(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+        except Exception as e:
+            # Only a SQLite build without the fts5 module is expected; anything else is a real failure
+            if "fts5" not in str(e).lower():
+                raise
+            logger.warning("FTS5 unavailable, story search falls back to LIKE: %s", e)
+            return False
+    return True
+
+
+def search_terms(query: str) -> list[str]:
+    return _TERM_RE.findall(query or "")
+
+
+def fts_match_expression(terms: list[str]) -> str:
+    """
+    All terms must match (implicit AND); the last one also matches as a prefix
+    so results update while a parent is still typing. Terms are quoted, so user
+    input can never be read as FTS5 syntax.
+    """
+    quoted = [f'"{term}"' for term in terms]
+    quoted[-1] += "*"
+    return " ".join(quoted)
+
+
+def make_snippet(text_: str, terms: list[str], words: int = 16) -> str:
+    """
+    About ``words`` words around the first match, with matched words in [brackets].
+
+    Done in Python on the page of results: FTS5's snippet() re-runs the MATCH
+    for every row, which costs more than the search itself on long stories.
+    """
+    pattern = re.compile(r"\b(?:" + "|".join(map(re.escape, terms)) + r")\w*", re.IGNORECASE)
+    tokens = (text_ or "").split()
+    first = next((i for i, token in enumerate(tokens) if pattern.search(token)), 0)
+    start = max(0, first - words // 4)
+    window = [pattern.sub(lambda m: f"[{m.group(0)}]", token) for token in tokens[start:start + words]]
+    return ("…" if start else "") + " ".join(window) + ("…" if start + words < len(tokens) else "")
+
+
+class StoryWriter:
+    """Single background thread that saves queued stories in batches (one commit per batch)."""
+
+    def __init__(self, write_batch, max_batch: int = 50, max_queue: int = 10_000):
+        self.write_batch = write_batch  # callable(list of story dicts); runs on the writer thread
+        self.max_batch = max_batch
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._lock = threading.Lock()
+
+        self.written = 0
+        self.failed = 0
+        self.dropped = 0
+
+    def submit(self, story: dict):
+        """Queue a story for saving; never blocks the request (drops it if the queue is full)."""
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(story)
+        except queue.Full:
+            self.dropped += 1
+            logger.warning("Story library queue full, dropping story %r", story.get("title"))
+
+    def flush(self, timeout: float = 5.0):
+        """Wait until everything queued so far has been written (tests and shutdown)."""
+        if self._thread is not None:
+            done = threading.Event()
+            self._queue.put(done)
+            done.wait(timeout)
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="story-writer", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            markers = [item for item in batch if isinstance(item, threading.Event)]
+            stories = [item for item in batch if not isinstance(item, threading.Event)]
+            if stories:
+                try:
+                    self.write_batch(stories)
+                    self.written += len(stories)
+                except Exception as e:
+                    self.failed += len(stories)
+                    logger.error("Saving %d stories failed: %s", len(stories), e)
+            for marker in markers:
+                marker.set()
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize(),
+            "written": self.written,
+            "failed": self.failed,
+            "dropped": self.dropped,
+        }
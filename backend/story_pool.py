@@ -0,0 +1,158 @@
+"""
+Prewarmed Story Pool
+Pre-generated, unassigned stories per (theme, companion) for instant generic requests.
+
+Stories are generated for a placeholder hero and personalized on draw by
+swapping in the requested name, so one pool serves every child. A background
+thread tops each pool up to its target, but only while the generation service
+is idle, so prewarming never competes with live requests. Storage is injected
+(the app keeps the pool in its database, shared by every worker).
+"""
+
+import logging
+import re
+import threading
+import time
+
+logger = logging.getLogger("story_engine")
+
+# Unusual enough that the model never uses it for anything else, short enough to survive paraphrase
+PLACEHOLDER_HERO = "Quillby"
+_PLACEHOLDER_RE = re.compile(rf"\b{PLACEHOLDER_HERO}\b")
+
+
+def personalize(story: dict, hero_name: str) -> dict:
+    """Swap the placeholder hero for ``hero_name`` in every text field."""
+    return {
+        # The name is client text; a function replacement keeps re from reading its backslashes as escapes
+        key: _PLACEHOLDER_RE.sub(lambda _: hero_name, value) if isinstance(value, str) else value
+        for key, value in story.items()
+    }
+
+
+def has_placeholder(story: dict) -> bool:
+    return bool(_PLACEHOLDER_RE.search(story.get("story_text", "")))
+
+
+class StoryPool:
+    """Keeps ``target`` stories per key, refilled in the background while the model is idle."""
+
+    def __init__(
+        self,
+        keys: list,
+        target: int,
+        generate,
+        store,
+        is_idle,
+        low_water: int = 1,
+        interval_seconds: float = 5.0,
+    ):
+        """
+        Args:
+            keys: (theme, companion) pairs to keep stocked; companion None means no companion
+            target: stories to keep per key
+            generate: callable(theme, companion) -> story dict for PLACEHOLDER_HERO, or None
+            store: object with count() -> {key: n}, add(key, story) and take(key) -> story | None
+            is_idle: callable() -> bool; refills only run while it returns True
+            low_water: a draw that leaves a key at or below this many stories counts as a low-water event
+            interval_seconds: pause between refill checks while the pool is full or the service busy
+        """
+        self.keys = list(keys)
+        self.target = target
+        self.generate = generate
+        self.store = store
+        self.is_idle = is_idle
+        self.low_water = low_water
+        self.interval_seconds = interval_seconds
+
+        self._thread = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._levels = {}  # last known count per key
+
+        self.hits = 0
+        self.misses = 0
+        self.low_water_events = 0
+        self.generated = 0
+        self.rejected = 0
+        self.failed = 0
+
+    def start(self):
+        """Start the refill thread (idempotent; no-op when the pool is disabled)."""
+        if self._thread is not None or self.target <= 0 or not self.keys:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="story-pool", daemon=True)
+                self._thread.start()
+
+    def draw(self, theme: str, companion: str | None, hero_name: str) -> dict | None:
+        """Take a pooled story for this key, personalized for ``hero_name``; None on a miss."""
+        key = (theme, companion or None)
+        if self.target <= 0 or key not in self.keys:
+            return None  # disabled or not a pooled key: not a miss, and no store query
+        self.start()
+        story = self.store.take(key)
+        with self._lock:
+            if story is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                if key in self._levels:
+                    self._levels[key] = max(0, self._levels[key] - 1)
+                    if self._levels[key] <= self.low_water:
+                        self.low_water_events += 1
+        self._wake.set()
+        return personalize(story, hero_name) if story else None
+
+    def _run(self):
+        while True:
+            try:
+                refilled = self._refill_one()
+            except Exception as e:
+                logger.error("Story pool refill failed: %s", e)
+                refilled = False
+            if not refilled:
+                self._wake.wait(self.interval_seconds)
+                self._wake.clear()
+
+    def _refill_one(self) -> bool:
+        """Generate one story for the emptiest key; False when nothing was done."""
+        levels = self.store.count()
+        with self._lock:
+            self._levels = {key: levels.get(key, 0) for key in self.keys}
+        emptiest = min(self.keys, key=lambda k: self._levels[k])
+        if self._levels[emptiest] >= self.target or not self.is_idle():
+            return False
+        theme, companion = emptiest
+        story = self.generate(theme, companion)
+        if story is None:
+            self.failed += 1
+            time.sleep(self.interval_seconds)  # don't hammer a failing model
+            return False
+        if not has_placeholder(story):
+            # The model renamed the hero; the story cannot be personalized
+            self.rejected += 1
+            return False
+        self.store.add(emptiest, story)
+        self.generated += 1
+        return True
+
+    def stats(self) -> dict:
+        with self._lock:
+            levels = dict(self._levels)
+        return {
+            "target": self.target,
+            "low_water": self.low_water,
+            "keys": len(self.keys),
+            "stocked": sum(levels.values()),
+            "below_low_water": sorted(
+                f"{theme}/{companion or 'none'}" for (theme, companion), n in levels.items() if n <= self.low_water
+            ) if levels else [],
+            "hits": self.hits,
+            "misses": self.misses,
+            "low_water_events": self.low_water_events,
+            "generated": self.generated,
+            "rejected": self.rejected,
+            "failed": self.failed,
+        }
@@ -0,0 +1,139 @@
+"""
+Story Streaming Helpers
+Incremental [TITLE: ...] / [WISDOM GEM: ...] parsing for partial model output,
+plus server-sent-event formatting for the streaming story endpoint.
+"""
+
+import json
+
+TITLE_OPEN = "[TITLE:"
+GEM_OPEN = "[WISDOM GEM:"
+
+
+def sse_event(event: str, data: dict) -> str:
+    """Format one server-sent event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def _is_partial_marker(text: str, marker: str) -> bool:
+    """True when ``text`` could still grow into ``marker``."""
+    return len(text) < len(marker) and marker.startswith(text)
+
+
+class TitleGemStreamParser:
+    """
+    Feed model text as it arrives and get back ready-to-send events.
+
+    Events are ``("title", str)`` once the title marker closes, then any number of
+    ``("chunk", str)`` body pieces, and ``("gem", str)`` from ``finish()``. Text
+    that might be the start of the wisdom-gem marker is held back until the next
+    chunk decides it, so the marker never leaks into the body.
+
+    The result matches the non-streaming extractor (``_safe_extract_title_and_gem``
+    in app.py), which takes the first title marker wherever it is: any preamble
+    before it is kept as the start of the body. Output without a title marker is
+    therefore buffered until ``finish()``, which sends the default title first.
+    """
+
+    def __init__(self, default_title: str, fallback_gem):
+        self.default_title = default_title
+        self.fallback_gem = fallback_gem  # callable, only used when no gem is found
+        self.title = None
+        self.wisdom_gem = None
+        self.body_parts = []
+        self._state = "title"
+        self._buffer = ""
+        self._trailing = ""
+
+    @property
+    def story_text(self) -> str:
+        return "".join(self.body_parts).strip()
+
+    def feed(self, text: str) -> list:
+        if not text:
+            return []
+        self._buffer += text
+        return self._advance()
+
+    def finish(self) -> list:
+        """Flush everything still buffered and emit the wisdom gem."""
+        events = []
+        if self._state == "title":
+            events.extend(self._emit_title(self.default_title))
+            events.extend(self._advance())
+        if self._state == "body":
+            events.extend(self._emit_body(self._buffer))
+            self._buffer = ""
+        elif self._state == "gem":
+            # Unterminated gem marker: take what we have
+            self.wisdom_gem = self._buffer.strip() or None
+            self._buffer = ""
+        if self._trailing.strip():
+            events.extend(self._emit_body(self._trailing))
+        self.wisdom_gem = self.wisdom_gem or self.fallback_gem()
+        events.append(("gem", self.wisdom_gem))
+        self._state = "done"
+        return events
+
+    # ---- states ----
+    def _advance(self) -> list:
+        """Parse as far as the buffer allows."""
+        events = []
+        if self._state == "title":
+            events.extend(self._parse_title())
+        if self._state == "body":
+            events.extend(self._parse_body())
+        if self._state == "gem":
+            self._parse_gem()
+        if self._state == "after_gem":
+            self._trailing += self._buffer
+            self._buffer = ""
+        return events
+
+    def _parse_title(self) -> list:
+        start = self._buffer.find(TITLE_OPEN)
+        if start == -1:
+            return []  # wait for the marker (or finish()); it may still come after a preamble
+        close = self._buffer.find("]", start)
+        if close == -1:
+            return []
+        title = self._buffer[start + len(TITLE_OPEN):close].strip() or self.default_title
+        self._buffer = self._buffer[:start] + self._buffer[close + 1:]
+        return self._emit_title(title)
+
+    def _emit_title(self, title: str) -> list:
+        self.title = title
+        self._state = "body"
+        self._buffer = self._buffer.lstrip()
+        return [("title", title)]
+
+    def _parse_body(self) -> list:
+        gem_at = self._buffer.find(GEM_OPEN)
+        if gem_at != -1:
+            events = self._emit_body(self._buffer[:gem_at])
+            self._buffer = self._buffer[gem_at + len(GEM_OPEN):]
+            self._state = "gem"
+            return events
+
+        hold_from = self._buffer.rfind("[")
+        if hold_from != -1 and _is_partial_marker(self._buffer[hold_from:], GEM_OPEN):
+            ready, self._buffer = self._buffer[:hold_from], self._buffer[hold_from:]
+        else:
+            ready, self._buffer = self._buffer, ""
+        return self._emit_body(ready)
+
+    def _parse_gem(self):
+        close = self._buffer.find("]")
+        if close == -1:
+            return
+        self.wisdom_gem = self._buffer[:close].strip() or None
+        self._buffer = self._buffer[close + 1:]
+        self._state = "after_gem"
+
+    def _emit_body(self, text: str) -> list:
+        if not self.body_parts:
+            text = text.lstrip()
+        if not text:
+            return []
+        self.body_parts.append(text)
+        return [("chunk", text)]
@@ -0,0 +1,139 @@
+"""
+Rolling Story Summaries
+Keeps continuation prompts a constant size as a series or interactive session grows.
+
+Each chapter (or each segment that scrolls out of the context window) is folded
+into a compact running summary once, instead of pasting or truncating raw story
+text into every prompt. Folding uses the model when one is configured and falls
+back to an extractive summary that only ever cuts at sentence boundaries.
+"""
+
+import concurrent.futures
+import logging
+import re
+import threading
+
+logger = logging.getLogger("story_engine")
+
+# A sentence runs up to its terminal punctuation plus any closing quotes/brackets
+_SENTENCE_RE = re.compile(r"[^.!?…]+(?:[.!?…]+[\"'”’)\]]*|$)")
+
+SUMMARY_PROMPT = """You keep a running summary of a children's story so the next part stays consistent.
+
+SUMMARY SO FAR:
+{summary}
+
+NEW PART ({label}):
+{new_text}
+
+Rewrite the summary so it also covers the new part, in at most {words} words.
+Keep character names, companions, important places and objects, unresolved
+threads and lessons learned. Plain prose only: no title, headings or lists."""
+
+
+def split_sentences(text: str) -> list[str]:
+    flat = " ".join((text or "").split())
+    return [s.strip() for s in _SENTENCE_RE.findall(flat) if s.strip()]
+
+
+def clip_sentences(text: str, max_chars: int, from_end: bool = False) -> str:
+    """Longest run of whole sentences from the start (or end) of ``text`` that fits in ``max_chars``."""
+    sentences = split_sentences(text)
+    if from_end:
+        sentences.reverse()
+    kept, used = [], 0
+    for sentence in sentences:
+        cost = len(sentence) + (1 if kept else 0)
+        if used + cost > max_chars:
+            break
+        kept.append(sentence)
+        used += cost
+    if not kept and sentences:
+        # One sentence longer than the budget: fall back to a word boundary
+        sentence = sentences[0]
+        if from_end:
+            return "…" + sentence[-max_chars:].split(" ", 1)[-1]
+        return sentence[:max_chars].rsplit(" ", 1)[0] + "…"
+    if from_end:
+        kept.reverse()
+    return " ".join(kept)
+
+
+def extractive_summary(text: str, max_chars: int) -> str:
+    """The opening sentence plus as many of the latest sentences as fit."""
+    sentences = split_sentences(text)
+    joined = " ".join(sentences)
+    if len(joined) <= max_chars:
+        return joined
+    head = clip_sentences(sentences[0], max_chars // 3)
+    tail = clip_sentences(" ".join(sentences[1:]), max_chars - len(head) - 3, from_end=True)
+    return f"{head} … {tail}" if tail else head
+
+
+class RollingSummarizer:
+    """Folds new story text into a bounded summary, synchronously or on a background worker."""
+
+    def __init__(self, generate=None, max_chars: int = 1200, workers: int = 1):
+        self.generate = generate  # callable(prompt) -> str; None means extractive only
+        self.max_chars = max_chars
+        self.workers = workers
+        self._executor = None
+        self._lock = threading.Lock()
+
+        self.model_folds = 0
+        self.extractive_folds = 0
+        self.failed = 0
+
+    def fold_extractive(self, summary: str, new_text: str, label: str = "") -> str:
+        """Cheap, deterministic fold: no model call, never cuts mid-sentence."""
+        addition = extractive_summary(new_text, self.max_chars // 2)
+        if label and addition:
+            addition = f"{label}: {addition}"
+        combined = f"{summary} {addition}".strip() if summary else addition
+        self.extractive_folds += 1
+        return extractive_summary(combined, self.max_chars)
+
+    def fold(self, summary: str, new_text: str, label: str = "the next part") -> str:
+        """Model-written fold of ``new_text`` into ``summary``; extractive if the model is unavailable."""
+        if self.generate is None:
+            return self.fold_extractive(summary, new_text, label)
+        prompt = SUMMARY_PROMPT.format(
+            summary=summary or "(nothing yet)",
+            label=label,
+            new_text=new_text,
+            words=max(self.max_chars // 6, 40),
+        )
+        try:
+            text = (self.generate(prompt) or "").strip()
+            if not text:
+                raise ValueError("Empty summary")
+        except Exception as e:
+            logger.warning("Summary fold failed, using extractive fallback: %s", e)
+            self.failed += 1
+            return self.fold_extractive(summary, new_text, label)
+        self.model_folds += 1
+        return clip_sentences(text, self.max_chars)
+
+    def submit(self, fn, *args) -> concurrent.futures.Future:
+        """Run ``fn(*args)`` on the summary worker so requests never wait for a fold."""
+        with self._lock:
+            if self._executor is None:
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="story-summary"
+                )
+        future = self._executor.submit(fn, *args)
+        future.add_done_callback(self._log_failure)
+        return future
+
+    def _log_failure(self, future):
+        if not future.cancelled() and future.exception() is not None:
+            logger.error("Background summary task failed: %s", future.exception())
+
+    def stats(self) -> dict:
+        return {
+            "mode": "model" if self.generate else "extractive",
+            "max_chars": self.max_chars,
+            "model_folds": self.model_folds,
+            "extractive_folds": self.extractive_folds,
+            "failed": self.failed,
+        }
@@ -0,0 +1,70 @@
+"""
+Admission Control Tests
+Which identity a generation request is charged to, through the Flask test client.
+"""
+
+import threading
+import uuid
+
+import pytest
+
+from rate_limit import BucketLimit, MemoryBucketStore, RateLimiter
+
+
+@pytest.fixture
+def tight_limits(story_app, monkeypatch):
+    limiter = RateLimiter(MemoryBucketStore(), {"text": BucketLimit(2, 0), "image": BucketLimit(2, 0)})
+    monkeypatch.setattr(story_app, "rate_limiter", limiter)
+    return limiter
+
+
+def test_random_user_key_gets_no_extra_quota_on_server_key_routes(client, tight_limits):
+    statuses = []
+    for _ in range(3):
+        response = client.post("/generate-interactive-story", json={
+            "character": "Mia", "theme": "Adventure", "user_api_key": uuid.uuid4().hex,
+        })
+        statuses.append(response.status_code)
+        response.close()
+
+    assert statuses == [200, 200, 429]
+    assert tight_limits.stats()["buckets"]["text"]["limited"] == 1
+
+
+def test_clients_are_limited_separately(client, tight_limits):
+    for _ in range(2):
+        client.post("/generate-interactive-story", json={"character": "Mia"}).close()
+
+    other = client.post("/generate-interactive-story", json={"character": "Leo"},
+                        environ_base={"REMOTE_ADDR": "10.1.2.3"})
+
+    assert other.status_code == 200
+
+
+def test_non_object_json_body_is_not_a_server_error(story_app, client, monkeypatch):
+    monkeypatch.setattr(story_app, "rate_limiter", RateLimiter(MemoryBucketStore(), {"text": BucketLimit(10, 0)}))
+    for body in ([1, 2], "story", 7):
+        response = client.post("/generate-story", json=body, headers={"Accept": "application/json"})
+        response.close()
+
+        assert response.status_code == 200
+
+
+def test_in_flight_limit_is_never_overshot(story_app, monkeypatch):
+    monkeypatch.setattr(story_app, "admission_stats", {"saturated": 0, "in_flight": 0, "peak_in_flight": 0})
+    monkeypatch.setattr(story_app, "ADMISSION_MAX_IN_FLIGHT", 3)
+    start = threading.Barrier(20)
+    admitted = []
+
+    def arrive():
+        start.wait()
+        admitted.append(story_app._admission_acquire() is None)
+
+    threads = [threading.Thread(target=arrive) for _ in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert admitted.count(True) == 3
+    assert story_app.admission_stats == {"saturated": 17, "in_flight": 3, "peak_in_flight": 3}
@@ -82,6 +82,49 @@ def test_get_characters():
         print_fail(f"Error: {e}")
         return False
 
+def test_get_characters_paginated():
+    """Test keyset pagination, field projection and ETags on /get-characters"""
+    print_test("GET /get-characters?limit=&fields=")
+    try:
+        response = requests.get(
+            f"{BASE_URL}/get-characters",
+            params={"limit": 2, "fields": "name,age"},
+            timeout=TIMEOUT
+        )
+        if response.status_code != 200:
+            print_fail(f"Status: {response.status_code}")
+            print_info(f"Response: {response.text}")
+            return False
+
+        data = response.json()
+        if 'items' not in data or 'next_cursor' not in data:
+            print_fail("Paginated response should have 'items' and 'next_cursor'")
+            return False
+        print_pass(f"First page has {len(data['items'])} characters")
+
+        extra = [k for item in data['items'] for k in item if k not in ('id', 'name', 'age')]
+        if extra:
+            print_fail(f"Projection returned unexpected fields: {sorted(set(extra))}")
+            return False
+        print_pass("Projection limited fields to id, name, age")
+
+        etag = response.headers.get('ETag')
+        cached = requests.get(
+            f"{BASE_URL}/get-characters",
+            params={"limit": 2, "fields": "name,age"},
+            headers={"If-None-Match": etag or ""},
+            timeout=TIMEOUT
+        )
+        if cached.status_code != 304:
+            print_fail(f"Expected 304 for unchanged page, got {cached.status_code}")
+            return False
+        print_pass("Unchanged page returned 304 Not Modified")
+        return True
+
+    except Exception as e:
+        print_fail(f"Error: {e}")
+        return False
+
 def test_create_character():
     """Test POST /create-character endpoint"""
     print_test("POST /create-character")
@@ -214,6 +257,37 @@ def test_interactive_story():
         print_fail(f"Error: {e}")
         return False
 
+def test_interactive_session():
+    """Test continuing an interactive story with only session_id + choice_id"""
+    print_test("POST /continue-interactive-story (session)")
+    try:
+        start = requests.post(
+            f"{BASE_URL}/generate-interactive-story",
+            json={"character": "Test Hero", "theme": "Magic", "companion": "None"},
+            timeout=60
+        )
+        data = start.json()
+        if start.status_code != 200 or not data.get('session_id'):
+            print_fail("Opening segment should include a session_id")
+            return False
+        print_pass(f"Session started: {data['session_id']}")
+
+        response = requests.post(
+            f"{BASE_URL}/continue-interactive-story",
+            json={"session_id": data['session_id'], "choice_id": data['choices'][0]['id']},
+            timeout=60
+        )
+        if response.status_code != 200 or not response.json().get('text'):
+            print_fail(f"Status: {response.status_code}")
+            print_info(f"Response: {response.text}")
+            return False
+        print_pass("Continued from session without resending the story")
+        return True
+
+    except Exception as e:
+        print_fail(f"Error: {e}")
+        return False
+
 def test_delete_character(character_id):
     """Test DELETE /characters endpoint"""
     if not character_id:
@@ -262,12 +336,18 @@ def main():
     success, character_id = test_create_character()
     results.append(success)
 
+    # Test 3b: Paginated characters
+    results.append(test_get_characters_paginated())
+
     # Test 4: Generate story
     results.append(test_generate_story())
 
     # Test 5: Interactive story
     results.append(test_interactive_story())
 
+    # Test 5b: Interactive session continuation
+    results.append(test_interactive_session())
+
     # Test 6: Delete character
     if character_id:
         results.append(test_delete_character(character_id))
@@ -0,0 +1,70 @@
+"""
+Bulk Character Tests
+/characters/bulk applies a batch in one transaction and rejects badly typed items up front.
+"""
+
+import uuid
+
+import pytest
+
+
+def _bulk(client, *operations):
+    return client.post("/characters/bulk", json={"operations": list(operations)})
+
+
+def _names(story_app, ids):
+    with story_app.app.app_context():
+        return {c.id: c.name for c in story_app.Character.query.filter(story_app.Character.id.in_(ids))}
+
+
+def test_mixed_batch_applies_valid_items_and_reports_the_rest(client, story_app):
+    existing = client.post("/create-character", json={"name": "Mia", "age": 7}).get_json()["id"]
+    gone = client.post("/create-character", json={"name": "Leo", "age": 6}).get_json()["id"]
+    new_id = str(uuid.uuid4())
+
+    response = _bulk(
+        client,
+        {"op": "upsert", "character": {"id": new_id, "name": "Ava", "age": 8, "likes": "cats, kites"}},
+        {"op": "upsert", "character": {"id": existing, "name": "Mia Rose"}},
+        {"op": "delete", "id": gone},
+        {"op": "upsert", "character": {"name": "No age"}},
+        {"op": "rename"},
+    )
+
+    body = response.get_json()
+    assert response.status_code == 200
+    assert [r["status"] for r in body["results"]] == ["created", "updated", "deleted", "error", "error"]
+    assert (body["applied"], body["errors"]) == (3, 2)
+    assert body["results"][0]["character"]["likes"] == ["cats", "kites"]
+    assert _names(story_app, [new_id, existing, gone]) == {new_id: "Ava", existing: "Mia Rose"}
+
+
+@pytest.mark.parametrize("character,message", [
+    ({"name": "Ava", "age": 8, "gender": {"x": 1}}, "'gender' must be a string"),
+    ({"name": "Ava", "age": 8, "likes": {"cats": True}}, "'likes' must be a list of strings"),
+    ({"name": "Ava", "age": 8, "fears": [["dark"]]}, "'fears' must be a list of strings"),
+])
+def test_badly_typed_item_rejects_the_whole_batch(client, story_app, character, message):
+    existing = client.post("/create-character", json={"name": "Mia", "age": 7}).get_json()["id"]
+    first, bad = str(uuid.uuid4()), str(uuid.uuid4())
+
+    response = _bulk(
+        client,
+        {"op": "upsert", "character": {"id": first, "name": "Leo", "age": 6}},
+        {"op": "upsert", "character": {"id": existing, "name": "Mia Rose"}},
+        {"op": "upsert", "character": {"id": bad, **character}},
+    )
+
+    assert response.status_code == 400
+    assert response.get_json() == {"error": f"Operation 2: {message}", "index": 2}
+    assert _names(story_app, [first, existing, bad]) == {existing: "Mia"}
+
+
+def test_single_routes_share_the_type_check(client):
+    created = client.post("/create-character", json={"name": "Mia", "age": 7, "hair": ["red"]})
+    assert created.status_code == 400
+
+    char_id = client.post("/create-character", json={"name": "Mia", "age": 7}).get_json()["id"]
+    updated = client.patch(f"/characters/{char_id}", json={"outfit": 3})
+    assert updated.status_code == 400
+    assert updated.get_json() == {"error": "'outfit' must be a string"}
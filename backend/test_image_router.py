@@ -0,0 +1,159 @@
+"""
+Image Router Tests
+Selection, failover, circuit breaking and result normalization, against local stub providers.
+"""
+
+import base64
+
+import pytest
+
+from image_router import ImageProviderError, ImageRouter, NoImageProviderError, StubImageProvider
+from image_store import ImageStore
+
+
+class EmptyProvider:
+    """Behaves like the real generators when the API call fails: returns []."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def generate_story_illustration(self, *args, **kwargs):
+        self.calls += 1
+        return []
+
+
+def _router(providers, **kwargs):
+    return ImageRouter({name: (lambda p=p: p) for name, p in providers.items()}, **kwargs)
+
+
+def test_fails_over_to_next_provider_and_normalizes():
+    empty = EmptyProvider()
+    router = _router({"primary": empty, "backup": StubImageProvider()})
+
+    images = router.generate_story_illustration("a dragon in a library", "Mia", num_images=2)
+
+    assert empty.calls == 1
+    assert len(images) == 2
+    assert {image["provider"] for image in images} == {"backup"}
+    assert set(images[0]) == {"id", "provider", "prompt", "format", "generated_at", "image_id", "image_url", "image_data"}
+    stats = router.stats()
+    assert stats["primary"]["failures"] == 1
+    assert stats["backup"]["requests"] == 1
+
+
+def test_prefers_the_faster_provider_once_measured():
+    slow = StubImageProvider(latency_seconds=0.03)
+    fast = StubImageProvider(latency_seconds=0.001)
+    router = _router({"slow": slow, "fast": fast})
+    # Unmeasured providers are tried first, so both get a sample
+    router.generate_coloring_page("castle")
+    router.generate_coloring_page("castle")
+
+    images = router.generate_coloring_page("castle")
+
+    assert images[0]["provider"] == "fast"
+    assert router.stats()["slow"]["p50_ms"] > router.stats()["fast"]["p50_ms"]
+
+
+def test_unhealthy_provider_is_skipped_until_cooldown():
+    broken = StubImageProvider(failure_rate=1.0)
+    router = _router({"broken": broken, "ok": StubImageProvider()}, min_samples=2, cooldown_seconds=60)
+    for _ in range(2):
+        router.generate_story_illustration("forest")
+
+    images = router.generate_story_illustration("forest")
+
+    assert images[0]["provider"] == "ok"
+    stats = router.stats()
+    assert stats["broken"]["healthy"] is False
+    assert stats["broken"]["requests"] == 2
+
+
+def test_raises_when_every_provider_fails():
+    router = _router({"a": EmptyProvider(), "b": StubImageProvider(failure_rate=1.0)})
+
+    with pytest.raises(ImageProviderError) as excinfo:
+        router.generate_story_illustration("ocean")
+
+    assert "a:" in str(excinfo.value) and "b:" in str(excinfo.value)
+
+
+def test_operation_without_a_provider():
+    router = _router({"a": EmptyProvider()})
+
+    assert not router.supports("generate_character_avatar")
+    with pytest.raises(ImageProviderError):
+        router.generate_character_avatar({"name": "Leo"})
+
+
+def test_provider_that_cannot_be_built_is_dropped():
+    def broken():
+        raise AttributeError("module 'google.generativeai' has no attribute 'ImageGenerationModel'")
+
+    router = ImageRouter({"gemini": broken, "stub": StubImageProvider})
+
+    assert router.check() == ["stub"]
+    assert router.supports("generate_character_avatar")
+    assert router.generate_character_avatar({"name": "Leo"})[0]["provider"] == "stub"
+    stats = router.stats()
+    assert stats["gemini"]["available"] is False and "ImageGenerationModel" in stats["gemini"]["error"]
+    assert stats["stub"]["available"] is True
+
+
+def test_no_buildable_provider_raises_no_provider_error():
+    router = ImageRouter({"gemini": lambda: 1 / 0})
+
+    assert not router.supports("generate_story_illustration")
+    with pytest.raises(NoImageProviderError):
+        router.generate_story_illustration("ocean")
+
+
+def test_inline_image_data_moves_into_image_store(tmp_path):
+    store = ImageStore(str(tmp_path))
+    router = _router({"stub": StubImageProvider()}, image_store=store)
+
+    (image,) = router.generate_character_avatar({"name": "Leo"})
+
+    assert image["image_data"] is None
+    assert image["image_url"] == store.url_for(image["image_id"])
+    with open(store.path_for(image["image_id"]), "rb") as f:
+        assert f.read()[:8] == base64.b64decode("iVBORw0KGgo=")[:8]
+
+
+def test_half_open_trial_success_restores_provider():
+    flaky = StubImageProvider(failure_rate=1.0)
+    router = _router({"flaky": flaky, "ok": StubImageProvider(latency_seconds=0.01)}, min_samples=1, cooldown_seconds=0)
+    router.generate_story_illustration("moon")
+    assert router.stats()["flaky"]["failures"] == 1
+
+    flaky.failure_rate = 0.0
+    images = router.generate_story_illustration("moon")
+
+    assert images[0]["provider"] == "flaky"
+    assert router.stats()["flaky"]["healthy"] is True
+
+
+def test_stats_do_not_build_providers():
+    built = []
+
+    def factory():
+        built.append("stub")
+        return StubImageProvider()
+
+    router = ImageRouter({"stub": factory})
+
+    assert router.stats()["stub"]["available"] is None
+    assert built == []
+    router.check()
+    assert router.stats()["stub"]["available"] is True and built == ["stub"]
+
+
+def test_health_leaves_the_router_unbuilt(client, story_app, monkeypatch):
+    router = ImageRouter({"stub": lambda: pytest.fail("/health built a provider")})
+    monkeypatch.setattr(story_app, "image_router", router)
+
+    response = client.get("/health")
+
+    assert response.status_code == 200
+    assert response.get_json()["image_providers"] == {"stub": router.stats()["stub"]}
+    assert response.get_json()["image_providers"]["stub"]["available"] is None
@@ -0,0 +1,181 @@
+"""
+Job Queue Tests
+Retries, dead-lettering, lease expiry and worker survival, against a scratch SQLite queue.
+"""
+
+import json
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+from job_queue import DEAD, QUEUED, RUNNING, SUCCEEDED, JobFailed, JobQueue, _post_to_address, webhook_url_error
+
+
+def _queue(tmp_path, handlers, **kwargs):
+    kwargs.setdefault("workers", 1)
+    kwargs.setdefault("retry_base_seconds", 0)
+    queue = JobQueue(str(tmp_path / "jobs.db"), handlers, **kwargs)
+    queue.start = lambda: None  # tests drive _claim/_run by hand unless they start a worker
+    return queue
+
+
+def _run_next(queue):
+    job = queue._claim()
+    assert job is not None
+    queue._run(job)
+    return job
+
+
+def test_success_stores_the_result(tmp_path):
+    queue = _queue(tmp_path, {"echo": lambda payload: {"got": payload["x"]}})
+    job_id = queue.submit("echo", {"x": 1})["job_id"]
+
+    _run_next(queue)
+
+    job = queue.get(job_id)
+    assert job["status"] == SUCCEEDED and job["result"] == {"got": 1} and job["attempts"] == 1
+
+
+def test_failures_retry_then_dead_letter(tmp_path):
+    def broken(payload):
+        raise RuntimeError("provider down")
+
+    queue = _queue(tmp_path, {"broken": broken}, max_attempts=3)
+    job_id = queue.submit("broken", {})["job_id"]
+
+    for attempt in (1, 2):
+        assert _run_next(queue)["attempt"] == attempt
+        assert queue.get(job_id)["status"] == QUEUED
+    _run_next(queue)
+
+    job = queue.get(job_id)
+    assert job["status"] == DEAD and job["attempts"] == 3 and "provider down" in job["error"]
+    assert (queue.retried, queue.dead_lettered) == (2, 1)
+    assert queue._claim() is None
+
+
+def test_job_failed_is_not_retried(tmp_path):
+    def hopeless(payload):
+        raise JobFailed("Character not found")
+
+    queue = _queue(tmp_path, {"avatar": hopeless}, max_attempts=3)
+    job_id = queue.submit("avatar", {})["job_id"]
+
+    _run_next(queue)
+
+    assert queue.get(job_id)["status"] == DEAD and queue.retried == 0
+
+
+def test_higher_priority_runs_first(tmp_path):
+    queue = _queue(tmp_path, {"echo": lambda payload: payload})
+    queue.submit("echo", {"n": "low"}, priority=-1)
+    queue.submit("echo", {"n": "high"}, priority=5)
+
+    assert queue._claim()["payload"] == {"n": "high"}
+
+
+def test_expired_lease_is_requeued_then_dead(tmp_path):
+    queue = _queue(tmp_path, {"echo": lambda payload: payload}, max_attempts=2, lease_seconds=-1)
+    job_id = queue.submit("echo", {})["job_id"]
+
+    queue._claim()  # the worker "dies" holding the job
+    assert queue.get(job_id)["status"] == RUNNING
+    queue._last_sweep = 0
+    assert queue._claim()["id"] == job_id  # swept back to queued and claimed again
+    queue._last_sweep = 0
+    assert queue._claim() is None
+
+    job = queue.get(job_id)
+    assert job["status"] == DEAD and job["error"] == "Worker lease expired"
+
+
+def test_worker_survives_a_failed_finish(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.db"), {"echo": lambda payload: payload}, workers=1, poll_seconds=0.05)
+    real_finish = queue._finish
+    calls = []
+
+    def flaky_finish(*args, **kwargs):
+        calls.append(args)
+        if len(calls) == 1:
+            raise TypeError("Object of type bytes is not JSON serializable")
+        return real_finish(*args, **kwargs)
+
+    queue._finish = flaky_finish
+    try:
+        first = queue.submit("echo", {"n": 1})["job_id"]
+        second = queue.submit("echo", {"n": 2})["job_id"]
+        done = queue.wait(second, timeout=5)
+
+        assert done["status"] == SUCCEEDED
+        assert queue.get(first)["status"] == RUNNING  # left for lease expiry, not lost with the thread
+        assert all(thread.is_alive() for thread in queue._threads)
+    finally:
+        queue.shutdown()
+
+
+def test_start_replaces_dead_workers(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.db"), {"echo": lambda payload: payload}, workers=2, poll_seconds=0.05)
+    try:
+        queue.start()
+        orphan = queue._threads[0]
+        queue._threads[0] = type("DeadThread", (), {"is_alive": lambda self: False})()
+        queue.start()
+
+        assert len(queue._threads) == 2 and all(thread.is_alive() for thread in queue._threads)
+    finally:
+        queue.shutdown()
+        orphan.join(timeout=5)
+
+
+@pytest.mark.parametrize("url", [
+    "http://127.0.0.1/hook", "http://localhost:8080/", "http://169.254.169.254/latest", "http://10.0.0.5/", "ftp://x/",
+])
+def test_webhooks_to_internal_addresses_are_refused(url):
+    assert webhook_url_error(url) is not None
+
+
+def test_webhook_allowlist_is_exact(monkeypatch):
+    monkeypatch.setattr(socket, "getaddrinfo", lambda *args, **kwargs: [(None, None, None, "", ("10.0.0.8", 443))])
+    allowed = frozenset({"hooks.example.com"})
+
+    assert webhook_url_error("https://hooks.example.com/x", allowed) is None  # listed hosts may be internal
+    assert webhook_url_error("https://evil.example.com/x", allowed) is not None
+
+
+def test_webhook_is_posted_to_the_checked_address(tmp_path):
+    seen = {}
+
+    class Hook(BaseHTTPRequestHandler):
+        def do_POST(self):
+            seen.update(path=self.path, host=self.headers["Host"],
+                        body=json.loads(self.rfile.read(int(self.headers["Content-Length"]))))
+            self.send_response(204)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), Hook)
+    threading.Thread(target=server.handle_request, daemon=True).start()
+    port = server.server_address[1]
+
+    status = _post_to_address(f"http://hooks.example.com:{port}/done?job=1", "127.0.0.1", b'{"ok": true}', timeout=5)
+    server.server_close()
+
+    assert status == 204
+    assert seen == {"path": "/done?job=1", "host": f"hooks.example.com:{port}", "body": {"ok": True}}
+
+
+def test_webhook_rebound_to_a_private_address_is_refused_at_delivery(tmp_path, monkeypatch):
+    answers = iter(["93.184.216.34", "127.0.0.1"])  # public when submitted, loopback when delivered
+    monkeypatch.setattr(socket, "getaddrinfo", lambda *args, **kwargs: [(None, None, None, "", (next(answers), 80))])
+    queue = _queue(tmp_path, {"echo": lambda payload: payload})
+    assert webhook_url_error("http://hooks.example.com/x") is None
+    job_id = queue.submit("echo", {}, webhook_url="http://hooks.example.com/x")["job_id"]
+
+    _run_next(queue)
+
+    assert queue.get(job_id)["webhook_status"].startswith("refused: ")
+    assert queue.webhook_failures == 1
@@ -0,0 +1,71 @@
+"""
+JSON Extraction Tests
+Recovering schema-valid objects from the shapes model output takes in practice.
+"""
+
+import pytest
+
+from json_extract import JSONExtractionError, extract_json, is_valid, repair_json, validate
+
+SEGMENT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "text": {"type": "string"},
+        "choices": {"type": "array", "nullable": True, "items": {"type": "object", "required": ["text"]}},
+        "is_ending": {"type": "boolean"},
+    },
+    "required": ["text"],
+}
+
+SEGMENT = {"text": "Mia opened the door.", "choices": [{"id": "a", "text": "Go in"}], "is_ending": False}
+BODY = '{"text": "Mia opened the door.", "choices": [{"id": "a", "text": "Go in"}], "is_ending": false}'
+
+
+@pytest.mark.parametrize("raw", [
+    BODY,
+    f"```json\n{BODY}\n```",
+    f"Here is the next part!\n{BODY}\nHope you like it {{and more}}.",
+    BODY.replace('"is_ending": false', '"is_ending": false,'),
+    BODY.replace("false", "False"),
+    BODY.replace('"Go in"', "“Go in”"),
+])
+def test_recovers_the_intended_object(raw):
+    assert extract_json(raw, SEGMENT_SCHEMA) == SEGMENT
+
+
+def test_raw_newlines_inside_strings_are_accepted():
+    assert extract_json('{"text": "Line one\nLine two"}', SEGMENT_SCHEMA)["text"] == "Line one\nLine two"
+
+
+def test_skips_an_object_that_fails_the_schema():
+    raw = '{"note": "thinking..."} then ' + BODY
+
+    assert extract_json(raw, SEGMENT_SCHEMA) == SEGMENT
+
+
+def test_truncated_response_is_closed_off():
+    result = extract_json('{"text": "Mia ran", "choices": [{"id": "a", "text": "Hide', SEGMENT_SCHEMA)
+
+    assert result["text"] == "Mia ran"
+    assert not validate(result, SEGMENT_SCHEMA)
+
+
+def test_repair_leaves_well_formed_strings_alone():
+    assert repair_json('{"a": "True, None,]", "b": True,}') == '{"a": "True, None,]", "b": true}'
+
+
+@pytest.mark.parametrize("raw", ["", "no json here", '{"choices": []}', "[1, 2]"])
+def test_raises_when_nothing_usable(raw):
+    with pytest.raises(JSONExtractionError):
+        extract_json(raw, SEGMENT_SCHEMA)
+
+
+def test_validate_reports_paths_and_is_valid_agrees():
+    bad = {"text": 3, "choices": [{"id": "a"}], "is_ending": "no"}
+
+    errors = validate(bad, SEGMENT_SCHEMA)
+
+    assert errors == ["$.text: expected string", "$.choices[0].text: required", "$.is_ending: expected boolean"]
+    assert not is_valid(bad, SEGMENT_SCHEMA)
+    assert is_valid(SEGMENT, SEGMENT_SCHEMA) and is_valid({**SEGMENT, "choices": None}, SEGMENT_SCHEMA)
+    assert not is_valid({"text": "x", "is_ending": 1}, SEGMENT_SCHEMA)
@@ -0,0 +1,24 @@
+"""
+Model Client Tests
+Per-key clients stay isolated, relying on SDK internals pinned in requirements.txt.
+"""
+
+import google.generativeai as genai
+
+from model_clients import key_fingerprint, keyed_generative_model
+
+
+def test_each_key_gets_its_own_client_manager():
+    first = keyed_generative_model("gemini-1.5-flash", "key-one")
+    second = keyed_generative_model("gemini-1.5-flash", "key-two")
+
+    assert isinstance(first, genai.GenerativeModel)
+    assert first._client_manager.client_config["client_options"].api_key == "key-one"
+    assert second._client_manager.client_config["client_options"].api_key == "key-two"
+    assert first._client_manager.get_default_client("generative") is not second._client_manager.get_default_client("generative")
+
+
+def test_fingerprint_is_stable_and_does_not_contain_the_key():
+    assert key_fingerprint("secret-key") == key_fingerprint("secret-key")
+    assert key_fingerprint("secret-key") != key_fingerprint("other-key")
+    assert "secret" not in key_fingerprint("secret-key") and len(key_fingerprint("secret-key")) == 32
@@ -0,0 +1,105 @@
+"""
+Rate Limit Tests
+Token-bucket arithmetic, both bucket stores, and the limiter's accounting.
+"""
+
+import math
+
+import pytest
+
+from rate_limit import (
+    BucketLimit,
+    MemoryBucketStore,
+    RateLimiter,
+    SQLiteBucketStore,
+    build_rate_limiter_from_env,
+    retry_after_header,
+)
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "sqlite":
+        return SQLiteBucketStore(str(tmp_path / "rate_limits.db"))
+    return MemoryBucketStore()
+
+
+def test_bucket_spends_then_reports_the_wait():
+    limit = BucketLimit(2, per_minute=60)  # one token a second
+
+    assert limit.take(2, 0, 0, 1) == (True, 1, 0.0)
+    allowed, tokens, retry_after = limit.take(0.25, 0, 0, 1)
+    assert not allowed and tokens == 0.25
+    assert retry_after == pytest.approx(0.75)
+
+
+def test_bucket_refills_up_to_capacity():
+    limit = BucketLimit(3, per_minute=60)
+
+    assert limit.take(0, 0, 2, 1) == (True, 1, 0.0)
+    assert limit.take(0, 0, 100, 1) == (True, 2, 0.0)
+
+
+def test_bucket_without_refill_never_recovers():
+    allowed, _, retry_after = BucketLimit(1, per_minute=0).take(0, 0, 1000, 1)
+
+    assert not allowed and math.isinf(retry_after)
+
+
+def test_store_enforces_burst_per_key(store):
+    limit = BucketLimit(2, per_minute=60)
+
+    assert [store.take("text:1.2.3.4", limit, 0, 1)[0] for _ in range(3)] == [True, True, False]
+    assert store.take("text:5.6.7.8", limit, 0, 1) == (True, 0.0)
+    assert store.take("text:1.2.3.4", limit, 1.0, 1) == (True, 0.0)
+    assert store.stats() == {"tracked": 2}
+
+
+def test_memory_store_forgets_least_recent_keys():
+    store = MemoryBucketStore(max_keys=2)
+    limit = BucketLimit(1, per_minute=0)
+    for key in ("a", "b", "c"):
+        store.take(key, limit, 0, 1)
+
+    assert store.stats() == {"tracked": 2}
+    assert store.take("a", limit, 0, 1)[0]  # evicted, so it starts full again
+    assert not store.take("c", limit, 0, 1)[0]
+
+
+def test_sqlite_store_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / "rate_limits.db")
+    limit = BucketLimit(1, per_minute=0)
+
+    assert SQLiteBucketStore(path).take("image:k", limit, 0, 1)[0]
+    assert not SQLiteBucketStore(path).take("image:k", limit, 0, 1)[0]
+
+
+def test_user_keys_get_scaled_limits_and_their_own_buckets(store):
+    limiter = RateLimiter(store, {"text": BucketLimit(1, per_minute=0)}, user_key_factor=3)
+
+    assert [limiter.acquire("text", "fp", user_key=True)[0] for _ in range(4)] == [True, True, True, False]
+    assert limiter.acquire("text", "1.2.3.4")[0]
+    assert not limiter.acquire("text", "1.2.3.4")[0]
+
+    stats = limiter.stats()
+    assert stats["backend"] == store.name
+    assert stats["buckets"]["text"] == {"burst": 1.0, "per_minute": 0.0, "allowed": 4, "limited": 2}
+    assert stats["user_key_factor"] == 3
+    assert stats["tracked"] == 2
+
+
+@pytest.mark.parametrize("seconds,header", [(0.0, "1"), (0.2, "1"), (1.0, "1"), (1.01, "2"), (math.inf, "3600")])
+def test_retry_after_header(seconds, header):
+    assert retry_after_header(seconds) == header
+
+
+def test_build_from_env(monkeypatch, tmp_path):
+    monkeypatch.setenv("RATE_LIMIT_BACKEND", "off")
+    assert build_rate_limiter_from_env(str(tmp_path)) is None
+
+    monkeypatch.setenv("RATE_LIMIT_BACKEND", "sqlite")
+    monkeypatch.setenv("RATE_LIMIT_IMAGE_BURST", "7")
+    limiter = build_rate_limiter_from_env(str(tmp_path))
+    assert limiter.store.name == "sqlite"
+    assert limiter.store.path == str(tmp_path / "rate_limits.db")
+    assert limiter.limits["image"].capacity == 7
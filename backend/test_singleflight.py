@@ -0,0 +1,115 @@
+"""
+Single Flight Tests
+Concurrent identical calls share one execution; distinct or later calls do not.
+"""
+
+import threading
+
+import pytest
+
+from singleflight import SingleFlight
+
+
+def _blocked_leader(flight, key, release, result="story"):
+    """Start a leader that stays in flight until ``release`` is set; returns (thread, outcomes)."""
+    outcomes = []
+    started = threading.Event()
+
+    def slow():
+        started.set()
+        release.wait(5)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def run():
+        try:
+            outcomes.append(flight.do(key, slow))
+        except Exception as e:
+            outcomes.append(e)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    assert started.wait(5)
+    return thread, outcomes
+
+
+def _follower(flight, key, outcomes):
+    def run():
+        try:
+            outcomes.append(flight.do(key, lambda: "should not run"))
+        except Exception as e:
+            outcomes.append(e)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+
+def _wait_for_followers(flight, route, count):
+    for _ in range(500):
+        if flight.stats()["by_route"][route]["coalesced"] >= count:
+            return
+        threading.Event().wait(0.01)
+    raise AssertionError("followers never joined")
+
+
+def test_concurrent_callers_share_one_execution():
+    flight, release = SingleFlight(), threading.Event()
+    key = ("generate-story", "abc")
+    leader, outcomes = _blocked_leader(flight, key, release)
+    followers = [_follower(flight, key, outcomes) for _ in range(3)]
+    _wait_for_followers(flight, "generate-story", 3)
+
+    release.set()
+    for thread in [leader, *followers]:
+        thread.join(5)
+
+    assert sorted(outcomes, key=lambda o: o[1]) == [("story", False)] + [("story", True)] * 3
+    stats = flight.stats()
+    assert stats["in_flight"] == 0
+    assert (stats["executed"], stats["coalesced"]) == (1, 3)
+
+
+def test_followers_see_the_leaders_exception():
+    flight, release = SingleFlight(), threading.Event()
+    key = ("continue-story", "abc")
+    leader, outcomes = _blocked_leader(flight, key, release, result=RuntimeError("model down"))
+    follower = _follower(flight, key, outcomes)
+    _wait_for_followers(flight, "continue-story", 1)
+
+    release.set()
+    leader.join(5)
+    follower.join(5)
+
+    assert len(outcomes) == 2
+    assert all(isinstance(o, RuntimeError) and str(o) == "model down" for o in outcomes)
+    assert flight.stats()["in_flight"] == 0
+
+
+def test_sequential_and_distinct_calls_each_execute():
+    flight = SingleFlight()
+    calls = []
+
+    def fn(value):
+        calls.append(value)
+        return value * 2
+
+    assert flight.do(("a", 1), fn, 1) == (2, False)
+    assert flight.do(("a", 1), fn, 1) == (2, False)
+    assert flight.do(("b", 1), fn, 3) == (6, False)
+
+    assert calls == [1, 1, 3]
+    assert flight.stats()["by_route"] == {"a": {"executed": 2, "coalesced": 0}, "b": {"executed": 1, "coalesced": 0}}
+
+
+def test_failed_call_is_not_remembered():
+    flight = SingleFlight()
+
+    def fail():
+        raise ValueError("bad")
+
+    with pytest.raises(ValueError):
+        flight.do(("a", 1), fail)
+
+    assert flight.do(("a", 1), lambda: "ok") == ("ok", False)
@@ -0,0 +1,123 @@
+"""
+Branch Speculation Tests
+Launch limits, claiming the chosen branch, discarding its siblings, and the multi-worker default.
+"""
+
+import concurrent.futures
+import os
+import runpy
+
+import pytest
+
+from speculation import BranchSpeculator
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+        self.usage_metadata = None
+
+
+class FakeService:
+    """Hands out futures the test resolves itself."""
+
+    def __init__(self):
+        self.queued = 0
+        self.timeout = 1.0
+        self.futures = []
+
+    def submit(self, model, prompt, **kwargs):
+        future = concurrent.futures.Future()
+        future.prompt = prompt
+        self.futures.append(future)
+        return future
+
+
+def _speculator(**kwargs):
+    service = FakeService()
+    return BranchSpeculator(service, **kwargs), service
+
+
+PROMPTS = {"a": "prompt a", "b": "prompt b", "c": "prompt c"}
+
+
+def test_claim_returns_the_chosen_branch_and_cancels_the_rest():
+    speculator, service = _speculator()
+    assert speculator.launch("s1", 0, object(), PROMPTS) == 3
+    service.futures[1].set_result(FakeResponse("B" * 40))
+
+    assert speculator.claim("s1", 0, "b", "prompt b").text == "B" * 40
+
+    assert [f.cancelled() for f in service.futures] == [True, False, True]
+    metrics = speculator.metrics()
+    assert (metrics["hits"], metrics["cancelled"], metrics["pending_branches"], metrics["in_flight"]) == (1, 2, 0, 0)
+
+
+def test_finished_siblings_count_as_wasted_tokens():
+    speculator, service = _speculator()
+    speculator.launch("s1", 0, object(), PROMPTS)
+    for future in service.futures:
+        future.set_result(FakeResponse("x" * 40))
+
+    speculator.claim("s1", 0, "a", "prompt a")
+
+    assert speculator.metrics()["discarded"] == 2
+    assert speculator.metrics()["wasted_tokens"] == 20
+
+
+def test_changed_prompt_is_a_miss():
+    speculator, service = _speculator()
+    speculator.launch("s1", 0, object(), PROMPTS)
+
+    assert speculator.claim("s1", 0, "a", "prompt a, but the story moved on") is None
+    assert speculator.claim("s1", 0, "a", "prompt a") is None  # the turn was consumed either way
+    assert speculator.metrics()["misses"] == 1
+
+
+def test_failed_branch_falls_back_to_normal_generation():
+    speculator, service = _speculator()
+    speculator.launch("s1", 0, object(), {"a": "prompt a"})
+    service.futures[0].set_exception(RuntimeError("model down"))
+
+    assert speculator.claim("s1", 0, "a", "prompt a") is None
+    assert speculator.metrics()["failed"] == 1
+
+
+def test_budget_capacity_and_queue_limit_launches():
+    speculator, service = _speculator(session_budget=2)
+    assert speculator.launch("s1", 0, object(), PROMPTS) == 2
+    assert speculator.metrics()["skipped_budget"] == 1
+
+    speculator, service = _speculator(max_in_flight=1)
+    assert speculator.launch("s1", 0, object(), PROMPTS) == 1
+    assert speculator.metrics()["skipped_capacity"] == 2
+
+    speculator, service = _speculator()
+    service.queued = 1
+    assert speculator.launch("s1", 0, object(), PROMPTS) == 0
+
+
+def test_disabled_or_forgotten_sessions_hold_nothing():
+    speculator, _ = _speculator(max_in_flight=0)
+    assert not speculator.enabled
+    assert speculator.launch("s1", 0, object(), PROMPTS) == 0
+
+    speculator, service = _speculator()
+    speculator.launch("s1", 0, object(), PROMPTS)
+    speculator.forget("s1")
+    assert all(f.cancelled() for f in service.futures)
+    assert speculator.metrics()["pending_branches"] == 0
+
+
+@pytest.mark.parametrize("env,expected", [
+    ({"WEB_CONCURRENCY": "1"}, None),
+    ({"WEB_CONCURRENCY": "4"}, "0"),
+    ({"WEB_CONCURRENCY": "4", "SPECULATION_MAX_IN_FLIGHT": "16"}, "16"),
+])
+def test_gunicorn_disables_speculation_with_several_workers(monkeypatch, env, expected):
+    environ = {k: v for k, v in os.environ.items() if k != "SPECULATION_MAX_IN_FLIGHT"}
+    monkeypatch.setattr(os, "environ", {**environ, **env})
+
+    runpy.run_path(os.path.join(os.path.dirname(__file__), "gunicorn.conf.py"))
+
+    assert os.environ.get("SPECULATION_MAX_IN_FLIGHT") == expected
@@ -0,0 +1,87 @@
+"""
+Story Cache Tests
+Key normalization, TTL expiry and LRU eviction, for both cache backends.
+"""
+
+import pytest
+
+from story_cache import MemoryCacheBackend, SQLiteCacheBackend, StoryCache, make_cache_key
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backend_factory(request, tmp_path):
+    def build(**kwargs):
+        if request.param == "sqlite":
+            return SQLiteCacheBackend(str(tmp_path / "cache.db"), **kwargs)
+        return MemoryCacheBackend(**kwargs)
+    return build
+
+
+def test_key_ignores_cosmetic_differences():
+    a = make_cache_key("generate-story", {"character": "Mia  ", "theme": "Space", "friends": ["Leo"]})
+    b = make_cache_key("generate-story", {"theme": "Space", "character": " Mia", "friends": ["Leo "]})
+
+    assert a == b
+
+
+def test_key_separates_route_inputs_and_seed():
+    inputs = {"character": "Mia", "theme": "Space"}
+    key = make_cache_key("generate-story", inputs)
+
+    assert key != make_cache_key("continue-story", inputs)
+    assert key != make_cache_key("generate-story", {**inputs, "theme": "Ocean"})
+    assert key != make_cache_key("generate-story", inputs, seed=1)
+
+
+def test_round_trip_and_hit_accounting(backend_factory):
+    cache = StoryCache(backend_factory())
+    story = {"title": "Moon Boat ✨", "story_text": "Once…", "wisdom_gem": "Share."}
+
+    assert cache.get("k") is None
+    cache.set("k", story)
+
+    assert cache.get("k") == story
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 1, 1)
+
+
+def test_expired_entries_are_misses(backend_factory):
+    cache = StoryCache(backend_factory(), ttl_seconds=-1)
+    cache.set("k", {"title": "Old"})
+
+    assert cache.get("k") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_least_recently_used_entry_is_evicted(backend_factory, monkeypatch):
+    clock = iter(range(1000, 2000))
+    monkeypatch.setattr("story_cache.time.time", lambda: next(clock))
+    cache = StoryCache(backend_factory(max_entries=2))
+    cache.set("a", {"n": 1})
+    cache.set("b", {"n": 2})
+    cache.get("a")  # now "b" is the least recently used
+
+    cache.set("c", {"n": 3})
+
+    assert cache.get("b") is None
+    assert cache.get("a") == {"n": 1} and cache.get("c") == {"n": 3}
+    assert cache.stats()["evictions"] == 1
+
+
+def test_oversized_values_are_not_cached(backend_factory):
+    cache = StoryCache(backend_factory(max_bytes=32))
+
+    cache.set("k", {"story_text": "x" * 100})
+
+    assert cache.get("k") is None
+
+
+def test_cache_hit_does_not_report_the_user_key_as_used(story_app, client, monkeypatch):
+    monkeypatch.setattr(story_app, "story_cache", StoryCache(MemoryCacheBackend()))
+    body = {"character": "Mia", "theme": "Space", "seed": "cache-test"}
+    client.post("/generate-story", json=body).close()
+
+    hit = client.post("/generate-story", json={**body, "user_api_key": "their-own-key"})
+
+    assert hit.status_code == 200 and hit.get_json()["used_user_key"] is False
+    assert story_app.story_cache.stats()["hits"] == 1
@@ -0,0 +1,117 @@
+"""
+Story Pool Tests
+Personalization of pooled stories and draw/refill bookkeeping, against an in-memory store.
+"""
+
+from story_pool import PLACEHOLDER_HERO, StoryPool, has_placeholder, personalize
+
+
+class MemoryStore:
+    def __init__(self):
+        self.stories = {}
+
+    def count(self) -> dict:
+        return {key: len(stories) for key, stories in self.stories.items()}
+
+    def add(self, key, story: dict):
+        self.stories.setdefault(key, []).append(story)
+
+    def take(self, key):
+        stories = self.stories.get(key)
+        return stories.pop(0) if stories else None
+
+
+def _story(hero=PLACEHOLDER_HERO) -> dict:
+    return {"title": f"{hero} and the Moon", "story_text": f"{hero} looked up. Brave {hero}!", "wisdom_gem": "Be kind."}
+
+
+def _pool(target=1, generate=None, store=None, is_idle=lambda: True):
+    pool = StoryPool(
+        [("Adventure", None)], target=target, generate=generate or (lambda theme, companion: _story()),
+        store=store if store is not None else MemoryStore(), is_idle=is_idle, interval_seconds=0,
+    )
+    pool.start = lambda: None  # tests drive refills with _refill_one(), not the background thread
+    return pool
+
+
+def test_personalize_replaces_every_placeholder():
+    story = personalize(_story(), "Mia")
+
+    assert story == {"title": "Mia and the Moon", "story_text": "Mia looked up. Brave Mia!", "wisdom_gem": "Be kind."}
+
+
+def test_personalize_uses_names_with_backslashes_literally():
+    for name in (r"Mia\d", r"Leo\1", "Zoe\\"):
+        story = personalize(_story(), name)
+
+        assert story["title"] == f"{name} and the Moon"
+        assert story["story_text"].count(name) == 2
+
+
+def test_personalize_leaves_non_text_fields_alone():
+    assert personalize({"title": PLACEHOLDER_HERO, "chapter": 2}, "Mia") == {"title": "Mia", "chapter": 2}
+
+
+def test_refill_then_draw_hits_and_personalizes():
+    pool = _pool()
+
+    assert pool._refill_one()
+    story = pool.draw("Adventure", None, "Mia")
+
+    assert story["title"] == "Mia and the Moon"
+    assert (pool.hits, pool.misses, pool.generated) == (1, 0, 1)
+    assert pool.draw("Adventure", None, "Mia") is None
+    assert pool.misses == 1
+
+
+def test_refill_rejects_stories_without_the_placeholder():
+    store = MemoryStore()
+    pool = _pool(generate=lambda theme, companion: _story(hero="Sam"), store=store)
+
+    assert not pool._refill_one()
+    assert pool.rejected == 1 and not store.stories
+    assert not has_placeholder(_story(hero="Sam"))
+
+
+def test_refill_waits_while_the_service_is_busy():
+    pool = _pool(is_idle=lambda: False)
+
+    assert not pool._refill_one()
+    assert pool.generated == 0
+
+
+def test_disabled_pool_and_unpooled_keys_are_not_misses():
+    class ExplodingStore(MemoryStore):
+        def take(self, key):
+            raise AssertionError("store queried")
+
+    assert _pool(target=0, store=ExplodingStore()).draw("Adventure", None, "Mia") is None
+    pool = _pool(store=ExplodingStore())
+    assert pool.draw("Space", None, "Mia") is None
+    assert pool.misses == 0
+
+
+class RecordingPool:
+    def __init__(self):
+        self.draws = []
+
+    def draw(self, theme, companion, hero_name):
+        self.draws.append((theme, companion, hero_name))
+        return {"title": f"{hero_name} and the Moon", "story_text": "A pooled story.", "wisdom_gem": "Be kind."}
+
+
+def test_only_generic_requests_are_served_from_the_pool(client, story_app, monkeypatch):
+    pool = RecordingPool()
+    monkeypatch.setattr(story_app, "story_pool", pool)
+
+    generic = client.post("/generate-story", json={"character": "Mia", "theme": "Adventure", "companion": "None"})
+    aged = client.post("/generate-story", json={"character": "Mia", "theme": "Adventure", "character_age": 12})
+    prompted = client.post("/generate-story", json={"character": "Mia", "theme": "Adventure", "therapeutic_prompt": "first day of school"})
+
+    assert generic.get_json()["title"] == "Mia and the Moon"
+    assert aged.status_code == prompted.status_code == 200
+    assert aged.get_json()["story_text"] != "A pooled story."
+    assert prompted.get_json()["story_text"] != "A pooled story."
+    assert pool.draws == [("Adventure", None, "Mia")]
+    for response in (generic, aged, prompted):
+        response.close()
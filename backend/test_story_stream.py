@@ -0,0 +1,70 @@
+"""
+Story Stream Tests
+The incremental title/gem parser must agree with the non-streaming extractor, however the text is chunked.
+"""
+
+import json
+
+import pytest
+
+from story_stream import TitleGemStreamParser, sse_event
+
+FALLBACK_GEM = "Kindness is a kind of courage."
+
+SHAPES = [
+    "[TITLE: The Brave Kite]\nMia flew her kite.\n[WISDOM GEM: Try again.]",
+    "Here is your story!\n\n[TITLE: The Brave Kite]\nMia flew her kite.\n[WISDOM GEM: Try again.]",
+    "Mia flew her kite all day.\n[WISDOM GEM: Try again.]",
+    "[TITLE: The Brave Kite]\nMia [flew] her kite.\n[WISDOM GEM: Try again.]\nThe End.",
+    "[TITLE: ]\nMia flew her kite.",
+    "Once upon a time Mia flew her kite.\n\nShe called it [TITLE: The Brave Kite] and smiled.\n[WISDOM GEM: Try again.]",
+]
+
+
+def _stream(text, size):
+    parser = TitleGemStreamParser("A Story", lambda: FALLBACK_GEM)
+    events = []
+    for start in range(0, len(text), size):
+        events.extend(parser.feed(text[start:start + size]))
+    events.extend(parser.finish())
+    return parser, events
+
+
+@pytest.fixture
+def extract(story_app, monkeypatch):
+    monkeypatch.setattr(story_app, "DEFAULT_STORY_TITLE", "A Story")
+    monkeypatch.setattr(story_app.WisdomGems, "get_wisdom", staticmethod(lambda theme: FALLBACK_GEM))
+    return lambda text: story_app._safe_extract_title_and_gem(text, "Adventure")
+
+
+@pytest.mark.parametrize("text", SHAPES)
+@pytest.mark.parametrize("size", [1, 3, 7, 1000])
+def test_stream_matches_non_streaming_extraction(extract, text, size):
+    parser, events = _stream(text, size)
+
+    assert (parser.title, parser.wisdom_gem, parser.story_text) == extract(text)
+    kinds = [kind for kind, _ in events]
+    assert kinds[0] == "title" and kinds[-1] == "gem" and set(kinds[1:-1]) <= {"chunk"}
+    assert "".join(value for kind, value in events if kind == "chunk").strip() == parser.story_text
+
+
+def test_body_streams_as_soon_as_the_title_closes():
+    parser = TitleGemStreamParser("A Story", lambda: FALLBACK_GEM)
+
+    assert parser.feed("[TITLE: The Br") == []
+    assert parser.feed("ave Kite]\nMia ran") == [("title", "The Brave Kite"), ("chunk", "Mia ran")]
+    assert parser.feed(" home. [WISD") == [("chunk", " home. ")]
+    assert parser.feed("OM GEM: Rest.]") == []
+    assert parser.finish() == [("gem", "Rest.")]
+
+
+def test_output_without_a_title_is_held_until_finish():
+    parser = TitleGemStreamParser("A Story", lambda: FALLBACK_GEM)
+
+    assert parser.feed("Mia ran home.") == []
+    assert parser.finish() == [("title", "A Story"), ("chunk", "Mia ran home."), ("gem", FALLBACK_GEM)]
+
+
+def test_sse_event_format():
+    assert sse_event("title", {"title": "Café"}) == 'event: title\ndata: {"title": "Café"}\n\n'
+    assert json.loads(sse_event("done", {"a": 1}).split("data: ")[1]) == {"a": 1}
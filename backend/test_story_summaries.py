@@ -0,0 +1,60 @@
+"""
+Rolling Summary Tests
+Sentence-safe folding, the model fallback, and which series share a stored summary.
+"""
+
+from story_summarizer import RollingSummarizer, clip_sentences, split_sentences
+
+CHAPTER = ("Mia found a glowing lantern by the river. It whispered the way home. "
+           "She followed it past the sleeping dragon! At dawn the lantern dimmed, and Mia smiled.")
+
+
+def test_clip_never_cuts_mid_sentence():
+    clipped = clip_sentences(CHAPTER, 90)
+
+    assert clipped == "Mia found a glowing lantern by the river. It whispered the way home."
+    assert clip_sentences(CHAPTER, 60, from_end=True) == "At dawn the lantern dimmed, and Mia smiled."
+
+
+def test_extractive_fold_stays_bounded_and_keeps_the_opening():
+    summarizer = RollingSummarizer(max_chars=200)
+    summary = ""
+    for chapter in range(1, 8):
+        summary = summarizer.fold_extractive(summary, CHAPTER, f"Chapter {chapter}")
+
+    assert len(summary) <= 200
+    assert summary.startswith("Chapter 1:")
+    assert all(sentence[-1] in ".!?…" for sentence in split_sentences(summary))
+
+
+def test_model_fold_falls_back_to_extractive_on_failure():
+    def broken(prompt):
+        raise RuntimeError("quota")
+
+    summarizer = RollingSummarizer(generate=broken, max_chars=300)
+
+    summary = summarizer.fold("", CHAPTER, "Chapter 1")
+
+    assert summary.startswith("Chapter 1: Mia found")
+    assert (summarizer.failed, summarizer.extractive_folds, summarizer.model_folds) == (1, 1, 0)
+
+
+def test_series_summaries_need_an_owner_scoped_key(story_app):
+    by_name = story_app._series_summary_key({"character": "Emma"}, "The Star Map")
+    by_series = story_app._series_summary_key({"series_id": "s-1"}, "The Star Map")
+    by_character = story_app._series_summary_key({"character_id": "c-1"}, "The Star Map")
+
+    assert by_name is None
+    assert by_series.startswith("series:") and by_character.startswith("series:")
+    assert by_character != story_app._series_summary_key({"character_id": "c-2"}, "The Star Map")
+
+
+def test_continuation_without_ids_stores_no_shared_summary(story_app, client, monkeypatch):
+    folds = []
+    monkeypatch.setattr(story_app.story_summarizer, "submit", lambda fn, *args: folds.append(args))
+    body = {"character": "Emma", "series_title": "The Star Map", "previous_story": CHAPTER, "chapter_number": 2}
+
+    client.post("/continue-story", json=body).close()
+    client.post("/continue-story", json={**body, "series_id": "family-1"}).close()
+
+    assert len(folds) == 1 and folds[0][0] == story_app._series_summary_key({"series_id": "family-1"}, "")
@@ -43,6 +43,7 @@ class _InteractiveStoryScreenState extends State<InteractiveStoryScreen> {
   bool _isLoading = true;
   bool _isLoadingChoice = false;
   String? _savedStoryId;
+  String? _sessionId;
   bool _hasRecordedProgress = false;
 
   @override
@@ -78,6 +79,7 @@ class _InteractiveStoryScreenState extends State<InteractiveStoryScreen> {
         final data = jsonDecode(response.body);
         setState(() {
           _currentSegment = StorySegment.fromJson(data);
+          _sessionId = data['session_id'];
           _storyHistory.add(_currentSegment!.text);
           _isLoading = false;
         });
@@ -96,17 +98,20 @@ class _InteractiveStoryScreenState extends State<InteractiveStoryScreen> {
     final List<String> friendNames = widget.additionalCharacters.map((c) => c.name).toList();
 
     try {
-      final Map<String, dynamic> requestBody = {
-        'character': widget.characterName,
-        'theme': widget.theme,
-        'companion': widget.companion,
-        'friends': friendNames,
-        'choice': choice.text,
-        'story_so_far': _storyHistory.join('\n\n'),
-        'choices_made': _choiceHistory,
-      };
-
-      if (widget.therapeuticCustomization != null) {
+      // With a server session only the picked option travels; the server keeps the story
+      final Map<String, dynamic> requestBody = _sessionId != null
+          ? {'session_id': _sessionId, 'choice_id': choice.id}
+          : {
+              'character': widget.characterName,
+              'theme': widget.theme,
+              'companion': widget.companion,
+              'friends': friendNames,
+              'choice': choice.text,
+              'story_so_far': _storyHistory.join('\n\n'),
+              'choices_made': _choiceHistory,
+            };
+
+      if (_sessionId == null && widget.therapeuticCustomization != null) {
         requestBody['therapeutic_prompt'] = widget.therapeuticCustomization!.toPromptAddition();
       }
 